@@ -0,0 +1,191 @@
+import re
+import numpy as np
+import pandas as pd
+
+# Reducers understood by aggregate(); "pNN" (e.g. p25, p90) selects the NN-th percentile
+BASIC_REDUCERS = ('mean', 'sum', 'count', 'std', 'min', 'max', 'median')
+_PERCENTILE_RE = re.compile(r'^p(\d{1,2}(?:\.\d+)?)$')
+
+def parse_reducers(reducers):
+    """
+    Validate a list of reducer names
+    
+    Args:
+        reducers: Iterable of reducer names, e.g. ['mean', 'std', 'p90']
+    
+    Returns:
+        list: The reducer names, with duplicates removed
+    
+    Raises:
+        ValueError: If a reducer is not supported
+    """
+    parsed = []
+    for name in reducers:
+        if name not in BASIC_REDUCERS and not _PERCENTILE_RE.match(name):
+            raise ValueError(f"Unknown reducer: {name}")
+        if name not in parsed:
+            parsed.append(name)
+    return parsed
+
+def factorize(series):
+    """
+    Encode a grouping column as integer codes
+    
+    Args:
+        series: The column to group by
+    
+    Returns:
+        tuple: (codes, uniques) with codes indexing into the sorted uniques;
+            missing values get code -1
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Categorical columns are already encoded; drop unobserved categories
+        used = np.unique(series.cat.codes.to_numpy())
+        used = used[used >= 0]
+        remap = np.full(len(series.cat.categories) + 1, -1, dtype=np.int64)
+        remap[used] = np.arange(len(used))
+        codes = remap[series.cat.codes.to_numpy()]
+        return codes, series.cat.categories.to_numpy()[used]
+    codes, uniques = pd.factorize(series, sort=True)
+    return codes, np.asarray(uniques)
+
+def _group_reduce(codes, values, n_groups, reducers):
+    """Apply reducers to one metric column grouped by codes, skipping NaN like pandas"""
+    valid = ~np.isnan(values) & (codes >= 0)
+    codes = codes[valid]
+    values = values[valid]
+    
+    counts = np.bincount(codes, minlength=n_groups).astype(np.float64)
+    sums = np.bincount(codes, weights=values, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    
+    out = {}
+    for name in reducers:
+        if name == 'mean':
+            out[name] = means
+        elif name == 'sum':
+            out[name] = sums
+        elif name == 'count':
+            out[name] = counts
+        elif name == 'std':
+            # Sample standard deviation (ddof=1), computed in two passes for stability
+            squares = np.bincount(codes, weights=(values - means[codes]) ** 2, minlength=n_groups)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out[name] = np.sqrt(squares / (counts - 1))
+            out[name][counts < 2] = np.nan
+    
+    order_stats = [name for name in reducers if name in ('min', 'max', 'median') or _PERCENTILE_RE.match(name)]
+    if order_stats:
+        # Sort by (group, value) once; each group's values are then a contiguous sorted run
+        order = np.lexsort((values, codes))
+        sorted_values = values[order]
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+        empty = counts == 0
+        last = np.maximum(counts - 1, 0)
+        
+        for name in order_stats:
+            if name == 'min':
+                q = 0.0
+            elif name == 'max':
+                q = 1.0
+            elif name == 'median':
+                q = 0.5
+            else:
+                q = float(_PERCENTILE_RE.match(name).group(1)) / 100
+            # Linear interpolation between order statistics, as in pandas' quantile
+            position = q * last
+            lower = np.floor(position).astype(np.int64)
+            upper = np.ceil(position).astype(np.int64)
+            if len(sorted_values):
+                lo = sorted_values[np.minimum(starts + lower, len(sorted_values) - 1)]
+                hi = sorted_values[np.minimum(starts + upper, len(sorted_values) - 1)]
+                result = lo + (hi - lo) * (position - lower)
+            else:
+                result = np.full(n_groups, np.nan)
+            result[empty] = np.nan
+            out[name] = result
+    return out
+
+def aggregate(frame, variables, metrics, reducers=('mean',), factorized=None, mask=None):
+    """
+    Aggregate several metrics by several variables, one grouped pass per variable
+    
+    Each grouping column is factorized once; all metrics and reducers for that
+    variable are then computed with NumPy bincount/sort operations on the codes.
+    
+    Args:
+        frame: DataFrame holding the variables and metric columns
+        variables: List of column names to group by
+        metrics: List of metric column names, or dict of output name -> column
+            name or array aligned with frame (for derived metrics)
+        reducers: Reducer names, see parse_reducers
+        factorized: Optional dict of variable -> (codes, uniques) precomputed for frame
+        mask: Optional boolean array selecting the rows to aggregate
+    
+    Returns:
+        dict: variable -> {"categories": uniques, "metrics": {metric -> {reducer -> ndarray}}}
+    """
+    reducers = parse_reducers(reducers)
+    if not isinstance(metrics, dict):
+        metrics = {metric: metric for metric in metrics}
+    
+    columns = {}
+    for name, column in metrics.items():
+        values = frame[column] if isinstance(column, str) else column
+        values = np.asarray(values, dtype=np.float64)
+        columns[name] = values if mask is None else values[mask]
+    
+    result = {}
+    for variable in variables:
+        if factorized and variable in factorized:
+            codes, uniques = factorized[variable]
+        else:
+            codes, uniques = factorize(frame[variable])
+        if mask is not None:
+            codes = codes[mask]
+        
+        # Only keep groups that have rows after masking, like groupby(observed=True)
+        present = np.bincount(codes[codes >= 0], minlength=len(uniques)) > 0
+        result[variable] = {
+            "categories": uniques[present],
+            "metrics": {
+                name: {r: v[present] for r, v in _group_reduce(codes, values, len(uniques), reducers).items()}
+                for name, values in columns.items()
+            },
+        }
+    return result
+
+def _category_labels(categories):
+    # Match the labels of the previous iterrows serialization, where integer
+    # categories were upcast to float alongside the mean (e.g. "4.0")
+    if categories.dtype.kind in 'iu':
+        categories = categories.astype(np.float64)
+    return [str(c) for c in categories.tolist()]
+
+def to_category_records(aggregated, reducers=('mean',)):
+    """
+    Serialize aggregates into the {"category", "value"} records used by the analysis page
+    
+    "value" holds the mean (NaN -> 0); every other reducer is added as its own key.
+    
+    Args:
+        aggregated: Result of aggregate
+        reducers: Reducers to include in the records
+    
+    Returns:
+        dict: variable -> metric -> list of records
+    """
+    result = {}
+    for variable, grouped in aggregated.items():
+        labels = _category_labels(grouped["categories"])
+        result[variable] = {}
+        for metric, reduced in grouped["metrics"].items():
+            columns = {"value": reduced["mean"]} if "mean" in reduced else {}
+            columns.update({name: values for name, values in reduced.items() if name != "mean"})
+            serialized = {key: np.where(np.isnan(values), 0, values).tolist() for key, values in columns.items()}
+            result[variable][metric] = [
+                {"category": label, **{key: serialized[key][i] for key in serialized}}
+                for i, label in enumerate(labels)
+            ]
+    return result
@@ -1,13 +1,30 @@
-import os
 import pandas as pd
-import numpy as np
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
+
+from api.metrics_store import DATA_DIR, VARIABLES, METRICS
+from api.metrics_registry import metrics_registry, CUBE_DIMENSIONS
+from api.aggregation import aggregate, parse_reducers, to_category_records
+from api.data_stream import DATA_FORMATS, decode_cursor, encode_cursor, stream_rows
+from utils.instrumentation import stage
+from utils.http_cache import conditional, http_date, validator_hash
 
 # Create the analysis blueprint
 analysis_bp = Blueprint('analysis', __name__, url_prefix='/api/analysis')
 
-# Path to the metrics CSV file
-METRICS_CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'metrics_87809342.csv')
+def metrics_validators():
+    """
+    Derive the validators of a response from the metrics file versions
+    
+    The ETag covers the path, the query parameters and the (path, mtime, size)
+    of every run file, so any edited, added or removed run changes it;
+    Last-Modified is the newest run file.
+    """
+    version = metrics_registry.version()
+    if not version:
+        return None
+    last_modified = max(mtime_ns for _, (_, mtime_ns, _) in version) / 1e9
+    query = sorted(request.args.items(multi=True))
+    return validator_hash(request.path, query, version), http_date(last_modified)
 
 @analysis_bp.route('/metrics', methods=['GET'])
 def get_metrics():
@@ -50,158 +67,255 @@ def get_variables():
     return jsonify(variables)
 
 @analysis_bp.route('/data', methods=['GET'])
+@conditional(metrics_validators, cache=False)
 def get_analysis_data():
-    """Return the raw CSV data"""
+    """
+    Stream the raw metrics rows.
+    Query parameters:
+    - format: 'records' (JSON array of row objects, default), 'ndjson' or 'columnar';
+      the latter two dictionary-encode the categorical columns
+    - columns: Optional comma-separated columns to return (default: the columns of the
+      metrics file; run_id is only sent when requested here)
+    - limit: Optional page size; the response then carries a cursor for the next page
+      (in the X-Next-Cursor header, and in the header object of ndjson/columnar)
+    - cursor: Cursor returned by the previous page
+    - run: Optional comma-separated run ids (default: every run)
+    """
     try:
-        # Check if the CSV file exists
-        if not os.path.exists(METRICS_CSV_PATH):
-            return jsonify({"error": f"CSV file not found at {METRICS_CSV_PATH}"}), 404
+        # Check if any metrics file exists
+        if not metrics_registry.exists():
+            return _no_metrics_response()
+        
+        data_format = request.args.get('format', 'records')
+        if data_format not in DATA_FORMATS:
+            return jsonify({"error": f"Unknown format: {data_format}"}), 400
         
-        # Read the CSV file
-        df = pd.read_csv(METRICS_CSV_PATH)
+        # Get the metrics rows of the selected runs and project them to the requested columns
+        runs = _requested_runs()
+        df = metrics_registry.frame(runs)
+        version = metrics_registry.version(runs)
+        columns = _split_arg('columns')
+        unknown = [column for column in columns if column not in df.columns]
+        if unknown:
+            return jsonify({"error": f"Unknown columns: {', '.join(unknown)}"}), 400
+        if columns:
+            df = df[columns]
+        elif 'run_id' in df.columns:
+            # The registry adds run_id to every row; keep the default body to the file's own columns
+            df = df.drop(columns='run_id')
         
-        # Convert DataFrame to a list of dictionaries
-        data = df.to_dict(orient='records')
+        # Resolve the page to send
+        start = decode_cursor(request.args['cursor'], version) if request.args.get('cursor') else 0
+        limit = request.args.get('limit', type=int)
+        stop = len(df) if limit is None else min(len(df), start + max(limit, 0))
+        next_cursor = encode_cursor(stop, version) if stop < len(df) else None
         
-        return jsonify(data)
+        mimetype = 'application/x-ndjson' if data_format == 'ndjson' else 'application/json'
+        response = Response(stream_rows(df, start, stop, data_format, next_cursor), mimetype=mimetype)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @analysis_bp.route('/summary', methods=['GET'])
+@conditional(metrics_validators)
 def get_summary_data():
     """
     Return summarized data grouped by a specific variable and metric.
     Query parameters:
     - variable: The variable to group by (e.g., 'data_trend')
     - metric: The metric to calculate averages for (e.g., 'CLIP')
+    - run: Optional comma-separated run ids (default: every run)
     """
     try:
         # Get query parameters
         variable = request.args.get('variable', 'data_trend')
         metric = request.args.get('metric', 'CLIP')
         
-        # Check if the CSV file exists
-        if not os.path.exists(METRICS_CSV_PATH):
-            return jsonify({"error": f"CSV file not found at {METRICS_CSV_PATH}"}), 404
+        # Check if any metrics file exists
+        if not metrics_registry.exists():
+            return _no_metrics_response()
         
-        # Read the CSV file
-        df = pd.read_csv(METRICS_CSV_PATH)
+        # Get the metrics rows of the selected runs
+        df = metrics_registry.frame(_requested_runs())
         
         # Group by the specified variable and calculate the mean for the specified metric
-        # Handle 'inf' values by replacing them with NaN
+        # Handle non-numeric values by replacing them with NaN
         df[metric] = pd.to_numeric(df[metric], errors='coerce')
         
         # Group by the variable and calculate mean
-        grouped = df.groupby(variable)[metric].mean().reset_index()
+        with stage('group_by'):
+            grouped = df.groupby(variable, observed=True)[metric].mean().reset_index()
         
         # Convert to a list of dictionaries with 'category' and 'value' keys for D3.js
-        result = [{"category": row[variable], "value": row[metric]} for _, row in grouped.iterrows()]
-        
-        return jsonify(result)
+        with stage('serialize'):
+            result = [{"category": row[variable], "value": row[metric]} for _, row in grouped.iterrows()]
+            return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         import traceback
         error_traceback = traceback.format_exc()
         return jsonify({"error": str(e), "traceback": error_traceback}), 500
 
 @analysis_bp.route('/aggregated', methods=['GET'])
+@conditional(metrics_validators)
 def get_aggregated_data():
     """
     Return all metrics aggregated by all variables.
     This provides a complete dataset for the analysis page.
+    Query parameters:
+    - reducers: Optional comma-separated extra reducers (count, sum, std, min, max, median, p25, p90, ...)
+    - run: Optional comma-separated run ids (default: every run)
+    Means are read from the merged per-run aggregate cube; extra reducers scan the rows.
     """
     try:
-        # Check if the CSV file exists
-        if not os.path.exists(METRICS_CSV_PATH):
-            return jsonify({"error": f"CSV file not found at {METRICS_CSV_PATH}"}), 404
-        
-        # Read the CSV file
-        df = pd.read_csv(METRICS_CSV_PATH)
+        # Check if any metrics file exists
+        if not metrics_registry.exists():
+            return _no_metrics_response()
         
-        # Define variables and metrics
-        variables = ['data_trend', 'data_count', 'asset', 'canny', 'asset_size', 'cond_scale']
-        metrics = ['CLIP', 'Lie_Factor', 'Match_count', 'Rank_Sim']
+        reducers = _requested_reducers()
+        runs = _requested_runs()
         
-        # Replace infinity values with NaN
-        df = df.replace([np.inf, -np.inf], np.nan)
-        
-        # Initialize the result dictionary
-        result = {}
-        
-        # Process each variable
-        for variable in variables:
-            result[variable] = {}
+        if reducers == ['mean']:
+            filters = {'run_id': runs} if runs else {}
+            cube = metrics_registry.cube()
+            with stage('group_by'):
+                aggregated = cube.aggregate(VARIABLES, METRICS, filters)
+        else:
+            # Get the metrics rows, with infinity values replaced by NaN
+            df, factorized = metrics_registry.snapshot(runs, clean=True)
             
-            # Process each metric for this variable
-            for metric in metrics:
-                # Group by the variable and calculate mean for the metric
-                grouped = df.groupby(variable)[metric].mean().reset_index()
-                
-                # Convert to a list of dictionaries with 'category' and 'value' keys
-                metric_data = [
-                    {"category": str(row[variable]), "value": float(row[metric]) if not pd.isna(row[metric]) else 0} 
-                    for _, row in grouped.iterrows()
-                ]
-                
-                result[variable][metric] = metric_data
-        
-        return jsonify(result)
+            # Aggregate every metric by every variable in one grouped pass per variable
+            with stage('group_by'):
+                aggregated = aggregate(df, VARIABLES, METRICS, reducers, factorized=factorized)
+        with stage('serialize'):
+            return jsonify(to_category_records(aggregated, reducers))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         import traceback
         error_traceback = traceback.format_exc()
         return jsonify({"error": str(e), "traceback": error_traceback}), 500
 
 @analysis_bp.route('/aggregated-filtered', methods=['GET'])
+@conditional(metrics_validators)
 def get_aggregated_filtered_data():
     """
     Return all metrics aggregated by all variables, but only after filtering rows
     that have the same Match_count and data_count values.
+    Match_count is reported as the ratio of Match_count to data_count, under the
+    key '<variable>_Match_count'.
+    Query parameters:
+    - reducers: Optional comma-separated extra reducers, as for /aggregated
+    - run: Optional comma-separated run ids (default: every run)
     """
     try:
-        # Check if the CSV file exists
-        if not os.path.exists(METRICS_CSV_PATH):
-            return jsonify({"error": f"CSV file not found at {METRICS_CSV_PATH}"}), 404
-        
-        # Read the CSV file
-        df = pd.read_csv(METRICS_CSV_PATH)
+        # Check if any metrics file exists
+        if not metrics_registry.exists():
+            return _no_metrics_response()
         
-        # Filter rows where Match_count equals data_count
-        filtered_df = df[df['Match_count'] == df['data_count']]
+        reducers = _requested_reducers()
+        runs = _requested_runs()
         
-        # Define variables and metrics
-        variables = ['data_trend', 'data_count', 'asset', 'canny', 'asset_size', 'cond_scale']
-        metrics = ['CLIP', 'Lie_Factor', 'Match_count', 'Rank_Sim']
-        
-        # Replace infinity values with NaN
-        filtered_df = filtered_df.replace([np.inf, -np.inf], np.nan)
-        
-        # Initialize the result dictionary
-        result = {}
-        
-        # Process each variable
-        for variable in variables:
-            result[variable] = {}
+        if reducers == ['mean']:
+            # Keep rows where Match_count equals data_count, reporting Match_count as the ratio
+            filters = {'exact_match': [True], **({'run_id': runs} if runs else {})}
+            metrics = {metric: metric for metric in METRICS}
+            metrics['Match_count'] = 'Match_ratio'
+            cube = metrics_registry.cube()
+            with stage('group_by'):
+                aggregated = cube.aggregate(VARIABLES, metrics, filters)
+        else:
+            # Get the metrics rows, with infinity values replaced by NaN
+            df, factorized = metrics_registry.snapshot(runs, clean=True)
+            
+            # Filter rows where Match_count equals data_count
+            mask = (df['Match_count'] == df['data_count']).to_numpy()
             
-            # Process each metric for this variable
-            for metric in metrics:
-                # if metric is Match_count, calculate the ratio of Match_count to data_count
-                if metric == 'Match_count':
-                    # create a new column called count_Match_count
-                    filtered_df[variable+'_'+metric] = filtered_df['Match_count'] / filtered_df['data_count']
-                    metric = variable+'_'+metric
-                    print(metric)
+            # Replace Match_count by the ratio of Match_count to data_count
+            metrics = {metric: metric for metric in METRICS}
+            metrics['Match_count'] = df['Match_count'].to_numpy() / df['data_count'].to_numpy()
+            
+            with stage('group_by'):
+                aggregated = aggregate(df, VARIABLES, metrics, reducers, factorized=factorized, mask=mask)
+        with stage('serialize'):
+            result = to_category_records(aggregated, reducers)
+            for variable in VARIABLES:
+                result[variable][variable + '_Match_count'] = result[variable].pop('Match_count')
+            return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        import traceback
+        error_traceback = traceback.format_exc()
+        return jsonify({"error": str(e), "traceback": error_traceback}), 500
 
-                # Group by the variable and calculate mean for the metric
-                grouped = filtered_df.groupby(variable)[metric].mean().reset_index()
-                
-                # Convert to a list of dictionaries with 'category' and 'value' keys
-                metric_data = [
-                    {"category": str(row[variable]), "value": float(row[metric]) if not pd.isna(row[metric]) else 0} 
-                    for _, row in grouped.iterrows()
-                ]
-                
-                result[variable][metric] = metric_data
-        return jsonify(result)
+@analysis_bp.route('/query', methods=['GET'])
+@conditional(metrics_validators)
+def query_aggregates():
+    """
+    Answer an arbitrary filter/group-by query from the precomputed aggregate cube.
+    Query parameters:
+    - group_by: One or two comma-separated variables to group by (optional)
+    - metrics: Comma-separated metrics to report (default: all)
+    - <variable>: Comma-separated values to keep, for any variable (e.g. asset=bottle,cactus);
+      'exact_match=true' keeps the rows where Match_count equals data_count
+    - run: Comma-separated run ids to keep; group_by=run_id compares runs
+    """
+    try:
+        if not metrics_registry.exists():
+            return _no_metrics_response()
+        
+        group_by = _split_arg('group_by')
+        if len(group_by) > 2:
+            return jsonify({"error": "At most two group_by variables are supported"}), 400
+        metrics = _split_arg('metrics') or None
+        filters = {d: _split_arg(d) for d in CUBE_DIMENSIONS if d in request.args}
+        runs = _requested_runs()
+        if runs:
+            filters['run_id'] = runs
+        
+        # Per-run cubes are built once per file version and merged incrementally
+        cube = metrics_registry.cube()
+        with stage('group_by'):
+            rows = cube.query(filters, group_by, metrics)
+        with stage('serialize'):
+            return jsonify({"group_by": group_by, "filters": filters, "rows": rows})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         import traceback
         error_traceback = traceback.format_exc()
-        return jsonify({"error": str(e), "traceback": error_traceback}), 500 
\ No newline at end of file
+        return jsonify({"error": str(e), "traceback": error_traceback}), 500
+
+def _no_metrics_response():
+    return jsonify({"error": f"No metrics files found in {DATA_DIR}"}), 404
+
+def _requested_runs():
+    """
+    Return the run ids selected via ?run=, or None for every run
+    
+    Raises:
+        ValueError: If a requested run does not exist
+    """
+    runs = _split_arg('run')
+    if not runs:
+        return None
+    known = metrics_registry.runs()
+    unknown = [run for run in runs if run not in known]
+    if unknown:
+        raise ValueError(f"Unknown run: {', '.join(unknown)}")
+    return runs
+
+def _split_arg(name):
+    """Return a comma-separated query parameter as a list of non-empty strings"""
+    return [value.strip() for value in request.args.get(name, '').split(',') if value.strip()]
+
+def _requested_reducers():
+    """Return the reducers requested via ?reducers=, always including the mean"""
+    extra = [r.strip() for r in request.args.get('reducers', '').split(',') if r.strip()]
+    return parse_reducers(['mean'] + extra)
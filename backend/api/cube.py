@@ -0,0 +1,207 @@
+import numpy as np
+
+from api.aggregation import factorize
+
+class AggregateCube:
+    """
+    Dense sum/count cube of the metrics over every categorical dimension
+    
+    Each cell holds, per metric, the sum and the count of non-null values of the
+    rows sharing one combination of dimension values. Any filter/group-by query
+    over those dimensions is answered by slicing the cube and summing out the
+    remaining axes, without touching the raw rows.
+    """
+
+    def __init__(self, dimensions, categories, sums, counts, rows):
+        self.dimensions = dimensions    # list of dimension names, in axis order
+        self.categories = categories    # dimension -> ndarray of category values
+        self.sums = sums                # metric -> ndarray shaped like the cube
+        self.counts = counts            # metric -> ndarray of non-null counts
+        self.rows = rows                # ndarray of row counts per cell
+
+    @classmethod
+    def build(cls, frame, dimensions, metrics, factorized=None):
+        """
+        Build the cube in one bincount pass per metric
+        
+        Args:
+            frame: DataFrame with the dimension and metric columns
+            dimensions: Columns to use as cube axes
+            metrics: List of metric column names, or dict of name -> column name or array
+            factorized: Optional dict of dimension -> (codes, uniques) precomputed for frame
+        
+        Returns:
+            AggregateCube
+        """
+        if not isinstance(metrics, dict):
+            metrics = {metric: metric for metric in metrics}
+        
+        codes, categories = [], {}
+        for dimension in dimensions:
+            if factorized and dimension in factorized:
+                dim_codes, uniques = factorized[dimension]
+            else:
+                dim_codes, uniques = factorize(frame[dimension])
+            codes.append(dim_codes)
+            categories[dimension] = uniques
+        
+        shape = tuple(len(categories[d]) for d in dimensions)
+        complete = np.all([c >= 0 for c in codes], axis=0) if codes else np.ones(len(frame), dtype=bool)
+        cells = np.ravel_multi_index([c[complete] for c in codes], shape) if codes else np.zeros(complete.sum(), dtype=np.int64)
+        size = int(np.prod(shape))
+        
+        sums, counts = {}, {}
+        for name, column in metrics.items():
+            values = np.asarray(frame[column] if isinstance(column, str) else column, dtype=np.float64)[complete]
+            valid = ~np.isnan(values)
+            sums[name] = np.bincount(cells[valid], weights=values[valid], minlength=size).reshape(shape)
+            counts[name] = np.bincount(cells[valid], minlength=size).reshape(shape)
+        rows = np.bincount(cells, minlength=size).reshape(shape)
+        return cls(list(dimensions), categories, sums, counts, rows)
+
+    def merge(self, other):
+        """
+        Combine two cubes built over the same dimensions and metrics
+        
+        Categories are unioned per dimension and both cubes' sum/count states are
+        added into the union, so merging costs the size of the cubes, not the
+        number of underlying rows.
+        
+        Args:
+            other: AggregateCube with the same dimensions and metrics
+        
+        Returns:
+            AggregateCube: The merged cube
+        """
+        if other.dimensions != self.dimensions or set(other.sums) != set(self.sums):
+            raise ValueError("Cannot merge cubes with different dimensions or metrics")
+        
+        categories = {d: np.union1d(self.categories[d], other.categories[d]) for d in self.dimensions}
+        shape = tuple(len(categories[d]) for d in self.dimensions)
+        
+        def scatter(cube):
+            # Index of each of cube's categories within the union, per axis
+            return np.ix_(*[np.searchsorted(categories[d], cube.categories[d]) for d in self.dimensions])
+        
+        def add(left, right):
+            out = np.zeros(shape, dtype=left.dtype)
+            out[scatter(self)] += left
+            out[scatter(other)] += right
+            return out
+        
+        return AggregateCube(
+            self.dimensions,
+            categories,
+            {m: add(self.sums[m], other.sums[m]) for m in self.sums},
+            {m: add(self.counts[m], other.counts[m]) for m in self.counts},
+            add(self.rows, other.rows),
+        )
+
+    def aggregate(self, variables, metrics, filters=None):
+        """
+        Return per-variable means in the layout of api.aggregation.aggregate
+        
+        Args:
+            variables: Dimensions to report, each grouped on its own
+            metrics: List of metric names, or dict of output name -> cube metric
+            filters: Optional dict of dimension -> list of allowed values
+        
+        Returns:
+            dict: variable -> {"categories": ndarray, "metrics": {name -> {"mean": ndarray}}}
+        """
+        if not isinstance(metrics, dict):
+            metrics = {metric: metric for metric in metrics}
+        result = {}
+        for variable in variables:
+            records = self.query(filters, [variable], list(dict.fromkeys(metrics.values())))
+            categories = np.array([r[variable] for r in records], dtype=self.categories[variable].dtype)
+            result[variable] = {
+                "categories": categories,
+                "metrics": {
+                    name: {"mean": np.array([np.nan if r[m]["mean"] is None else r[m]["mean"] for r in records])}
+                    for name, m in metrics.items()
+                },
+            }
+        return result
+
+    def _selector(self, dimension, values):
+        """Return the indices of the requested values along one axis, matched by label"""
+        categories = self.categories[dimension]
+        if categories.dtype.kind == 'b':
+            wanted = {str(value).lower() in ('true', '1') for value in values}
+            return np.flatnonzero([bool(c) in wanted for c in categories])
+        if categories.dtype.kind in 'iuf':
+            wanted = set()
+            for value in values:
+                try:
+                    wanted.add(float(value))
+                except (TypeError, ValueError):
+                    raise ValueError(f"Invalid value for {dimension}: {value}")
+            return np.flatnonzero([float(c) in wanted for c in categories])
+        wanted = {str(value) for value in values}
+        return np.flatnonzero([str(c) in wanted for c in categories])
+
+    def query(self, filters=None, group_by=(), metrics=None):
+        """
+        Roll the cube up to the requested group-by dimensions
+        
+        Args:
+            filters: Optional dict of dimension -> list of allowed values
+            group_by: Up to two dimensions to group by
+            metrics: Metrics to report (default: all)
+        
+        Returns:
+            list: One record per non-empty group, holding the group values,
+                the row count and {"mean", "count"} per metric
+        
+        Raises:
+            ValueError: For unknown dimensions or metrics
+        """
+        filters = filters or {}
+        metrics = list(self.sums) if metrics is None else list(metrics)
+        for dimension in list(filters) + list(group_by):
+            if dimension not in self.categories:
+                raise ValueError(f"Unknown variable: {dimension}")
+        for metric in metrics:
+            if metric not in self.sums:
+                raise ValueError(f"Unknown metric: {metric}")
+        if len(set(group_by)) != len(group_by):
+            raise ValueError("Group-by variables must be distinct")
+        
+        # Slice every filtered axis down to the selected categories
+        index = tuple(
+            self._selector(d, filters[d]) if d in filters else slice(None)
+            for d in self.dimensions
+        )
+        categories = {
+            d: self.categories[d][index[i]] if d in filters else self.categories[d]
+            for i, d in enumerate(self.dimensions)
+        }
+        
+        def rollup(array):
+            sliced = array[np.ix_(*[
+                idx if isinstance(idx, np.ndarray) else np.arange(array.shape[i])
+                for i, idx in enumerate(index)
+            ])]
+            # Sum out every axis that is not grouped, then order axes as group_by
+            summed = sliced.sum(axis=tuple(i for i, d in enumerate(self.dimensions) if d not in group_by))
+            kept = [d for d in self.dimensions if d in group_by]
+            return np.transpose(summed, [kept.index(d) for d in group_by]) if group_by else summed
+        
+        rows = rollup(self.rows)
+        sums = {m: rollup(self.sums[m]) for m in metrics}
+        counts = {m: rollup(self.counts[m]) for m in metrics}
+        
+        records = []
+        for position in zip(*np.nonzero(rows)) if group_by else ([()] if rows > 0 else []):
+            record = {d: _to_python(categories[d][position[i]]) for i, d in enumerate(group_by)}
+            record["rows"] = int(rows[position])
+            for m in metrics:
+                count = int(counts[m][position])
+                record[m] = {"mean": float(sums[m][position]) / count if count else None, "count": count}
+            records.append(record)
+        return records
+
+def _to_python(value):
+    # Convert NumPy scalars to native Python values for JSON serialization
+    return value.item() if isinstance(value, np.generic) else value
@@ -0,0 +1,122 @@
+import json
+import base64
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Number of rows serialized at a time; bounds the memory held by a streaming response
+STREAM_CHUNK_ROWS = 1000
+
+DATA_FORMATS = ('records', 'ndjson', 'columnar')
+
+def _version_tag(version):
+    # A short hash, so cursors do not reveal the server paths in the version
+    return hashlib.sha1(repr(version).encode('utf-8')).hexdigest()[:16]
+
+def encode_cursor(offset, version):
+    """Encode a row offset and a hash of the metrics file version as an opaque cursor"""
+    raw = json.dumps([offset, _version_tag(version)]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor, version):
+    """
+    Decode a cursor produced by encode_cursor
+    
+    Args:
+        cursor: The cursor string from the client
+        version: Version of the currently loaded metrics file
+    
+    Returns:
+        int: The row offset to resume from
+    
+    Raises:
+        ValueError: If the cursor is malformed or was issued for another version of the file
+    """
+    try:
+        offset, tag = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0 or not isinstance(tag, str):
+            raise ValueError
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if tag != _version_tag(version):
+        raise ValueError("The metrics file changed since this cursor was issued; restart pagination")
+    return offset
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'))
+
+def _column_values(series):
+    """Return a chunk of a column as JSON-ready values, with non-finite numbers as null"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Dictionary-encoded: emit the category codes (-1 for missing)
+        return series.cat.codes.tolist()
+    values = series.to_numpy()
+    if values.dtype.kind == 'f':
+        values = values.astype(object)
+        values[~np.isfinite(series.to_numpy())] = None
+    return values.tolist()
+
+def dictionaries(frame):
+    """Return the category values of every dictionary-encoded column of frame"""
+    return {
+        column: frame[column].cat.categories.tolist()
+        for column in frame.columns
+        if isinstance(frame[column].dtype, pd.CategoricalDtype)
+    }
+
+def stream_rows(frame, start, stop, data_format, next_cursor=None):
+    """
+    Serialize rows [start, stop) of frame chunk by chunk
+    
+    Formats:
+    - records: JSON array of row objects, as the unpaginated endpoint returned
+      (non-finite numbers are written as Infinity/NaN, like jsonify)
+    - ndjson: a header line with the columns, dictionaries and next_cursor, then
+      one JSON array per row; categorical columns are sent as dictionary codes
+    - columnar: one JSON object with a code/value array per column and the
+      dictionaries of the categorical columns
+    
+    Args:
+        frame: DataFrame to serialize (already projected to the requested columns)
+        start: First row to send
+        stop: Row after the last one to send
+        data_format: One of DATA_FORMATS
+        next_cursor: Cursor of the following page, or None on the last page
+    
+    Yields:
+        str: Pieces of the response body
+    """
+    chunks = range(start, stop, STREAM_CHUNK_ROWS)
+    
+    if data_format == 'records':
+        yield '['
+        for i, chunk_start in enumerate(chunks):
+            chunk = frame.iloc[chunk_start:min(chunk_start + STREAM_CHUNK_ROWS, stop)]
+            body = json.dumps(chunk.to_dict(orient='records'), sort_keys=True, separators=(',', ':'))[1:-1]
+            if body:
+                yield (',' if i else '') + body
+        yield ']'
+        return
+    
+    columns = list(frame.columns)
+    header = {"columns": columns, "dictionaries": dictionaries(frame), "rows": stop - start, "next_cursor": next_cursor}
+    
+    if data_format == 'ndjson':
+        yield _dumps(header) + '\n'
+        for chunk_start in chunks:
+            chunk = frame.iloc[chunk_start:min(chunk_start + STREAM_CHUNK_ROWS, stop)]
+            values = [_column_values(chunk[column]) for column in columns]
+            yield ''.join(_dumps(list(row)) + '\n' for row in zip(*values))
+        return
+    
+    # Columnar: stream each column's array chunk by chunk
+    yield _dumps(header)[:-1] + ',"data":{'
+    for c, column in enumerate(columns):
+        yield (',' if c else '') + _dumps(column) + ':['
+        for i, chunk_start in enumerate(chunks):
+            chunk = frame[column].iloc[chunk_start:min(chunk_start + STREAM_CHUNK_ROWS, stop)]
+            body = _dumps(_column_values(chunk))[1:-1]
+            if body:
+                yield (',' if i else '') + body
+        yield ']'
+    yield '}}'
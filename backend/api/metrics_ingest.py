@@ -0,0 +1,113 @@
+"""
+Convert metrics CSVs into a typed columnar Feather file
+
+Each evaluation run writes a metrics_<run id>.csv. This command parses them
+with explicit column types, tags every row with its run id, stores dimensions
+as categoricals (prompts are dictionary-encoded the same way) and writes an
+uncompressed metrics_<run id>.feather next to each CSV, which the metrics
+registry memory-maps on load in place of the CSV. With --output, the runs are
+instead combined into one Feather file, for use outside the server: it must
+not be written into the data directory, where the registry would load it as
+another run and count every row twice.
+
+Usage (from the backend directory):
+    python -m api.metrics_ingest [CSV ...] [--output PATH]
+"""
+import os
+import sys
+import glob
+import tempfile
+import argparse
+import pandas as pd
+
+from api.metrics_store import COLUMN_DTYPES, DATA_DIR, combine_runs, run_id_from_path
+
+def read_metrics_csv(path):
+    """
+    Parse one metrics CSV with explicit column types
+    
+    Args:
+        path: Path of the CSV file
+    
+    Returns:
+        DataFrame: Typed metrics rows with a categorical run_id column
+    """
+    frame = pd.read_csv(path, dtype=COLUMN_DTYPES)
+    frame.insert(0, 'run_id', pd.Categorical([run_id_from_path(path)] * len(frame)))
+    return frame
+
+def write_feather(frame, output_path):
+    """
+    Write a metrics table as an uncompressed Feather file
+    
+    The file is written to a uniquely named temporary path and swapped in with
+    os.replace, so the metrics registry never loads a partially written file
+    and concurrent writers of the same output never share a temporary file.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f'.{os.path.basename(output_path)}.', suffix='.tmp', dir=os.path.dirname(output_path) or '.'
+    )
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            # Uncompressed so the file can be memory-mapped without a decode step
+            frame.to_feather(f, compression='uncompressed')
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def _is_inside(path, directory):
+    path, directory = os.path.realpath(path), os.path.realpath(directory)
+    return os.path.commonpath([path, directory]) == directory
+
+def ingest(csv_paths, output_path=None):
+    """
+    Convert metrics CSVs into Feather files
+    
+    Args:
+        csv_paths: Paths of the metrics CSVs to convert
+        output_path: Optional path of a single Feather file combining all runs;
+            by default each CSV gets a .feather file next to it
+    
+    Returns:
+        list: Paths of the written files
+    
+    Raises:
+        ValueError: If output_path is inside the data directory
+    """
+    if output_path and _is_inside(output_path, DATA_DIR):
+        raise ValueError(
+            f"Combined output {output_path} is inside {DATA_DIR}, where it would be loaded as another run; "
+            "write it elsewhere or ingest each run without --output"
+        )
+    frames = [read_metrics_csv(path) for path in csv_paths]
+    if output_path:
+        combined = combine_runs(frames)
+        write_feather(combined, output_path)
+        print(f"Wrote {len(combined)} rows from {len(csv_paths)} run(s) to {output_path}")
+        return [output_path]
+    
+    written = []
+    for path, frame in zip(csv_paths, frames):
+        feather_path = os.path.splitext(path)[0] + '.feather'
+        write_feather(frame, feather_path)
+        print(f"Wrote {len(frame)} rows of run {frame['run_id'].iloc[0]} to {feather_path}")
+        written.append(feather_path)
+    return written
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert metrics CSVs into typed Feather files")
+    parser.add_argument('csv', nargs='*', help="Metrics CSVs to ingest (default: every metrics_*.csv in the data directory)")
+    parser.add_argument('--output', default=None, help="Combine all runs into this Feather file instead")
+    args = parser.parse_args()
+    
+    paths = args.csv or sorted(glob.glob(os.path.join(DATA_DIR, 'metrics_*.csv')))
+    if not paths:
+        print("No metrics CSV files found")
+        sys.exit(1)
+    try:
+        ingest(paths, args.output)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
@@ -0,0 +1,174 @@
+import os
+import threading
+from collections import OrderedDict
+
+from api.aggregation import factorize
+from api.cube import AggregateCube
+from api.metrics_store import (
+    DATA_DIR, METRICS, RUN_FILE_RE, VARIABLES, MetricsStore, combine_runs, feather
+)
+from utils.instrumentation import count_cache, stage
+
+# Dimensions of the aggregate cube: the run, every variable, and whether Match_count equals data_count
+CUBE_DIMENSIONS = ['run_id'] + VARIABLES + ['exact_match']
+CUBE_METRICS = METRICS + ['Match_ratio']
+# Combined tables of run subsets kept in memory; each holds a copy of the selected runs' rows
+COMBINED_MEMO_SIZE = int(os.environ.get('METRICS_COMBINED_MEMO_SIZE', 2))
+
+def build_run_cube(df, factorized):
+    """Build the aggregate cube of one run from its cleaned metrics table"""
+    df['exact_match'] = df['Match_count'] == df['data_count']
+    df['Match_ratio'] = df['Match_count'] / df['data_count']
+    with stage('cube_build'):
+        return AggregateCube.build(df, CUBE_DIMENSIONS, CUBE_METRICS, factorized=factorized)
+
+class MetricsRegistry:
+    """
+    All evaluation runs found in the data directory
+    
+    Every metrics_<run id>.csv (or its ingested .feather, preferred when
+    pyarrow is installed) is loaded into its own MetricsStore, which reloads it
+    independently when the file changes. Each run keeps a partial sum/count
+    cube; the combined cube is extended by merging only the cubes of newly
+    added runs, and rebuilt from the per-run cubes (never from raw rows) when a
+    run changes or disappears.
+    """
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self._lock = threading.Lock()
+        self._stores = {}           # run id -> MetricsStore
+        self._cube = None           # merged cube of every run in _cube_versions
+        self._cube_versions = {}    # run id -> store version merged into _cube
+        self._combined = OrderedDict()  # (runs, clean) -> (versions, frame, factorized), least recently used first
+
+    def discover(self):
+        """
+        Return the run files in the data directory
+        
+        Returns:
+            dict: run id -> path, preferring .feather over .csv for the same run
+        """
+        runs = {}
+        for filename in sorted(os.listdir(self.data_dir)):
+            match = RUN_FILE_RE.match(filename)
+            if not match:
+                continue
+            run_id, extension = match.groups()
+            if extension == 'feather' and feather is None:
+                continue
+            if run_id not in runs or extension == 'feather':
+                runs[run_id] = os.path.join(self.data_dir, filename)
+        return runs
+
+    def _refresh(self):
+        discovered = self.discover() if os.path.isdir(self.data_dir) else {}
+        with self._lock:
+            for run_id in list(self._stores):
+                if run_id not in discovered:
+                    del self._stores[run_id]
+            for run_id, path in discovered.items():
+                store = self._stores.get(run_id)
+                if store is None or store.path != path:
+                    self._stores[run_id] = MetricsStore(path, run_id=run_id)
+            return dict(self._stores)
+
+    def runs(self):
+        """Return the sorted ids of all known runs"""
+        return sorted(self._refresh())
+
+    def exists(self):
+        return bool(self._refresh())
+
+    def _select(self, runs=None):
+        stores = self._refresh()
+        if runs is None:
+            return stores
+        unknown = [run for run in runs if run not in stores]
+        if unknown:
+            raise ValueError(f"Unknown run: {', '.join(unknown)}")
+        return {run: stores[run] for run in runs}
+
+    def version(self, runs=None):
+        """Return a hashable version of the selected runs' files"""
+        return tuple((run, store.version()) for run, store in sorted(self._select(runs).items()))
+
+    def snapshot(self, runs=None, clean=False):
+        """
+        Return the rows of the selected runs with their factorized variables
+        
+        Args:
+            runs: Optional list of run ids (default: every run)
+            clean: Replace infinite metric values with NaN
+        
+        Returns:
+            tuple: (frame, dict of variable -> (codes, uniques) aligned with its rows)
+        
+        Raises:
+            ValueError: If a requested run does not exist
+        """
+        stores = self._select(runs)
+        if len(stores) == 1:
+            return next(iter(stores.values())).snapshot(clean)
+        
+        # Combining several runs copies their rows; memoize it per version of those runs
+        key = (tuple(sorted(stores)), clean)
+        versions = tuple(store.version() for _, store in sorted(stores.items()))
+        with self._lock:
+            memo = self._combined.get(key)
+            if memo is not None and memo[0] == versions:
+                self._combined.move_to_end(key)
+        count_cache('metrics_combined', memo is not None and memo[0] == versions)
+        if memo is not None and memo[0] == versions:
+            return memo[1].copy(deep=False), memo[2]
+        
+        with stage('combine_runs'):
+            frame = combine_runs([store.frame(clean) for _, store in sorted(stores.items())])
+        with stage('factorize'):
+            factorized = {variable: factorize(frame[variable]) for variable in VARIABLES if variable in frame}
+        current = {run: store.version() for run, store in self._refresh().items()}
+        with self._lock:
+            self._combined[key] = (versions, frame, factorized)
+            self._combined.move_to_end(key)
+            # Drop tables built from run files that have since changed or disappeared
+            for stale_key, (stale_versions, _, _) in list(self._combined.items()):
+                if stale_versions != tuple(current.get(run) for run in stale_key[0]):
+                    del self._combined[stale_key]
+            while len(self._combined) > COMBINED_MEMO_SIZE:
+                self._combined.popitem(last=False)
+        return frame.copy(deep=False), factorized
+
+    def frame(self, runs=None, clean=False):
+        return self.snapshot(runs, clean)[0]
+
+    def cube(self):
+        """
+        Return the aggregate cube over every run, merging in only what changed
+        
+        Returns:
+            AggregateCube or None if there are no runs
+        """
+        stores = self._refresh()
+        versions = {run: store.version() for run, store in stores.items()}
+        
+        with self._lock:
+            cube, merged = self._cube, self._cube_versions
+        count_cache('metrics_cube', merged == versions)
+        if merged == versions:
+            return cube
+        
+        unchanged = all(versions.get(run) == version for run, version in merged.items())
+        if not unchanged:
+            # A run was modified or removed: re-merge the per-run cubes
+            cube, merged = None, {}
+        for run in sorted(set(versions) - set(merged)):
+            run_cube = stores[run].derived('cube', build_run_cube)
+            with stage('cube_merge'):
+                cube = run_cube if cube is None else cube.merge(run_cube)
+        
+        with self._lock:
+            self._cube, self._cube_versions = cube, versions
+        return cube
+
+# Shared registry used by the analysis routes
+metrics_registry = MetricsRegistry()
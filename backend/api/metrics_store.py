@@ -0,0 +1,186 @@
+import os
+import re
+import threading
+import numpy as np
+import pandas as pd
+
+from api.aggregation import factorize
+from utils.instrumentation import count_cache, stage
+
+# Optional dependency: Feather support needs pyarrow
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+# Column types of the metrics file; string dimensions and prompts are stored as categoricals
+VARIABLES = ['data_trend', 'data_count', 'asset', 'canny', 'asset_size', 'cond_scale']
+METRICS = ['CLIP', 'Lie_Factor', 'Match_count', 'Rank_Sim']
+COLUMN_DTYPES = {
+    'data_trend': 'category',
+    'data_count': 'int64',
+    'asset': 'category',
+    'canny': 'category',
+    'asset_size': 'float64',
+    'cond_scale': 'float64',
+    'img_idx': 'int64',
+    'input_prompt': 'category',
+    'CLIP': 'float64',
+    'Lie_Factor': 'float64',
+    'Match_count': 'int64',
+    'Rank_Sim': 'float64',
+}
+
+# Metrics files of evaluation runs are named metrics_<run id>.csv (or .feather once ingested)
+RUN_FILE_RE = re.compile(r'^metrics_(.+)\.(csv|feather)$')
+
+def run_id_from_path(path):
+    """Return the run id encoded in a metrics_<run id>.csv filename, or the file stem"""
+    filename = os.path.basename(path)
+    match = RUN_FILE_RE.match(filename)
+    return match.group(1) if match else os.path.splitext(filename)[0]
+
+def read_metrics_file(path, columns=None):
+    """
+    Read a metrics table from a Feather or CSV file
+    
+    Args:
+        path: Path of a .feather file (memory-mapped) or a metrics CSV
+        columns: Optional list of columns to read
+    
+    Returns:
+        DataFrame: Typed metrics rows
+    """
+    if path.endswith('.feather'):
+        if feather is None:
+            raise ImportError("pyarrow is required to read Feather metrics files")
+        table = feather.read_table(path, columns=columns, memory_map=True)
+        return table.to_pandas()
+    dtypes = COLUMN_DTYPES if columns is None else {c: COLUMN_DTYPES[c] for c in columns if c in COLUMN_DTYPES}
+    return pd.read_csv(path, dtype=dtypes, usecols=columns)
+
+def combine_runs(frames):
+    """
+    Concatenate per-run frames, keeping string columns categorical
+    
+    pd.concat falls back to object dtype when categoricals have different
+    categories, so the categorical columns are re-encoded over the union of
+    values, with sorted categories.
+    """
+    if len(frames) == 1:
+        return frames[0]
+    combined = pd.concat(frames, ignore_index=True)
+    for column in frames[0].columns:
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype):
+            values = combined[column].astype(str)
+            combined[column] = pd.Categorical(values, categories=sorted(values.unique()))
+    return combined
+
+class MetricsStore:
+    """
+    In-memory metrics table of one run file
+    
+    The file (a metrics CSV or the Feather file from api.metrics_ingest, as
+    chosen by the metrics registry) is parsed once into a typed frame. Every
+    access checks the file's mtime and size, and a changed file is re-parsed
+    outside the lock and then swapped in, so readers always see either the old
+    or the new table.
+    """
+
+    def __init__(self, path, columns=None, run_id=None):
+        self.path = path
+        self.columns = columns
+        self.run_id = run_id
+        self._lock = threading.Lock()
+        self._version = None  # (path, mtime_ns, size) of the loaded file
+        self._frame = None
+        self._clean_frame = None
+        self._factorized = None
+        self._derived = {}  # name -> (version, value), see derived()
+
+    def _load(self):
+        with stage('metrics_load'):
+            frame = read_metrics_file(self.path, self.columns)
+        if self.run_id is not None and 'run_id' not in frame:
+            # Tag rows of a plain CSV with the run they came from
+            frame.insert(0, 'run_id', pd.Categorical([self.run_id] * len(frame)))
+        # Replace infinity values with NaN once, for the aggregation routes
+        clean_frame = frame.copy(deep=False)
+        for metric in [m for m in METRICS if m in frame]:
+            clean_frame[metric] = frame[metric].replace([np.inf, -np.inf], np.nan)
+        # Factorize every grouping column once per load, for the aggregation engine
+        with stage('factorize'):
+            factorized = {variable: factorize(frame[variable]) for variable in VARIABLES if variable in frame}
+        return frame, clean_frame, factorized
+
+    def _refresh(self):
+        stat = os.stat(self.path)  # raises FileNotFoundError if the file is gone
+        version = (self.path, stat.st_mtime_ns, stat.st_size)
+        if version == self._version:
+            return
+        frame, clean_frame, factorized = self._load()
+        with self._lock:
+            self._frame, self._clean_frame, self._factorized, self._version = frame, clean_frame, factorized, version
+            self._derived.clear()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def version(self):
+        """Return the (path, mtime_ns, size) of the currently loaded file"""
+        self._refresh()
+        return self._version
+
+    def frame(self, clean=False):
+        """
+        Return a view of the metrics table
+        
+        Args:
+            clean: Replace infinite metric values with NaN
+        
+        Returns:
+            DataFrame: Shallow copy of the shared table; adding or replacing
+                columns is safe, but values must not be modified in place
+        """
+        return self.snapshot(clean)[0]
+
+    def snapshot(self, clean=False):
+        """
+        Return a consistent (frame, factorized) pair from the same load
+        
+        Args:
+            clean: Replace infinite metric values with NaN
+        
+        Returns:
+            tuple: (frame view, dict of variable -> (codes, uniques) aligned with its rows)
+        """
+        self._refresh()
+        with self._lock:
+            frame = self._clean_frame if clean else self._frame
+            factorized = self._factorized
+        return frame.copy(deep=False), factorized
+
+    def derived(self, name, build):
+        """
+        Return a structure derived from the current table, rebuilt only when the file changes
+        
+        Args:
+            name: Key identifying the derived structure
+            build: Callable taking (clean frame, factorized) and returning the structure
+        
+        Returns:
+            The memoized result of build for the currently loaded version
+        """
+        frame, factorized = self.snapshot(clean=True)
+        version = self._version
+        with self._lock:
+            memo = self._derived.get(name)
+        count_cache('metrics_derived', memo is not None and memo[0] == version)
+        if memo is not None and memo[0] == version:
+            return memo[1]
+        value = build(frame, factorized)
+        with self._lock:
+            self._derived[name] = (version, value)
+        return value
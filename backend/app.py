@@ -1,11 +1,39 @@
 import os
-import shutil
-from flask import Flask, request, jsonify
+import json
+import base64
+import time
+import logging
+import threading
+import multiprocessing
+from urllib.parse import urlencode
+from flask import Flask, g, request, jsonify, Response, stream_with_context, url_for
 from flask_cors import CORS
 from dotenv import load_dotenv
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 # Import image processing utilities
-from utils.image_processor import process_image, process_template_image
+from utils.image_processor import (
+    DEFAULT_RESOLUTION, check_processing_params, check_resolution, process_image, find_template_path, template_cache, default_outputs,
+    to_base64_result
+)
+from utils.batch_processor import expand_param_grid, process_template_pooled, process_templates_batch
+from utils.chart_renderer import DEFAULT_TOP_EDGE_WIDTH_SCALE, render_chart_images
+from utils.worker_pool import JobTimeoutError, PoolBusyError, image_pool
+from utils.job_queue import job_runner, job_store
+from utils.template_index import template_index
+from utils.template_store import load_template_store
+from utils.template_sync import sync_templates
+from utils.http_cache import (
+    add_default_etag, compress_response, conditional, http_date, response_cache, supported_encodings, validator_hash
+)
+from utils.instrumentation import (
+    REQUEST_SECONDS, RESPONSE_BYTES, SamplingProfiler, begin_recording, end_recording, logger, register_collector,
+    render_prometheus, summarize_stages
+)
 
 # Import analysis routes
 from api.analysis_routes import analysis_bp
@@ -17,56 +45,146 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Seconds browsers and proxies may reuse template responses without revalidating
+TEMPLATE_MAX_AGE = int(os.environ.get('TEMPLATE_MAX_AGE', 3600))
+# Allow profiling single requests with ?profile=1 or an X-Profile: 1 header
+PROFILING_ENABLED = os.environ.get('PROFILING', '0') == '1'
+# Compute the responses the frontend requests with default parameters in the background at startup
+PRECOMPUTE_RESPONSES = os.environ.get('PRECOMPUTE_RESPONSES', '1') == '1'
+# Held by the one server process that precomputes, so several web workers do not repeat the work
+PRECOMPUTE_LOCK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'precompute.lock')
+
+# Processing parameters and outputs the frontend requests for a newly selected template,
+# as the browser serializes them (JSON.stringify writes 2.0 as 2)
+DEFAULT_PROCESSING_PARAMS = {'sparsification': {'drop_rate': 0.7}, 'blur': {'kernel_size': 10, 'sigma': 2}}
+DEFAULT_PREVIEW_OUTPUTS = [
+    name for technique in ('default', 'sparsification', 'blur')
+    for name in (technique, f'{technique}_top', f'{technique}_bottom')
+]
+DEFAULT_PREVIEW_RESOLUTIONS = (128, DEFAULT_RESOLUTION)
+# Analysis responses the analysis page loads with default parameters
+DEFAULT_ANALYSIS_URLS = (
+    '/api/analysis/metrics', '/api/analysis/variables', '/api/analysis/aggregated',
+    '/api/analysis/aggregated-filtered', '/api/analysis/summary', '/api/analysis/query',
+)
+
+logging.basicConfig(
+    level=os.environ.get('LOG_LEVEL', 'INFO'),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s',
+)
+
 # Register the analysis blueprint
 app.register_blueprint(analysis_bp)
 
-# Create a local templates directory if it doesn't exist
-def setup_templates_dir():
+# Development server with the werkzeug reloader when run as python app.py
+DEBUG = os.environ.get('FLASK_ENV', 'development') == 'development'
+
+def is_serving_process():
     """
-    Create a local templates directory and try to copy templates from the Next.js public folder
+    Whether this process serves requests and should run background threads
+    
+    Spawned image workers re-import this module, and under the reloader the
+    process started by python app.py only watches files and restarts a child
+    (marked with WERKZEUG_RUN_MAIN), which is the one serving requests.
     """
-    # Create templates directory in the backend if it doesn't exist
-    backend_templates_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
-    if not os.path.exists(backend_templates_dir):
-        os.makedirs(backend_templates_dir)
-        print(f"Created templates directory: {backend_templates_dir}")
+    if multiprocessing.parent_process() is not None:
+        return False
+    if __name__ == '__main__' and DEBUG:
+        return os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+    return True
+
+# Resolve every template once; requests then look templates up without touching the filesystem
+template_index.refresh()
+if is_serving_process():
+    template_index.start_watcher()
+
+# Open the precomputed template feature store; it is built as a deploy step (python -m utils.template_store build),
+# since every web worker imports this module. TEMPLATE_STORE_AUTOBUILD=1 builds it here if it is missing or stale
+load_template_store(build_if_stale=os.environ.get('TEMPLATE_STORE_AUTOBUILD', '0') == '1')
+
+# Resume unfinished export jobs; with several server processes (gunicorn workers) the runner lock
+# next to the job database lets only one of them run jobs
+if os.environ.get('JOB_RUNNER', '1') == '1' and is_serving_process():
+    job_runner.start()
+
+@app.before_request
+def start_request_instrumentation():
+    g.request_start = time.perf_counter()
+    g.stages = begin_recording()
+    if PROFILING_ENABLED and (request.args.get('profile') == '1' or request.headers.get('X-Profile') == '1'):
+        g.profiler = SamplingProfiler().start()
+
+@app.after_request
+def record_request_metrics(response):
+    """Observe latency and payload size, and log the request with its per-stage timings"""
+    if 'request_start' not in g:
+        return response
+    seconds = time.perf_counter() - g.request_start
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe(seconds, method=request.method, endpoint=endpoint, status=response.status_code)
+    # Streamed responses have no length up front
+    if response.content_length is not None:
+        RESPONSE_BYTES.observe(response.content_length, endpoint=endpoint)
     
-    # Define the project root directory
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        response.headers['X-Profile'] = profiler.stop().write(endpoint)
     
-    # Try to find the Next.js public templates directory
-    potential_paths = [
-        os.path.join(project_root, 'public', 'templates'),
-        os.path.join('public', 'templates'),
-        os.path.join('..', 'public', 'templates'),
+    logger.info(json.dumps({
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "seconds": round(seconds, 6),
+        "bytes": response.content_length,
+        "stages": summarize_stages(g.stages),
+    }))
+    return response
+
+# after_request hooks run in reverse order of registration: body-hash ETags first,
+# then compression, then record_request_metrics observing the encoded size
+app.after_request(compress_response)
+app.after_request(add_default_etag)
+
+@app.teardown_request
+def stop_request_instrumentation(_exc):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+    end_recording()
+
+def _collect_runtime_metrics():
+    cache = template_cache.stats()
+    pool = image_pool.stats()
+    return [
+        ("chart_outliner_template_cache_bytes", "gauge", "Bytes held by the template result cache",
+         [({}, cache["bytes"])]),
+        ("chart_outliner_template_cache_entries", "gauge", "Entries in the template result cache",
+         [({}, cache["entries"])]),
+        ("chart_outliner_template_cache_evictions_total", "counter", "Template result cache evictions",
+         [({}, cache["evictions"])]),
+        ("chart_outliner_image_pool_in_flight", "gauge", "Image jobs running or queued on the worker pool",
+         [({}, pool["in_flight"])]),
+        ("chart_outliner_image_pool_rejected_total", "counter", "Image jobs rejected because the pool was full",
+         [({}, pool["rejected"])]),
+        ("chart_outliner_templates", "gauge", "Templates in the template index",
+         [({}, len(template_index))]),
+        ("chart_outliner_response_cache_bytes", "gauge", "Bytes held by the encoded response cache",
+         [({}, response_cache.stats()["bytes"])]),
     ]
-    
-    print(f"Looking for templates in the following directories:")
-    for path in potential_paths:
-        print(f"- {os.path.abspath(path)}")
-    
-    for path in potential_paths:
-        if os.path.exists(path):
-            print(f"Found Next.js templates at: {os.path.abspath(path)}")
-            # Check and report the number of template files
-            template_files = [f for f in os.listdir(path) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.gif'))]
-            print(f"Found {len(template_files)} template files")
-            
-            # Copy all template files to the backend templates directory
-            for filename in template_files:
-                src = os.path.join(path, filename)
-                dst = os.path.join(backend_templates_dir, filename)
-                shutil.copy2(src, dst)
-                print(f"Copied template: {filename}")
-            print("Template synchronization complete")
-            return True
-    
-    print("Warning: Could not find Next.js templates directory")
-    print("Will attempt to read templates directly from public/templates")
-    return False
-
-# Run setup at startup
-setup_templates_dir()
+
+register_collector(_collect_runtime_metrics)
+
+@app.errorhandler(PoolBusyError)
+def handle_pool_busy(e):
+    """Reject image work while the worker pool is saturated"""
+    response = jsonify({"error": str(e)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+@app.errorhandler(JobTimeoutError)
+def handle_job_timeout(e):
+    return jsonify({"error": str(e)}), 504
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -79,41 +197,346 @@ def handle_process_image():
     base64_image = request.args.get('base64_image')
     
     try:
-        # Process the image using OpenCV
-        result = process_image(base64_image)
+        # Process the image using OpenCV on the image worker pool
+        result = image_pool.run(process_image, base64_image)
         return jsonify(result), 200
+    except (PoolBusyError, JobTimeoutError):
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/process-template', methods=['POST'])
+def _template_validators(template_filename):
+    """
+    Derive the validators of a template response from the template's content hash
+    
+    The ETag covers the path, the query parameters and the template's SHA-1;
+    Last-Modified is the template file's mtime. Unindexed templates are left to
+    the view, which reports them as not found.
+    """
+    entry = template_index.get(template_filename or '')
+    if entry is None:
+        return None
+    query = sorted(request.args.items(multi=True))
+    return validator_hash(request.path, query, entry["sha1"]), http_date(entry["mtime_ns"] / 1e9)
+
+def _template_image_cache_control(template_filename, variant):
+    # URLs from the index carry the template version, so while it is current the image never changes
+    version = template_cache.file_hash(find_template_path(template_filename))[:12]
+    if request.args.get('v') == version:
+        return 'public, max-age=31536000, immutable'
+    return f'public, max-age={TEMPLATE_MAX_AGE}'
+
+@app.route('/api/process-template', methods=['GET', 'POST'])
+@conditional(
+    lambda: _template_validators(request.args.get('template_filename')),
+    cache_control=f'public, max-age={TEMPLATE_MAX_AGE}',
+)
 def handle_process_template():
-    """Process a template image with Canny edge detection"""
+    """
+    Process a template image with Canny edge detection
+    
+    POST takes a JSON body; GET takes the same fields as query parameters
+    (processing_params as JSON, outputs comma-separated) so that the response
+    can be cached by browsers and proxies, and revalidated against the
+    template's content hash without reprocessing.
+    """
     try:
-        data = request.get_json()
+        if request.method == 'GET':
+            data = dict(request.args)
+            if 'processing_params' in data:
+                data['processing_params'] = json.loads(data['processing_params'])
+            if 'outputs' in data:
+                data['outputs'] = [name for name in data['outputs'].split(',') if name]
+        else:
+            data = request.get_json()
         if not data or 'template_filename' not in data:
             return jsonify({"error": "No template filename provided"}), 400
         
         template_filename = data['template_filename']
-        print(f"Processing template: {template_filename}")
+        logger.debug(f"Processing template: {template_filename}")
         
-        # Extract processing parameters if provided
+        # Extract processing parameters and requested outputs if provided
         processing_params = data.get('processing_params', None)
+        outputs = data.get('outputs', None)
+        # Lower pyramid levels (e.g. 128) give fast previews while parameters change
+        resolution = data.get('resolution', DEFAULT_RESOLUTION)
         
-        # Process the template image with the specified processing parameters
-        result = process_template_image(template_filename, processing_params)
-        return jsonify(result), 200
+        # Index mode: return content URLs of the raw PNG variants instead of inline base64
+        if data.get('response_format') == 'index':
+            response = jsonify(template_image_index(template_filename, processing_params, outputs, resolution))
+        else:
+            # Process the template image with the specified processing parameters
+            response = jsonify(to_base64_result(
+                process_template_pooled(template_filename, processing_params, outputs, resolution)
+            ))
+        return response
+    except (PoolBusyError, JobTimeoutError):
+        raise
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except FileNotFoundError as e:
-        print(f"File not found error: {str(e)}")
+        logger.warning(f"File not found error: {str(e)}")
         return jsonify({"error": str(e)}), 404
     except Exception as e:
         import traceback
         error_traceback = traceback.format_exc()
-        print(f"Error processing template: {str(e)}")
-        print(f"Traceback: {error_traceback}")
+        logger.error(f"Error processing template: {str(e)}\n{error_traceback}")
         return jsonify({"error": str(e), "traceback": error_traceback}), 500
 
+def template_image_index(template_filename, processing_params, outputs=None, resolution=DEFAULT_RESOLUTION):
+    """
+    Build the index response listing a content URL for every variant of a processed template.
+    Variants are only computed when their URL is fetched.
+    """
+    if outputs is None:
+        outputs = default_outputs(processing_params)
+    resolution = check_resolution(resolution)
+    # Decode the template only, to report its dimensions
+    decoded = process_template_pooled(template_filename, processing_params, outputs=[], resolution=resolution)
+    
+    params_json = json.dumps(processing_params or {}, sort_keys=True, separators=(',', ':'))
+    # Version the URLs by the template contents so edits to the file produce new URLs
+    version = template_cache.file_hash(find_template_path(template_filename))[:12]
+    return {
+        "dimensions": decoded["dimensions"],
+        "images": {
+            variant: url_for(
+                'handle_template_image',
+                template_filename=template_filename,
+                variant=variant,
+                params=params_json,
+                resolution=resolution,
+                v=version,
+            )
+            for variant in outputs
+        },
+    }
+
+@app.route('/api/template-images/<template_filename>/<variant>', methods=['GET'])
+@conditional(
+    lambda template_filename, variant: _template_validators(template_filename),
+    cache_control=_template_image_cache_control, cache=False,
+)
+def handle_template_image(template_filename, variant):
+    """Serve one processed variant of a template as a raw PNG"""
+    try:
+        processing_params = json.loads(request.args.get('params') or '{}')
+    except ValueError:
+        return jsonify({"error": "Invalid params"}), 400
+    try:
+        check_processing_params(processing_params or None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        variants = process_template_pooled(
+            template_filename, processing_params or None, outputs=[variant],
+            resolution=request.args.get('resolution', DEFAULT_RESOLUTION),
+        )
+    except ValueError as e:
+        # Unknown variant or unsupported resolution
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    
+    return Response(variants["images"][variant], mimetype='image/png')
+
+@app.route('/api/process-templates/batch', methods=['POST'])
+def handle_process_templates_batch():
+    """
+    Process many templates against a grid of processing parameters in parallel.
+    Results are streamed back as NDJSON, one line per combination as it finishes.
+    """
+    data = request.get_json(silent=True)
+    if not data or not data.get('templates'):
+        return jsonify({"error": "No templates provided"}), 400
+    
+    templates = data['templates']
+    param_grid = data.get('processing_params', None)
+    outputs = data.get('outputs', None)
+    try:
+        resolution = check_resolution(data.get('resolution', DEFAULT_RESOLUTION))
+        # Malformed grids fail here; malformed values are reported per combination
+        expand_param_grid(param_grid)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    def generate():
+        for record in process_templates_batch(templates, param_grid, outputs, resolution):
+            yield json.dumps(record) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/render-chart', methods=['POST'])
+def handle_render_chart():
+    """
+    Render the outlined bar-chart conditioning image of a template on the server.
+    One call renders every requested top edge width scale; the images come back
+    base64 encoded in the order of "scales", or as a raw PNG with
+    response_format "png" when a single scale is rendered.
+    """
+    data = request.get_json(silent=True)
+    if not data or not data.get('template_filename'):
+        return jsonify({"error": "No template filename provided"}), 400
+    if not isinstance(data.get('chart'), dict):
+        return jsonify({"error": "No chart provided"}), 400
+    
+    scales = data.get('scales')
+    if scales is None:
+        scales = [data['chart'].get('top_edge_width_scale', DEFAULT_TOP_EDGE_WIDTH_SCALE)]
+    try:
+        scales = [float(scale) for scale in scales]
+        if not scales or any(scale <= 0 for scale in scales):
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({"error": "scales must be a non-empty list of positive numbers"}), 400
+    if data.get('response_format') == 'png' and len(scales) != 1:
+        return jsonify({"error": "response_format png needs exactly one scale"}), 400
+    
+    try:
+        resolution = check_resolution(data.get('resolution', DEFAULT_RESOLUTION))
+        check_processing_params(data.get('processing_params'))
+        result = image_pool.run(
+            render_chart_images, data['template_filename'], data.get('technique', 'default'),
+            data.get('processing_params'), data['chart'], scales, resolution,
+        )
+    except (PoolBusyError, JobTimeoutError):
+        raise
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    
+    if data.get('response_format') == 'png':
+        return Response(result["images"][0], mimetype='image/png')
+    return jsonify({
+        "dimensions": result["dimensions"],
+        "scales": scales,
+        "images": [base64.b64encode(image).decode('utf-8') for image in result["images"]],
+    })
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """
+    Queue an export job over the template x technique x trend x count x scale grid.
+    Returns 202 with the job; poll its URL for progress.
+    """
+    data = request.get_json(silent=True)
+    try:
+        job = job_store.create_job(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    job_runner.notify()
+    response = jsonify(job)
+    response.status_code = 202
+    response.headers['Location'] = url_for('get_job', job_id=job["id"])
+    return response
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """Return the most recent export jobs"""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify(job_store.list_jobs(limit)), 200
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Return the progress of an export job; ?items=1 adds the status of every item"""
+    job = job_store.get_job(job_id, include_items=request.args.get('items') == '1')
+    if job is None:
+        return jsonify({"error": f"Job not found: {job_id}"}), 404
+    return jsonify(job), 200
+
+@app.route('/api/templates', methods=['GET'])
+def list_templates():
+    """Return every available template with its original dimensions and content hash"""
+    return jsonify([
+        {
+            "name": entry["name"],
+            "filename": entry["filename"],
+            "width": entry["width"],
+            "height": entry["height"],
+            "sha1": entry["sha1"],
+            "mtime_ns": entry["mtime_ns"],
+        }
+        for entry in template_index.entries()
+    ]), 200
+
+@app.route('/api/templates/refresh', methods=['POST'])
+def refresh_templates():
+    """Rescan the template directories now instead of waiting for the watcher"""
+    counts = template_index.refresh()
+    return jsonify({**counts, "templates": len(template_index)}), 200
+
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Expose request latency, stage timing, payload size and cache metrics in Prometheus text format"""
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/template-cache/stats', methods=['GET'])
+def template_cache_stats():
+    """Return hit/miss counters of the template result cache"""
+    return jsonify(template_cache.stats()), 200
+
+@app.route('/api/image-pool/stats', methods=['GET'])
+def image_pool_stats():
+    """Return the configuration and current load of the image worker pool"""
+    return jsonify(image_pool.stats()), 200
+
+def precompute_default_responses():
+    """
+    Fill the template cache and the response cache with the default-params responses
+    
+    The responses are requested once per supported encoding through a test
+    client, so templates are processed on the image worker pool like any
+    request, and the first page load is served from the caches, already
+    compressed.
+    """
+    start = time.perf_counter()
+    urls = list(DEFAULT_ANALYSIS_URLS)
+    for entry in template_index.entries():
+        for resolution in DEFAULT_PREVIEW_RESOLUTIONS:
+            urls.append('/api/process-template?' + urlencode({
+                'template_filename': entry["filename"],
+                'processing_params': json.dumps(DEFAULT_PROCESSING_PARAMS, separators=(',', ':')),
+                'resolution': resolution,
+                'outputs': ','.join(DEFAULT_PREVIEW_OUTPUTS),
+            }))
+    
+    client = app.test_client()
+    for url in urls:
+        for encoding in supported_encodings():
+            response = client.get(url, headers={'Accept-Encoding': encoding})
+            if response.status_code != 200:
+                logger.warning(f"Could not precompute {url}: {response.status_code}")
+                break
+    logger.info(f"Precomputed {len(urls)} default responses in {time.perf_counter() - start:.1f}s")
+
+def acquire_precompute_lock():
+    """Return whether this process may precompute; the lock is held until the process exits"""
+    global _precompute_lock_file
+    if fcntl is None:
+        return True
+    os.makedirs(os.path.dirname(PRECOMPUTE_LOCK_PATH), exist_ok=True)
+    _precompute_lock_file = open(PRECOMPUTE_LOCK_PATH, 'a')
+    try:
+        fcntl.flock(_precompute_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        _precompute_lock_file.close()
+        return False
+
+_precompute_lock_file = None
+if PRECOMPUTE_RESPONSES and is_serving_process() and acquire_precompute_lock():
+    threading.Thread(target=precompute_default_responses, name='precompute-responses', daemon=True).start()
+
 if __name__ == '__main__':
+    # Template synchronization and the feature store build are deployment steps
+    # (python -m utils.template_sync, python -m utils.template_store build);
+    # the development server runs them once here for convenience
+    sync_templates()
+    load_template_store(build_if_stale=True)
+    
     port = int(os.environ.get('FLASK_PORT', 5000))
-    debug = os.environ.get('FLASK_ENV', 'development') == 'development'
-    app.run(host='0.0.0.0', port=port, debug=debug) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=DEBUG) 
\ No newline at end of file
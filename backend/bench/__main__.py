@@ -0,0 +1,128 @@
+"""
+Run the benchmark suite and compare it against the stored baseline
+
+Every suite (and every analysis scale) runs in a fresh interpreter, so
+imports, caches and peak RSS of one measurement do not leak into the next:
+    image     process_template_image over all templates × technique combinations
+    analysis  analysis routes on synthetic runs of 10×, 100× and 1000× the bundled metrics
+    load      Flask test-client load at several concurrency levels
+
+Run from the backend directory:
+    python -m bench [--suites image,analysis,load] [--scales 10,100,1000] [--concurrency 1,4,16]
+                    [--output FILE] [--baseline FILE] [--save-baseline] [--tolerance 0.25]
+
+Exits with status 1 when a metric regressed beyond the tolerance.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from bench.compare import DEFAULT_MIN_DELTA_MS, DEFAULT_TOLERANCE, compare, format_report
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Baseline results checked into the repository
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+SUITES = ('image', 'analysis', 'load')
+
+def run_module(module, *args):
+    """Run a benchmark module in a fresh interpreter and return its JSON results"""
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'results.json')
+        subprocess.run(
+            [sys.executable, '-m', module, '--output', output, *args],
+            cwd=BACKEND_DIR, check=True, stdout=subprocess.DEVNULL,
+        )
+        with open(output) as f:
+            return json.load(f)
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(suites=SUITES, scales=(10, 100, 1000), concurrency=(1, 4, 16), repeat=3, requests=20):
+    """
+    Run the selected suites
+
+    Returns:
+        dict: "meta" describing the machine and revision, and "suites" with
+            the results of each suite
+    """
+    results = {}
+    for suite in suites:
+        start = time.perf_counter()
+        if suite == 'image':
+            results['image'] = run_module('bench.image_pipeline', '--repeat', str(repeat))
+        elif suite == 'analysis':
+            results['analysis'] = {
+                f'x{scale}': run_module('bench.analysis', '--scale', str(scale), '--requests', str(requests))
+                for scale in scales
+            }
+        elif suite == 'load':
+            results['load'] = run_module(
+                'bench.load', '--concurrency', ','.join(map(str, concurrency)), '--requests', str(2 * requests)
+            )
+        else:
+            raise ValueError(f"Unknown suite: {suite}. Use one of {list(SUITES)}")
+        print(f"{suite}: {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "created": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "suites": results,
+    }
+
+def _int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suites', default=','.join(SUITES), help='comma-separated suites to run')
+    parser.add_argument('--scales', type=_int_list, default=[10, 100, 1000], help='analysis data scales')
+    parser.add_argument('--concurrency', type=_int_list, default=[1, 4, 16], help='load test concurrency levels')
+    parser.add_argument('--repeat', type=int, default=3, help='measured passes of the image suite')
+    parser.add_argument('--requests', type=int, default=20, help='measured requests per analysis route (load clients send twice as many)')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='tolerated relative change')
+    parser.add_argument('--min-delta-ms', type=float, default=DEFAULT_MIN_DELTA_MS,
+                        help='ignore latency changes below this many milliseconds')
+    args = parser.parse_args()
+
+    results = run(
+        [s.strip() for s in args.suites.split(',') if s.strip()],
+        args.scales, args.concurrency, args.repeat, args.requests,
+    )
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            f.write(text + '\n')
+        print(f"Saved baseline to {args.baseline}", file=sys.stderr)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report = compare(results["suites"], baseline["suites"], args.tolerance, args.min_delta_ms)
+        print(format_report(report), file=sys.stderr)
+        if report["regressions"]:
+            sys.exit(1)
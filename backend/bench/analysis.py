@@ -0,0 +1,155 @@
+"""
+Latency benchmark of the analysis routes on synthetic metrics runs
+
+The bundled metrics_87809342.csv is replicated scale times (10×, 100×,
+1000×) into one synthetic run: every copy gets its own img_idx range and
+seeded jitter on CLIP, so the files are reproducible and the aggregates are
+not trivially identical. The files are cached under data/bench/ and reused
+while the source CSV is unchanged.
+
+The shared metrics registry is pointed at the synthetic run and every route
+is requested through the Flask test client: the first request of each route
+is reported as the cold latency (file load, factorization, cube build), the
+following ones are summarized as p50/p95/p99 and throughput.
+
+Run from the backend directory (one scale per process, so peak RSS is per scale):
+    python -m bench.analysis --scale 100 [--requests N] [--budget SECONDS] [--format csv|feather] [--output FILE]
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from bench.stats import load_app, peak_rss, summarize, timed
+from api.metrics_store import COLUMN_DTYPES, feather
+from api.metrics_ingest import read_metrics_csv, write_feather
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Metrics file the synthetic runs are derived from
+SOURCE_CSV = os.path.join(BACKEND_DIR, 'data', 'metrics_87809342.csv')
+# Directory receiving the synthetic runs
+BENCH_DATA_DIR = os.path.join(BACKEND_DIR, 'data', 'bench')
+
+SCALES = (10, 100, 1000)
+SEED = 87809342
+
+# Seconds after which a route stops being sampled (with at least MIN_REQUESTS samples), so
+# row-scanning routes on the 1000× run do not dominate the suite
+ROUTE_BUDGET = 10.0
+MIN_REQUESTS = 3
+
+# Requests issued against every scale: (name, URL)
+ROUTES = [
+    ('aggregated', '/api/analysis/aggregated'),
+    ('aggregated_reducers', '/api/analysis/aggregated?reducers=count,median,p90'),
+    ('aggregated_filtered', '/api/analysis/aggregated-filtered'),
+    ('summary', '/api/analysis/summary?variable=asset&metric=CLIP'),
+    ('query', '/api/analysis/query?group_by=asset,canny&data_count=4,5'),
+    ('data_page', '/api/analysis/data?format=columnar&limit=1000'),
+]
+
+def _source_digest():
+    with open(SOURCE_CSV, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+def synthesize(scale, data_format='feather' if feather is not None else 'csv'):
+    """
+    Write (or reuse) the synthetic run of a scale
+
+    Args:
+        scale: Number of copies of the source rows
+        data_format: 'csv' or 'feather'; the registry loads either
+
+    Returns:
+        str: Directory holding the run's metrics file
+    """
+    run_id = f'bench-x{scale}'
+    directory = os.path.join(BENCH_DATA_DIR, f'{_source_digest()}-{data_format}-x{scale}')
+    path = os.path.join(directory, f'metrics_{run_id}.{data_format}')
+    if os.path.exists(path):
+        return directory
+
+    source = read_metrics_csv(SOURCE_CSV)
+    rows = len(source)
+    frame = source.iloc[np.tile(np.arange(rows), scale)].reset_index(drop=True)
+    copy = np.repeat(np.arange(scale, dtype=np.int64), rows)
+    frame['img_idx'] = frame['img_idx'].to_numpy() + copy * (int(source['img_idx'].max()) + 1)
+    rng = np.random.default_rng(SEED + scale)
+    frame['CLIP'] = (frame['CLIP'].to_numpy() + rng.normal(0.0, 0.01, len(frame))).round(4)
+    frame['run_id'] = pd.Categorical([run_id] * len(frame))
+
+    os.makedirs(directory, exist_ok=True)
+    if data_format == 'feather':
+        write_feather(frame, path)
+    else:
+        tmp_path = path + '.tmp'
+        frame[list(COLUMN_DTYPES)].to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    return directory
+
+def run(scale, requests=20, data_format='feather' if feather is not None else 'csv', budget=ROUTE_BUDGET):
+    """
+    Benchmark every analysis route against the synthetic run of a scale
+
+    Returns:
+        dict: Cold latency and summary per route
+    """
+    directory, generate_seconds = timed(synthesize, scale, data_format)
+
+    app = load_app()
+    from api.metrics_registry import metrics_registry
+    # Serve the synthetic run in place of the bundled data
+    metrics_registry.data_dir = directory
+    client = app.test_client()
+
+    routes = {}
+    for name, url in ROUTES:
+        response, cold = timed(client.get, url)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        latencies = []
+        start = time.perf_counter()
+        while len(latencies) < requests:
+            if len(latencies) >= MIN_REQUESTS and time.perf_counter() - start > budget:
+                break
+            response, seconds = timed(client.get, url)
+            response.get_data()
+            latencies.append(seconds)
+        routes[name] = {
+            "url": url,
+            "cold_ms": round(cold * 1000, 3),
+            "response_bytes": len(response.get_data()),
+            **summarize(latencies, time.perf_counter() - start),
+        }
+
+    return {
+        "scale": scale,
+        "rows": int(len(metrics_registry.frame())),
+        "format": data_format,
+        "generate_seconds": round(generate_seconds, 3),
+        "routes": routes,
+        **peak_rss(),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=10, help='copies of the bundled metrics rows')
+    parser.add_argument('--requests', type=int, default=20, help='measured requests per route')
+    parser.add_argument('--budget', type=float, default=ROUTE_BUDGET,
+                        help=f'seconds after which a route stops being sampled (at least {MIN_REQUESTS} requests)')
+    parser.add_argument('--format', choices=['csv', 'feather'], default='feather' if feather is not None else 'csv',
+                        help='file format of the synthetic run')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    args = parser.parse_args()
+
+    results = run(args.scale, args.requests, args.format, args.budget)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
@@ -0,0 +1,97 @@
+"""
+Compare benchmark results against a stored baseline
+
+Results are flattened into dotted keys ("analysis.x100.routes.query.p95_ms").
+Latency percentiles (p50/p95/p99 and cold_ms) and peak RSS (*_rss_bytes)
+regress when they grow by more than the tolerance, throughput (*throughput_rps)
+when it drops by more than the tolerance. Latency changes below min_delta_ms are ignored as timer noise.
+
+Timings depend on the machine: record the baseline with
+`python -m bench --save-baseline` on the machine the comparison runs on.
+
+Run from the backend directory:
+    python -m bench.compare RESULTS BASELINE [--tolerance 0.25]
+"""
+import sys
+import json
+import argparse
+
+# Tolerated relative change before a metric counts as a regression
+DEFAULT_TOLERANCE = 0.25
+# Latency differences smaller than this are never reported
+DEFAULT_MIN_DELTA_MS = 2.0
+
+def flatten(results, prefix=''):
+    """Return {dotted key: number} of every numeric leaf"""
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}.{key}' if prefix else str(key)
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def _direction(key):
+    """Return +1 if larger is worse, -1 if smaller is worse, None if not compared"""
+    leaf = key.rsplit('.', 1)[-1]
+    if leaf in ('p50_ms', 'p95_ms', 'p99_ms', 'cold_ms') or leaf.endswith('_rss_bytes'):
+        return 1
+    if leaf.endswith('throughput_rps'):
+        return -1
+    return None
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE, min_delta_ms=DEFAULT_MIN_DELTA_MS):
+    """
+    Compare results against a baseline
+
+    Only keys present in both are compared, so a baseline recorded with other
+    scales or concurrency levels still applies to the overlapping part.
+
+    Returns:
+        dict: "regressions" and "improvements", lists of
+            {"metric", "baseline", "current", "change"} sorted by change
+    """
+    current, previous = flatten(results), flatten(baseline)
+    regressions, improvements = [], []
+    for key in sorted(set(current) & set(previous)):
+        direction = _direction(key)
+        old, new = previous[key], current[key]
+        if direction is None or not old:
+            continue
+        if key.endswith('_ms') and abs(new - old) < min_delta_ms:
+            continue
+        change = (new - old) / old
+        entry = {"metric": key, "baseline": old, "current": new, "change": round(change, 4)}
+        if change * direction > tolerance:
+            regressions.append(entry)
+        elif change * direction < -tolerance:
+            improvements.append(entry)
+    regressions.sort(key=lambda e: -abs(e["change"]))
+    improvements.sort(key=lambda e: -abs(e["change"]))
+    return {"tolerance": tolerance, "regressions": regressions, "improvements": improvements}
+
+def format_report(report):
+    lines = []
+    for title, entries in (('Regressions', report["regressions"]), ('Improvements', report["improvements"])):
+        lines.append(f'{title} (beyond {report["tolerance"]:.0%}): {len(entries)}')
+        for e in entries:
+            lines.append(f'  {e["metric"]}: {e["baseline"]} -> {e["current"]} ({e["change"]:+.1%})')
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('results', help='JSON written by python -m bench')
+    parser.add_argument('baseline', help='baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='tolerated relative change')
+    parser.add_argument('--min-delta-ms', type=float, default=DEFAULT_MIN_DELTA_MS,
+                        help='ignore latency changes below this many milliseconds')
+    args = parser.parse_args()
+
+    with open(args.results) as f:
+        results = json.load(f)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    report = compare(results.get('suites', results), baseline.get('suites', baseline), args.tolerance, args.min_delta_ms)
+    print(format_report(report))
+    sys.exit(1 if report["regressions"] else 0)
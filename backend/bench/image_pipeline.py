@@ -0,0 +1,94 @@
+"""
+Latency benchmark of process_template_image
+
+Runs the real process_template_image (uncached, base64 PNG output included)
+over every bundled template with each combination of the optional edge
+techniques, and reports p50/p95/p99 latency and throughput per combination
+and overall, plus the peak RSS of the process.
+
+Run from the backend directory:
+    python -m bench.image_pipeline [--repeat N] [--resolution PX] [--no-store] [--output FILE]
+"""
+import json
+import time
+import argparse
+import itertools
+
+from bench.stats import peak_rss, summarize, timed
+from utils.image_processor import DEFAULT_RESOLUTION, EDGE_TECHNIQUES, process_template_image
+from utils.template_store import list_template_files, load_template_store
+
+# Parameters of each optional technique; the default edge variant is always produced
+TECHNIQUE_PARAMS = {
+    'sparsification': {'drop_rate': 0.3},
+    'blur': {'kernel_size': 5, 'sigma': 1.0},
+}
+
+def technique_combinations():
+    """
+    Return every subset of the optional techniques
+
+    Returns:
+        list: (name, processing_params) pairs, e.g. ("default+blur", {"blur": {...}})
+    """
+    optional = [t for t in EDGE_TECHNIQUES if t in TECHNIQUE_PARAMS]
+    combinations = []
+    for size in range(len(optional) + 1):
+        for techniques in itertools.combinations(optional, size):
+            name = '+'.join(('default',) + techniques)
+            combinations.append((name, {t: TECHNIQUE_PARAMS[t] for t in techniques} or None))
+    return combinations
+
+def run(repeat=3, resolution=DEFAULT_RESOLUTION):
+    """
+    Benchmark every template with every technique combination
+
+    A warm-up pass over all templates is not measured, so one-time costs
+    (imports, scratch buffers, page-cache faults of the feature store) do not
+    skew the percentiles.
+
+    Returns:
+        dict: Summary per combination and over all requests
+    """
+    templates = list_template_files()
+    combinations = technique_combinations()
+    for name in templates:
+        process_template_image(name, combinations[-1][1], use_cache=False, resolution=resolution)
+
+    per_combination = {}
+    all_latencies = []
+    start = time.perf_counter()
+    for combination, params in combinations:
+        latencies = [
+            timed(process_template_image, name, params, use_cache=False, resolution=resolution)[1]
+            for _ in range(repeat) for name in templates
+        ]
+        per_combination[combination] = summarize(latencies)
+        all_latencies.extend(latencies)
+    wall = time.perf_counter() - start
+
+    return {
+        "templates": len(templates),
+        "resolution": resolution,
+        "repeat": repeat,
+        "combinations": per_combination,
+        "overall": summarize(all_latencies, wall),
+        **peak_rss(),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3, help='measured passes over all templates')
+    parser.add_argument('--resolution', type=int, default=DEFAULT_RESOLUTION, help='template height in pixels')
+    parser.add_argument('--no-store', action='store_true', help='decode PNGs instead of using the feature store')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    args = parser.parse_args()
+
+    if not args.no_store:
+        load_template_store(build_if_stale=True)
+    results = run(args.repeat, args.resolution)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
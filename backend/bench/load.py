@@ -0,0 +1,135 @@
+"""
+Concurrent load benchmark through the Flask test client
+
+Each concurrency level runs that many client threads against the app in this
+process, each issuing the same round-robin mix of image and analysis requests.
+One unmeasured pass over the mix first starts the image worker pool, loads the
+metrics and fills the result cache. Reports p50/p95/p99 latency and
+throughput per level and per endpoint, the number of non-2xx
+responses (429s from pool backpressure are counted separately), and the
+peak RSS of the server process and its workers.
+
+Run from the backend directory:
+    python -m bench.load [--concurrency 1,4,16] [--requests N] [--output FILE]
+"""
+import json
+import time
+import argparse
+import threading
+from urllib.parse import urlencode
+
+from bench.stats import load_app, peak_rss, summarize
+
+CONCURRENCY_LEVELS = (1, 4, 16)
+
+# Templates requested by the image part of the mix
+LOAD_TEMPLATES = ('apartment.png', 'bottle.png', 'cactus.png', 'pine_tree.png')
+
+def request_mix(templates=LOAD_TEMPLATES):
+    """
+    Return the requests every client thread cycles through: (endpoint, URL)
+
+    The image requests ask for every edge technique, as the export view does
+    when a user flips between templates.
+    """
+    mix = [
+        ('analysis_aggregated', '/api/analysis/aggregated'),
+        ('analysis_query', '/api/analysis/query?group_by=asset'),
+        ('analysis_summary', '/api/analysis/summary?variable=canny&metric=Rank_Sim'),
+        ('health', '/api/health'),
+    ]
+    for template in templates:
+        params = json.dumps({'sparsification': {'drop_rate': 0.3}, 'blur': {'kernel_size': 5, 'sigma': 1.0}})
+        query = urlencode({'template_filename': template, 'processing_params': params})
+        mix.append(('process_template', f'/api/process-template?{query}'))
+    return mix
+
+def run_level(app, concurrency, requests_per_client, mix):
+    """
+    Run one concurrency level
+
+    Returns:
+        dict: Overall and per-endpoint summaries with error counts
+    """
+    samples = []  # (endpoint, status, seconds)
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency + 1)
+
+    def client_thread(offset):
+        client = app.test_client()
+        local = []
+        barrier.wait()
+        for i in range(requests_per_client):
+            endpoint, url = mix[(offset + i) % len(mix)]
+            start = time.perf_counter()
+            response = client.get(url)
+            response.get_data()
+            local.append((endpoint, response.status_code, time.perf_counter() - start))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=client_thread, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    endpoints = {}
+    for endpoint in sorted({endpoint for endpoint, _, _ in samples}):
+        latencies = [seconds for name, _, seconds in samples if name == endpoint]
+        endpoints[endpoint] = summarize(latencies)
+    return {
+        "concurrency": concurrency,
+        "overall": summarize([seconds for _, _, seconds in samples], wall),
+        "errors": sum(1 for _, status, _ in samples if status >= 400 and status != 429),
+        "rejected": sum(1 for _, status, _ in samples if status == 429),
+        "endpoints": endpoints,
+    }
+
+def run(concurrency_levels=CONCURRENCY_LEVELS, requests_per_client=40):
+    """
+    Run every concurrency level against one app instance
+
+    Returns:
+        dict: Results per level
+    """
+    app = load_app()
+    from utils.worker_pool import image_pool
+    mix = request_mix()
+
+    levels = {}
+    try:
+        # Warm up once so the first level does not pay for pool start-up, metrics loading and cache misses
+        client = app.test_client()
+        for _, url in mix:
+            client.get(url).get_data()
+        for concurrency in concurrency_levels:
+            levels[str(concurrency)] = run_level(app, concurrency, requests_per_client, mix)
+    finally:
+        # Reap the pool workers so their peak RSS is reported
+        image_pool.shutdown(wait=True)
+
+    return {
+        "requests_per_client": requests_per_client,
+        "mix": [endpoint for endpoint, _ in mix],
+        "levels": levels,
+        **peak_rss(),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', default=','.join(map(str, CONCURRENCY_LEVELS)),
+                        help='comma-separated numbers of concurrent clients')
+    parser.add_argument('--requests', type=int, default=40, help='requests per client and level')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    args = parser.parse_args()
+
+    results = run([int(level) for level in args.concurrency.split(',')], args.requests)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
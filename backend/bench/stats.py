@@ -0,0 +1,84 @@
+"""
+Shared measurement helpers of the benchmark suites
+
+Latencies are summarized as p50/p95/p99 in milliseconds with the throughput
+over the wall time of the run; peak RSS is read from the kernel's high-water
+mark of the process (and of its reaped children, e.g. pool workers).
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+# Optional dependency: the resource module does not exist on Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PERCENTILES = (50, 95, 99)
+
+def summarize(latencies, wall_seconds=None):
+    """
+    Summarize request latencies
+
+    Args:
+        latencies: Seconds per request
+        wall_seconds: Wall time of the whole run (default: the sum of the
+            latencies, i.e. a sequential run)
+
+    Returns:
+        dict: "count", "p50_ms", "p95_ms", "p99_ms", "mean_ms" and "throughput_rps"
+    """
+    samples = np.asarray(latencies, dtype=np.float64)
+    if wall_seconds is None:
+        wall_seconds = float(samples.sum())
+    summary = {"count": int(samples.size)}
+    if samples.size == 0:
+        return summary
+    for q, value in zip(PERCENTILES, np.percentile(samples, PERCENTILES)):
+        summary[f"p{q}_ms"] = round(float(value) * 1000, 3)
+    summary["mean_ms"] = round(float(samples.mean()) * 1000, 3)
+    summary["throughput_rps"] = round(samples.size / wall_seconds, 3) if wall_seconds > 0 else None
+    return summary
+
+def timed(fn, *args, **kwargs):
+    """Call fn and return (result, seconds)"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def peak_rss():
+    """
+    Return the peak resident set size of this process and its reaped children
+
+    Returns:
+        dict: "peak_rss_bytes" and "peak_rss_children_bytes", or None values
+            where the platform does not report them
+    """
+    if resource is None:
+        return {"peak_rss_bytes": None, "peak_rss_children_bytes": None}
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return {
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+        "peak_rss_children_bytes": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit,
+    }
+
+def load_app():
+    """
+    Import the Flask app for in-process benchmarking
+
+    Export jobs are not run, default responses are neither precomputed nor
+    cached (so every request measures the work, not a cache hit) and
+    per-request log lines are silenced unless JOB_RUNNER,
+    PRECOMPUTE_RESPONSES, RESPONSE_CACHE_MAX_BYTES or LOG_LEVEL are set
+    explicitly.
+    """
+    os.environ.setdefault('JOB_RUNNER', '0')
+    os.environ.setdefault('PRECOMPUTE_RESPONSES', '0')
+    os.environ.setdefault('RESPONSE_CACHE_MAX_BYTES', '0')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    from app import app
+    return app
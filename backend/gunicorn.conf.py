@@ -0,0 +1,14 @@
+import os
+
+# Web workers only parse requests and read caches; CPU-bound image jobs run on
+# each worker's image pool (IMAGE_WORKERS), so keep this number small.
+bind = f"0.0.0.0:{os.environ.get('FLASK_PORT', 5000)}"
+workers = int(os.environ.get('WEB_WORKERS', 2))
+
+# Every web worker creates its own image pool; split the CPUs between them instead of
+# giving each a full cpu_count pool. Set before the workers import the app.
+os.environ.setdefault('IMAGE_WORKERS', str(max(1, (os.cpu_count() or 1) // workers)))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 8))
+# Allow streaming batch responses to outlive the default 30s worker timeout
+timeout = int(os.environ.get('WEB_TIMEOUT', 300))
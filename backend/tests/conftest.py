@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Tests import the backend modules the way the server does, from the backend directory
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Never start export jobs or background precomputation from a test process
+os.environ.setdefault('JOB_RUNNER', '0')
+os.environ.setdefault('PRECOMPUTE_RESPONSES', '0')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from api.aggregation import aggregate, parse_reducers, to_category_records
+
+def make_frame(rows=500, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        "asset": pd.Categorical(rng.choice(["cat", "dog", "fish", "bird"], rows),
+                                categories=["bird", "cat", "dog", "fish", "unused"]),
+        "data_count": rng.integers(3, 9, rows),
+        "scale": rng.choice([0.2, 0.4, 0.8], rows),
+        "exact_match": rng.choice([True, False], rows),
+        "CLIP": rng.normal(0.3, 0.05, rows),
+        "SSIM": rng.uniform(0, 1, rows),
+    })
+    frame.loc[rng.choice(rows, 40, replace=False), "CLIP"] = np.nan
+    return frame
+
+VARIABLES = ["asset", "data_count", "scale", "exact_match"]
+METRICS = ["CLIP", "SSIM"]
+
+def pandas_reduce(grouped, reducer):
+    if reducer == "median":
+        return grouped.median()
+    if reducer.startswith("p"):
+        return grouped.quantile(float(reducer[1:]) / 100)
+    return getattr(grouped, reducer)()
+
+@pytest.mark.parametrize("reducer", ["mean", "sum", "count", "std", "min", "max", "median", "p25", "p90"])
+def test_matches_pandas_groupby(reducer):
+    frame = make_frame()
+    result = aggregate(frame, VARIABLES, METRICS, ["mean", reducer])
+    for variable in VARIABLES:
+        for metric in METRICS:
+            expected = pandas_reduce(frame.groupby(variable, observed=True)[metric], reducer)
+            assert list(result[variable]["categories"]) == list(expected.index)
+            np.testing.assert_allclose(
+                result[variable]["metrics"][metric][reducer], expected.to_numpy(dtype=np.float64), rtol=1e-9
+            )
+
+def test_mask_matches_filtered_groupby():
+    frame = make_frame()
+    mask = (frame["data_count"] > 5).to_numpy()
+    result = aggregate(frame, ["asset", "data_count"], METRICS, mask=mask)
+    filtered = frame[mask]
+    for variable in ("asset", "data_count"):
+        expected = filtered.groupby(variable, observed=True)["SSIM"].mean()
+        assert list(result[variable]["categories"]) == list(expected.index)
+        np.testing.assert_allclose(result[variable]["metrics"]["SSIM"]["mean"], expected.to_numpy())
+
+def test_records_match_the_previous_iterrows_output():
+    frame = make_frame()
+    records = to_category_records(aggregate(frame, VARIABLES, METRICS))
+    for variable in VARIABLES:
+        grouped = frame.groupby(variable, observed=True)["CLIP"].mean().reset_index()
+        expected = [
+            {"category": str(row[variable]), "value": float(row["CLIP"]) if not pd.isna(row["CLIP"]) else 0}
+            for _, row in grouped.iterrows()
+        ]
+        actual = records[variable]["CLIP"]
+        assert [r["category"] for r in actual] == [r["category"] for r in expected]
+        assert [r["value"] for r in actual] == pytest.approx([r["value"] for r in expected])
+
+def test_all_missing_group_reports_zero():
+    frame = pd.DataFrame({"asset": ["a", "a", "b"], "CLIP": [np.nan, np.nan, 1.0]})
+    records = to_category_records(aggregate(frame, ["asset"], ["CLIP"]))
+    assert records["asset"]["CLIP"] == [{"category": "a", "value": 0}, {"category": "b", "value": 1.0}]
+
+def test_unknown_reducer_is_rejected():
+    with pytest.raises(ValueError):
+        parse_reducers(["mean", "mode"])
@@ -0,0 +1,59 @@
+from concurrent.futures import Future
+
+import pytest
+
+from utils import batch_processor
+from utils.batch_processor import expand_param_grid, process_template_pooled, process_templates_batch
+from utils.image_processor import template_cache
+from utils.template_index import template_index
+
+class InlinePool:
+    """Runs image jobs in the test process and records the outputs each job computed"""
+
+    job_timeout = 30
+
+    def __init__(self):
+        self.computed = []
+
+    def run(self, fn, *args):
+        self.computed.append(list(args[2]))
+        return fn(*args)
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(self.run(fn, *args))
+        return future
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = InlinePool()
+    monkeypatch.setattr(batch_processor, 'image_pool', pool)
+    template_cache.clear()
+    yield pool
+    template_cache.clear()
+
+@pytest.fixture
+def template_filename():
+    return template_index.entries()[0]["filename"]
+
+def test_partial_cache_hit_computes_only_missing_outputs(pool, template_filename):
+    first = process_template_pooled(template_filename, outputs=['default', 'default_top'], resolution=128)
+    second = process_template_pooled(template_filename, outputs=['default', 'blur'], resolution=128)
+    assert pool.computed == [['default', 'default_top'], ['blur']]
+    assert set(second["images"]) == {'default', 'blur'}
+    assert second["images"]['default'] == first["images"]['default']
+    # Every output is cached now
+    process_template_pooled(template_filename, outputs=['blur', 'default_top'], resolution=128)
+    assert len(pool.computed) == 2
+
+def test_batch_computes_only_missing_outputs(pool, template_filename):
+    process_template_pooled(template_filename, outputs=['default'], resolution=128)
+    records = list(process_templates_batch([template_filename], outputs=['default', 'blur_top'], resolution=128))
+    assert pool.computed == [['default'], ['blur_top']]
+    assert set(records[0]["result"]["processed_edges"]) == {'default', 'blur_top'}
+
+def test_param_grid_is_expanded():
+    grid = expand_param_grid({"blur": {"kernel_size": [5, 10], "sigma": 2}})
+    assert grid == [{"blur": {"kernel_size": 5, "sigma": 2}}, {"blur": {"kernel_size": 10, "sigma": 2}}]
+    with pytest.raises(ValueError):
+        expand_param_grid({"blur": 5})
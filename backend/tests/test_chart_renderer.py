@@ -0,0 +1,22 @@
+import pytest
+
+from utils.chart_renderer import parse_chart_spec
+
+def test_defaults_are_filled_in():
+    chart = parse_chart_spec({"values": [1, 2, 3]})
+    assert chart["labels"] == ["2020", "2021", "2022"]
+    assert chart["domain"] == [None, None]
+
+@pytest.mark.parametrize("field, value, message", [
+    ("values", ["x"], "chart.values must be a list of numbers"),
+    ("padding", "wide", "chart.padding must be a number"),
+    ("padding", [0.1], "chart.padding must be a number"),
+    ("width", "big", "chart.width must be an integer"),
+    ("height", None, "chart.height must be an integer"),
+    ("domain", ["low", 10], "chart.domain values must be numbers or null"),
+    ("top_edge_width_scale", {}, "chart.top_edge_width_scale must be a number"),
+])
+def test_malformed_fields_are_named(field, value, message):
+    with pytest.raises(ValueError) as error:
+        parse_chart_spec({"values": [1, 2, 3], field: value})
+    assert str(error.value) == message
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from api.aggregation import aggregate
+from api.cube import AggregateCube
+from tests.test_aggregation import METRICS, VARIABLES, make_frame
+
+def test_query_matches_pandas_groupby():
+    frame = make_frame()
+    cube = AggregateCube.build(frame, VARIABLES, METRICS)
+    records = cube.query({"data_count": ["4", "5"]}, ["asset", "scale"], ["CLIP"])
+
+    filtered = frame[frame["data_count"].isin([4, 5])]
+    expected = filtered.groupby(["asset", "scale"], observed=True).agg(
+        rows=("CLIP", "size"), mean=("CLIP", "mean"), count=("CLIP", "count")
+    )
+    assert [(r["asset"], r["scale"]) for r in records] == list(expected.index)
+    assert [r["rows"] for r in records] == expected["rows"].tolist()
+    assert [r["CLIP"]["count"] for r in records] == expected["count"].tolist()
+    np.testing.assert_allclose([r["CLIP"]["mean"] for r in records], expected["mean"].to_numpy())
+
+def test_aggregate_matches_the_row_engine():
+    frame = make_frame()
+    cube = AggregateCube.build(frame, VARIABLES, METRICS)
+    from_cube = cube.aggregate(VARIABLES, METRICS)
+    from_rows = aggregate(frame, VARIABLES, METRICS)
+    for variable in VARIABLES:
+        assert list(from_cube[variable]["categories"]) == list(from_rows[variable]["categories"])
+        for metric in METRICS:
+            np.testing.assert_allclose(
+                from_cube[variable]["metrics"][metric]["mean"], from_rows[variable]["metrics"][metric]["mean"]
+            )
+
+def test_merge_equals_building_over_all_rows():
+    first, second = make_frame(seed=1), make_frame(rows=200, seed=2)
+    # Categories only present in one of the runs
+    second.loc[:20, "data_count"] = 12
+    merged = AggregateCube.build(first, VARIABLES, METRICS).merge(AggregateCube.build(second, VARIABLES, METRICS))
+    combined = pd.concat([first, second], ignore_index=True)
+    combined["asset"] = combined["asset"].astype(first["asset"].dtype)
+    whole = AggregateCube.build(combined, VARIABLES, METRICS)
+    merged_records = merged.query(group_by=["data_count", "asset"])
+    whole_records = whole.query(group_by=["data_count", "asset"])
+    assert [(r["data_count"], r["asset"], r["rows"], r["SSIM"]["count"]) for r in merged_records] == \
+        [(r["data_count"], r["asset"], r["rows"], r["SSIM"]["count"]) for r in whole_records]
+    np.testing.assert_allclose(
+        [r["SSIM"]["mean"] for r in merged_records], [r["SSIM"]["mean"] for r in whole_records]
+    )
+
+def test_unknown_dimension_or_metric_is_rejected():
+    cube = AggregateCube.build(make_frame(), VARIABLES, METRICS)
+    with pytest.raises(ValueError):
+        cube.query(group_by=["color"])
+    with pytest.raises(ValueError):
+        cube.query(group_by=["asset"], metrics=["LPIPS"])
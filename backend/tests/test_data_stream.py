@@ -0,0 +1,44 @@
+import base64
+import json
+
+import pytest
+
+from api.data_stream import decode_cursor, encode_cursor
+
+VERSION = (('87809342', ('/srv/backend/data/metrics_87809342.csv', 1700000000000000000, 4096)),)
+
+def raw_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode('utf-8')).decode('ascii')
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(1000, VERSION)
+    assert decode_cursor(cursor, VERSION) == 1000
+
+def test_cursor_does_not_reveal_the_file_path():
+    decoded = base64.urlsafe_b64decode(encode_cursor(1000, VERSION)).decode('utf-8')
+    assert '/srv' not in decoded and 'metrics_' not in decoded
+
+def test_stale_cursor_is_rejected():
+    cursor = encode_cursor(1000, VERSION)
+    changed = (('87809342', ('/srv/backend/data/metrics_87809342.csv', 1700000000000000001, 4096)),)
+    with pytest.raises(ValueError, match="changed"):
+        decode_cursor(cursor, changed)
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    raw_cursor([0, 5]),
+    raw_cursor([{}, "abc"]),
+    raw_cursor(["10", "abc"]),
+    raw_cursor([-1, "abc"]),
+    raw_cursor([True, "abc"]),
+    raw_cursor([10]),
+    raw_cursor({"offset": 10}),
+])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor, VERSION)
+
+def test_malformed_cursor_returns_400():
+    from app import app
+    response = app.test_client().get('/api/analysis/data?limit=5&cursor=' + raw_cursor([{}, [1, 2]]))
+    assert response.status_code == 400
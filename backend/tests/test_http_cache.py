@@ -0,0 +1,123 @@
+import gzip
+from datetime import datetime, timezone
+
+import pytest
+from flask import Flask, Response, jsonify
+
+from utils import http_cache
+from utils.http_cache import (
+    COMPRESS_MIN_SIZE, ResponseCache, add_default_etag, compress_response, conditional, response_cache,
+)
+
+LAST_MODIFIED = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.calls = 0
+    payload = {"values": list(range(COMPRESS_MIN_SIZE))}
+
+    @app.route('/derived')
+    @conditional(lambda: ('v1', LAST_MODIFIED))
+    def derived():
+        app.calls += 1
+        return jsonify(payload)
+
+    @app.route('/png')
+    @conditional(lambda: ('png1', None), cache_control='public, max-age=60', cache=False)
+    def png():
+        app.calls += 1
+        return Response(b'\x89PNG' * 1000, mimetype='image/png')
+
+    @app.route('/plain')
+    def plain():
+        return jsonify(payload)
+
+    app.after_request(compress_response)
+    app.after_request(add_default_etag)
+    response_cache.clear()
+    yield app.test_client()
+    response_cache.clear()
+
+def test_response_cache_stays_within_its_byte_bound():
+    cache = ResponseCache(max_bytes=250)
+    for key in ("a", "b", "c"):
+        cache.put(key, "etag", "application/json", b"x" * 100)
+    stats = cache.stats()
+    assert stats["bytes"] <= 250 and stats["entries"] == 2
+    # The least recently used entry goes first
+    assert cache.get("a", "etag") is None
+    assert cache.get("c", "etag") is not None
+
+def test_response_cache_counts_encoded_bodies():
+    cache = ResponseCache(max_bytes=10 ** 6)
+    body = b'{"values": "' + b"x" * COMPRESS_MIN_SIZE + b'"}'
+    entry = cache.put("a", "etag", "application/json", body)
+    encoded = cache.body("a", entry, "gzip")
+    assert gzip.decompress(encoded) == body
+    assert cache.stats()["bytes"] == len(body) + len(encoded)
+    # Encoded bodies count towards the bound, so any new entry now evicts "a"
+    cache.max_bytes = len(body) + len(encoded)
+    cache.put("b", "etag", "application/json", b"y" * 10)
+    assert cache.get("a", "etag") is None
+    assert cache.get("b", "etag") is not None
+
+def test_response_cache_misses_on_a_new_etag():
+    cache = ResponseCache()
+    cache.put("a", "v1", "application/json", b"{}")
+    assert cache.get("a", "v2") is None
+
+def test_conditional_answers_304_without_running_the_view(client):
+    first = client.get('/derived')
+    assert first.status_code == 200 and client.application.calls == 1
+    etag = first.headers['ETag']
+
+    revalidated = client.get('/derived', headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers['ETag'] == etag
+    since = client.get('/derived', headers={'If-Modified-Since': 'Thu, 01 Jan 2026 00:00:00 GMT'})
+    assert since.status_code == 304
+    assert client.application.calls == 1
+
+def test_conditional_serves_repeats_from_the_response_cache(client):
+    bodies = {client.get('/derived', headers={'Accept-Encoding': 'gzip'}).get_data() for _ in range(3)}
+    assert len(bodies) == 1
+    assert client.application.calls == 1
+
+def test_zero_budget_disables_the_response_cache(client, monkeypatch):
+    monkeypatch.setattr(response_cache, 'max_bytes', 0)
+    client.get('/derived')
+    client.get('/derived')
+    assert client.application.calls == 2
+    assert response_cache.stats()["entries"] == 0
+
+@pytest.mark.parametrize("url", ['/derived', '/plain'])
+def test_etag_is_strong_for_identity_and_weak_when_encoded(client, url):
+    identity = client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in identity.headers
+    etag = identity.headers['ETag']
+    assert not etag.startswith('W/')
+
+    encoded = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert encoded.headers['Content-Encoding'] == 'gzip'
+    assert encoded.headers['ETag'] == 'W/' + etag
+    assert gzip.decompress(encoded.get_data()) == identity.get_data()
+
+    # Either form revalidates, and the 304 echoes the form the client holds
+    assert client.get(url, headers={'If-None-Match': etag}).headers['ETag'] == etag
+    weak = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': 'W/' + etag})
+    assert weak.status_code == 304 and weak.headers['ETag'] == 'W/' + etag
+
+@pytest.mark.skipif(http_cache.brotli is None, reason="Brotli is not installed")
+def test_brotli_is_preferred_and_weakens_the_etag(client):
+    response = client.get('/derived', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert response.headers['ETag'].startswith('W/')
+
+def test_non_compressible_bodies_keep_a_strong_etag(client):
+    response = client.get('/png', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['ETag'] == '"png1"'
+    assert response.headers['Cache-Control'] == 'public, max-age=60'
+    assert client.get('/png', headers={'If-None-Match': '"png1"'}).status_code == 304
+    assert client.application.calls == 1
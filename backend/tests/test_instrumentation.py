@@ -0,0 +1,26 @@
+import os
+
+from utils.instrumentation import Counter, Histogram, count_cache, render_prometheus
+
+def test_every_sample_is_labelled_with_the_worker_pid():
+    count_cache('template', True)
+    worker = f'worker="{os.getpid()}"'
+    samples = [line for line in render_prometheus().splitlines() if not line.startswith('#')]
+    assert samples
+    assert all(worker in line for line in samples)
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('test_seconds', 'Test', ['stage'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, stage='blur')
+    lines = histogram.render([('worker', '1')])
+    assert 'test_seconds_bucket{worker="1",stage="blur",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{worker="1",stage="blur",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{worker="1",stage="blur",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{worker="1",stage="blur"} 3' in lines
+
+def test_counter_renders_labels():
+    counter = Counter('test_total', 'Test', ['cache', 'result'])
+    counter.inc(cache='template', result='hit')
+    counter.inc(2, cache='template', result='hit')
+    assert counter.render()[-1] == 'test_total{cache="template",result="hit"} 3'
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from utils import job_queue
+from utils.job_queue import JobStore
+from utils.template_index import template_index
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+@pytest.fixture
+def spec():
+    template_index.refresh()
+    asset = template_index.entries()[0]["name"]
+    return {"templates": [asset], "techniques": ["default", "blur"], "data_trends": ["rising"],
+            "data_counts": [4], "scales": [0.4]}
+
+def test_job_runs_from_queued_to_completed(store, spec):
+    job = store.create_job(spec)
+    assert (job["status"], job["total"], job["progress"]) == ("queued", 2, 0.0)
+
+    claimed = store.claim_next("runner-a")
+    assert claimed["id"] == job["id"]
+    assert store.get_job(job["id"])["status"] == "running"
+    # A claimed job is not handed to a second runner while its heartbeat is fresh
+    assert store.claim_next("runner-b") is None
+
+    first, second = store.pending_items(job["id"])
+    store.finish_item(job["id"], first["idx"], output="first.png")
+    # The job stays running while an item is pending
+    store.finish_job(job["id"], "runner-a")
+    assert store.get_job(job["id"])["status"] == "running"
+
+    store.finish_item(job["id"], second["idx"], error="boom")
+    store.finish_job(job["id"], "runner-a")
+    finished = store.get_job(job["id"], include_items=True)
+    assert (finished["status"], finished["completed"], finished["failed"], finished["progress"]) == \
+        ("completed", 1, 1, 1.0)
+    assert [item["status"] for item in finished["items"]] == ["done", "failed"]
+    assert store.pending_items(job["id"]) == []
+
+def test_finished_items_are_not_counted_twice(store, spec):
+    job = store.create_job(spec)
+    store.claim_next("runner-a")
+    item = store.pending_items(job["id"])[0]
+    store.finish_item(job["id"], item["idx"], output="out.png")
+    store.finish_item(job["id"], item["idx"], error="late retry")
+    job = store.get_job(job["id"])
+    assert (job["completed"], job["failed"]) == (1, 0)
+
+def test_stale_job_is_taken_over(store, spec, monkeypatch):
+    job = store.create_job(spec)
+    store.claim_next("runner-a")
+    # Treat every heartbeat as expired
+    monkeypatch.setattr(job_queue, "JOB_STALE_AFTER", -1)
+    assert store.claim_next("runner-b")["id"] == job["id"]
+    assert not store.heartbeat(job["id"], "runner-a")
+    assert store.heartbeat(job["id"], "runner-b")
+    # Only the runner holding the claim can complete the job
+    for item in store.pending_items(job["id"]):
+        store.finish_item(job["id"], item["idx"], output="out.png")
+    store.finish_job(job["id"], "runner-a")
+    assert store.get_job(job["id"])["status"] == "running"
+    store.finish_job(job["id"], "runner-b")
+    assert store.get_job(job["id"])["status"] == "completed"
+
+@pytest.mark.parametrize("change", [
+    {"data_counts": [9]},
+    {"data_counts": [True]},
+    {"techniques": ["emboss"]},
+    {"data_trends": ["sideways"]},
+    {"templates": ["missing-template"]},
+    {"processing_params": {"blur": {"kernel_size": 0}}},
+])
+def test_invalid_spec_is_rejected(store, spec, change):
+    with pytest.raises(ValueError):
+        store.create_job({**spec, **change})
+    assert store.list_jobs() == []
+
+def test_repeated_values_do_not_produce_duplicate_outputs(spec):
+    asset = spec["templates"][0]
+    items = job_queue.expand_job_items({
+        **spec, "templates": [asset, f"{asset}.png", asset], "techniques": ["blur", "blur"], "scales": [0.4, 0.4],
+    })
+    names = [item["name"] for item in items]
+    assert len(names) == len(set(names)) == 1
+
+def test_render_job_item_replaces_the_output_without_leftovers(spec, tmp_path):
+    item = job_queue.expand_job_items(spec)[0]
+    output_path = str(tmp_path / f"{item['name']}.png")
+    for _ in range(2):
+        assert job_queue.render_job_item(item, None, output_path) == output_path
+    assert os.listdir(tmp_path) == [os.path.basename(output_path)]
+    with open(output_path, 'rb') as f:
+        assert f.read(8) == b'\x89PNG\r\n\x1a\n'
@@ -0,0 +1,42 @@
+import glob
+import os
+
+import pandas as pd
+import pytest
+
+from api import metrics_registry as registry_module
+from api.metrics_registry import MetricsRegistry
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def registry(tmp_path):
+    source = sorted(glob.glob(os.path.join(BACKEND_DIR, 'data', 'metrics_*.csv')))[0]
+    rows = pd.read_csv(source).head(200)
+    for run_id in ('a', 'b', 'c'):
+        rows.to_csv(tmp_path / f'metrics_{run_id}.csv', index=False)
+    return MetricsRegistry(str(tmp_path))
+
+def test_combined_memo_is_bounded(registry):
+    for runs in (['a', 'b'], ['b', 'c'], ['a', 'c'], None):
+        for clean in (False, True):
+            registry.snapshot(runs, clean)
+    assert len(registry._combined) == registry_module.COMBINED_MEMO_SIZE
+    # The most recently used subsets are the ones kept
+    assert list(registry._combined)[-1] == (('a', 'b', 'c'), True)
+
+def test_repeated_subset_is_served_from_the_memo(registry):
+    first, _ = registry.snapshot(['a', 'b'])
+    second, _ = registry.snapshot(['a', 'b'])
+    assert len(registry._combined) == 1
+    assert len(first) == len(second) == 400
+
+def test_tables_of_changed_runs_are_evicted(registry, tmp_path):
+    registry.snapshot(['a', 'b'])
+    registry.snapshot(['b', 'c'])
+    rows = pd.read_csv(tmp_path / 'metrics_a.csv').head(50)
+    rows.to_csv(tmp_path / 'metrics_a.csv', index=False)
+    os.utime(tmp_path / 'metrics_a.csv', ns=(0, 0))
+    frame, _ = registry.snapshot(['a', 'c'])
+    assert len(frame) == 250
+    assert set(registry._combined) == {(('b', 'c'), False), (('a', 'c'), False)}
@@ -0,0 +1,39 @@
+from utils.image_processor import TemplateResultCache
+
+def result(size):
+    return {"dimensions": {"width": 1, "height": 1}, "images": {"default": "x" * size}}
+
+def test_get_returns_a_copy_and_counts_hits():
+    cache = TemplateResultCache(max_bytes=1000)
+    cache.put("a", result(10))
+    first = cache.get("a")
+    first["images"]["default"] = "changed"
+    assert cache.get("a")["images"]["default"] == "x" * 10
+    assert cache.get("missing") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+
+def test_evicts_least_recently_used_within_byte_bound():
+    cache = TemplateResultCache(max_bytes=250)
+    for key in ("a", "b"):
+        cache.put(key, result(100))
+    # Touch "a" so "b" is the least recently used entry
+    cache.get("a")
+    cache.put("c", result(100))
+    assert cache.current_bytes <= cache.max_bytes
+    assert cache.peek("b") is None
+    assert cache.peek("a") is not None and cache.peek("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+def test_replacing_a_key_does_not_double_count():
+    cache = TemplateResultCache(max_bytes=1000)
+    cache.put("a", result(100))
+    cache.put("a", result(200))
+    assert cache.current_bytes == 200
+
+def test_results_larger_than_the_bound_are_not_stored():
+    cache = TemplateResultCache(max_bytes=50)
+    cache.put("small", result(10))
+    cache.put("big", result(100))
+    assert cache.peek("big") is None
+    assert cache.peek("small") is not None
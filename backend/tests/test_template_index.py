@@ -0,0 +1,39 @@
+import os
+import shutil
+
+import pytest
+
+from utils.template_index import TemplateIndex, template_index
+
+@pytest.fixture
+def source(tmp_path):
+    template_index.refresh()
+    shutil.copy(template_index.entries()[0]["path"], tmp_path / "a.png")
+    return tmp_path
+
+def test_refresh_reports_added_changed_and_removed(source):
+    index = TemplateIndex([str(source)])
+    assert index.refresh() == {"added": 1, "changed": 0, "removed": 0}
+    shutil.copy(source / "a.png", source / "b.png")
+    with open(source / "a.png", 'ab') as f:
+        f.write(b'\0')
+    os.remove(source / "b.png")
+    assert index.refresh() == {"added": 0, "changed": 1, "removed": 0}
+
+def test_lookup_without_revalidation_keeps_the_indexed_entry(source):
+    index = TemplateIndex([str(source)])
+    sha1 = index.get("a.png")["sha1"]
+    with open(source / "a.png", 'ab') as f:
+        f.write(b'\0')
+    assert index.get("a.png")["sha1"] == sha1
+
+def test_revalidating_lookup_picks_up_edits_and_removals(source):
+    index = TemplateIndex([str(source)])
+    index.revalidate_on_lookup()
+    entry = index.get("a.png")
+    with open(source / "a.png", 'ab') as f:
+        f.write(b'\0')
+    edited = index.by_path(entry["path"])
+    assert edited["sha1"] != entry["sha1"] and edited["size"] == entry["size"] + 1
+    os.remove(source / "a.png")
+    assert index.get("a.png") is None
@@ -0,0 +1,24 @@
+import pytest
+
+from app import app
+from utils.template_index import template_index
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+@pytest.fixture
+def template_filename():
+    return template_index.entries()[0]["filename"]
+
+def test_template_image_is_served_as_png(client, template_filename):
+    response = client.get(f'/api/template-images/{template_filename}/default_top?resolution=128')
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png'
+
+@pytest.mark.parametrize("path", ['unknown_variant', 'default_top?resolution=300', 'default_top?params=[1'])
+def test_bad_template_image_request_returns_400(client, template_filename, path):
+    assert client.get(f'/api/template-images/{template_filename}/{path}').status_code == 400
+
+def test_missing_template_image_returns_404(client):
+    assert client.get('/api/template-images/missing.png/default_top').status_code == 404
@@ -0,0 +1,61 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from utils import template_store
+from utils.template_store import TemplateFeatureStore, build_template_store, load_template_store
+from utils.template_index import template_index
+
+@pytest.fixture
+def small_store(tmp_path, monkeypatch):
+    template_index.refresh()
+    filenames = [entry["filename"] for entry in template_index.entries()[:2]]
+    monkeypatch.setattr(template_store, "list_template_files", lambda: filenames)
+    monkeypatch.setattr(template_store, "STORE_HEIGHTS", [128])
+    # load_template_store replaces the process-wide store
+    monkeypatch.setattr(template_store, "_store", template_store._store)
+    return str(tmp_path), filenames
+
+def data_files(store_dir):
+    return sorted(name for name in os.listdir(store_dir) if name.endswith('.bin'))
+
+def test_each_build_publishes_a_new_data_file_through_the_index(small_store):
+    store_dir, filenames = small_store
+    first = build_template_store(store_dir)
+    assert data_files(store_dir) == [first["data_file"]]
+
+    reader = TemplateFeatureStore(store_dir)
+    second = build_template_store(store_dir)
+    assert second["data_file"] != first["data_file"]
+    # The superseded data file is removed; a reader that mapped it keeps its views
+    assert data_files(store_dir) == [second["data_file"]]
+    bgr, gray = reader.get(filenames[0], height=128)
+    assert bgr.shape[0] == gray.shape[0] == 128
+
+    fresh = TemplateFeatureStore(store_dir)
+    np.testing.assert_array_equal(fresh.get(filenames[0], height=128)[1], gray)
+
+def test_index_and_data_of_different_builds_are_refused(small_store):
+    store_dir, _ = small_store
+    index = build_template_store(store_dir)
+    with open(os.path.join(store_dir, index["data_file"]), 'ab') as f:
+        f.write(b'\0' * 64)
+    with pytest.raises(ValueError):
+        TemplateFeatureStore(store_dir)
+    assert template_store.is_store_stale(store_dir)
+    assert load_template_store(store_dir) is None
+
+def test_store_without_a_named_data_file_is_stale(small_store):
+    store_dir, _ = small_store
+    build_template_store(store_dir)
+    index_path = os.path.join(store_dir, template_store.STORE_INDEX_FILE)
+    with open(index_path) as f:
+        index = json.load(f)
+    del index["data_file"]
+    with open(index_path, 'w') as f:
+        json.dump(index, f)
+    assert template_store.is_store_stale(store_dir)
+    with pytest.raises(ValueError):
+        TemplateFeatureStore(store_dir)
@@ -0,0 +1,186 @@
+import time
+import itertools
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from utils.image_processor import (
+    DEFAULT_RESOLUTION, check_processing_params, check_resolution, default_outputs, find_template_path, process_template_variants,
+    select_variants, store_template_variants, template_cache, to_base64_result
+)
+from utils.worker_pool import PoolBusyError, image_pool
+
+def expand_param_grid(param_grid):
+    """
+    Expand a processing_params grid into the list of concrete parameter sets
+    
+    Every leaf value that is a list is treated as an axis of the grid, e.g.
+    {"blur": {"kernel_size": [5, 10], "sigma": 2.0}} expands to two parameter
+    sets. A list of dicts is taken as an explicit list of parameter sets and
+    each element is expanded in turn.
+    
+    Args:
+        param_grid: Dict of technique -> params (leaf lists are grid axes),
+            a list of such dicts, or None
+    
+    Returns:
+        list: Concrete processing_params dicts
+    
+    Raises:
+        ValueError: If the grid is not built from technique -> params dicts
+    """
+    if param_grid is None:
+        return [None]
+    if isinstance(param_grid, list):
+        return [params for grid in param_grid for params in expand_param_grid(grid)]
+    if not isinstance(param_grid, dict):
+        raise ValueError("processing_params must be an object or a list of objects")
+    
+    axes = []
+    for technique, params in param_grid.items():
+        if not isinstance(params, dict):
+            raise ValueError(f"processing_params.{technique} must be an object")
+        for name, value in params.items():
+            values = value if isinstance(value, list) else [value]
+            axes.append([(technique, name, v) for v in values])
+    
+    combinations = []
+    for combo in itertools.product(*axes):
+        params = {technique: {} for technique in param_grid}
+        for technique, name, value in combo:
+            params[technique][name] = value
+        combinations.append(params)
+    return combinations
+
+def _process_uncached(template_filename, processing_params, outputs, resolution=DEFAULT_RESOLUTION):
+    # Runs in a worker process; the parent owns the result cache
+    return process_template_variants(
+        template_filename, processing_params, use_cache=False, outputs=outputs, resolution=resolution
+    )
+
+def _missing_outputs(cached, wanted):
+    """Return the outputs of wanted that a cache entry (or None) does not hold yet"""
+    return list(wanted) if cached is None else [name for name in wanted if name not in cached["images"]]
+
+def _merge_variants(cached, computed):
+    # Merge with the entry read before submitting, which may have been evicted since
+    if cached is None:
+        return computed
+    return {
+        "dimensions": computed["dimensions"],
+        "images": {**cached["images"], **computed["images"]},
+        "etags": {**cached["etags"], **computed["etags"]},
+    }
+
+def process_template_pooled(template_filename, processing_params=None, outputs=None, resolution=DEFAULT_RESOLUTION):
+    """
+    Return template variants, computing cache misses on the image worker pool
+    
+    On a partial cache hit only the missing outputs are computed, and merged
+    with the cached ones.
+    
+    Args:
+        template_filename: Filename of the template image
+        processing_params: Optional dict with parameters for different processing techniques
+        outputs: Optional list of variant names, see process_template_image
+        resolution: Template height, see process_template_image
+    
+    Returns:
+        dict: Result of process_template_variants for the requested outputs
+    
+    Raises:
+        ValueError: If the processing parameters are malformed or the resolution is unsupported
+        PoolBusyError: If the worker pool is saturated
+        JobTimeoutError: If the job does not finish within the pool's timeout
+    """
+    check_processing_params(processing_params)
+    if outputs is None:
+        outputs = default_outputs(processing_params)
+    resolution = check_resolution(resolution)
+    key = template_cache.make_key(find_template_path(template_filename), processing_params, resolution)
+    cached = template_cache.get(key)
+    if cached is not None and all(name in cached["images"] for name in outputs):
+        return select_variants(cached, outputs)
+    
+    computed = image_pool.run(
+        _process_uncached, template_filename, processing_params, _missing_outputs(cached, outputs), resolution
+    )
+    result = _merge_variants(cached, computed)
+    store_template_variants(key, result)
+    return select_variants(result, outputs)
+
+def process_templates_batch(template_filenames, param_grid=None, outputs=None, resolution=DEFAULT_RESOLUTION):
+    """
+    Process every (template, params) combination on the image worker pool
+    
+    Cached results are yielded immediately; the remaining jobs are submitted
+    as pool slots free up and yielded in completion order. Jobs running longer
+    than the pool's job timeout are reported as errors.
+    
+    Args:
+        template_filenames: List of template filenames
+        param_grid: processing_params grid, see expand_param_grid
+        outputs: Optional list of variant names to compute for every combination
+        resolution: Template height for every combination, see process_template_image
+    
+    Yields:
+        dict: One record per combination with its index, inputs and either
+            a "result" or an "error"
+    """
+    resolution = check_resolution(resolution)
+    param_sets = expand_param_grid(param_grid)
+    jobs = list(itertools.product(template_filenames, param_sets))
+    
+    queued = deque()
+    for index, (template_filename, params) in enumerate(jobs):
+        record = {"index": index, "template_filename": template_filename, "processing_params": params}
+        try:
+            check_processing_params(params)
+            key = template_cache.make_key(find_template_path(template_filename), params, resolution)
+        except (FileNotFoundError, ValueError) as e:
+            yield {**record, "error": str(e)}
+            continue
+        
+        wanted = outputs if outputs is not None else default_outputs(params)
+        result = template_cache.get(key)
+        if result is not None and all(name in result["images"] for name in wanted):
+            yield {**record, "result": to_base64_result(select_variants(result, wanted))}
+            continue
+        queued.append((record, key, wanted, result))
+    
+    pending = {}
+    while queued or pending:
+        # Fill free pool slots; the pool is shared, so stop as soon as it is full
+        while queued:
+            record, key, wanted, cached = queued[0]
+            try:
+                future = image_pool.submit(
+                    _process_uncached, record["template_filename"], record["processing_params"],
+                    _missing_outputs(cached, wanted), resolution
+                )
+            except PoolBusyError:
+                break
+            queued.popleft()
+            pending[future] = (record, key, wanted, cached, time.monotonic())
+        
+        if not pending:
+            # Saturated by other requests; wait for a slot
+            time.sleep(0.05)
+            continue
+        
+        done, _ = wait(pending, timeout=image_pool.job_timeout, return_when=FIRST_COMPLETED)
+        now = time.monotonic()
+        for future in list(pending):
+            record, key, wanted, cached, submitted = pending[future]
+            if future in done:
+                del pending[future]
+                try:
+                    result = _merge_variants(cached, future.result())
+                except Exception as e:
+                    yield {**record, "error": str(e)}
+                    continue
+                store_template_variants(key, result)
+                yield {**record, "result": to_base64_result(select_variants(result, wanted))}
+            elif now - submitted > image_pool.job_timeout:
+                del pending[future]
+                future.cancel()
+                yield {**record, "error": f"Image job did not finish within {image_pool.job_timeout}s"}
@@ -0,0 +1,295 @@
+"""
+Server-side rendering of the outlined bar-chart conditioning image
+
+Reproduces the Canny edge chart of the frontend's BarChart component: a black
+canvas with margins, a d3 band scale over the bars (with bar padding) and a
+niced linear y scale. Every bar gets the template's top edge crop, scaled by
+topEdgeWidthScale and centered at the top of the bar, and the bottom edge crop
+standing on the x axis. Anything below the x axis is covered black, as in the
+browser.
+
+The bar geometry of all requested scales is computed at once with NumPy, and
+each crop is resized once per scale and then pasted onto every bar. Pasting
+happens in SVG drawing order (top, bottom, next bar, ...), so overlapping
+crops occlude each other as they do in the browser.
+"""
+import math
+
+import cv2
+import numpy as np
+
+from utils.image_processor import DEFAULT_RESOLUTION, EDGE_TECHNIQUES, template_edge_crops
+from utils.instrumentation import stage
+
+# Chart layout of the frontend (chartStore defaults and BarChart margins)
+CHART_MARGIN = {'top': 20, 'right': 20, 'bottom': 40, 'left': 50}
+DEFAULT_CHART_SIZE = 512
+DEFAULT_BAR_PADDING = 0.05
+DEFAULT_TOP_EDGE_WIDTH_SCALE = 0.4
+
+# Edge technique names accepted besides EDGE_TECHNIQUES ('sparse' is the export filename name)
+TECHNIQUE_ALIASES = {'sparse': 'sparsification'}
+
+# Data presets of the frontend's dataStore
+DATA_LABELS = ['2020', '2021', '2022', '2023', '2024', '2025', '2026']
+SAMPLE_DATASETS = {
+    'basic': [30, 50, 20, 40, 70, 60, 80],
+    'rising': [10, 20, 35, 45, 60, 80, 95],
+    'falling': [90, 80, 65, 50, 35, 20, 10],
+    'wave': [50, 80, 30, 90, 20, 70, 40],
+}
+TREND_PRESETS = ('linear', 'exponential', 'logarithmic')
+# Number of data points the frontend's data count slider allows
+MIN_DATA_COUNT, MAX_DATA_COUNT = 3, 8
+
+def preset_data(trend, count):
+    """
+    Return the bars the frontend shows for a data preset
+
+    Fixed presets keep their last count points and generated trends are
+    recomputed for count points, as in dataStore.loadPresetData.
+
+    Args:
+        trend: Preset name, e.g. 'rising' or 'logarithmic'
+        count: Number of data points (clamped to MIN_DATA_COUNT..MAX_DATA_COUNT)
+
+    Returns:
+        tuple: (labels, values)
+
+    Raises:
+        ValueError: If the preset is unknown
+    """
+    count = max(MIN_DATA_COUNT, min(MAX_DATA_COUNT, int(count)))
+    if trend in SAMPLE_DATASETS:
+        values = SAMPLE_DATASETS[trend][-count:]
+        return DATA_LABELS[-len(values):], values
+    if trend not in TREND_PRESETS:
+        raise ValueError(f"Unknown data trend: {trend}")
+
+    values = []
+    for i in range(count):
+        if trend == 'linear':
+            values.append(math.floor(10 + (i * 90) / (count - 1)))
+        elif trend == 'exponential':
+            values.append(math.floor(10 * math.exp(3 * i / (count - 1))))
+        else:
+            values.append(math.floor(30 * math.log(10 * (i + 1) / count + 1)))
+    return [DATA_LABELS[i % len(DATA_LABELS)] for i in range(count)], values
+
+def _tick_increment(start, stop, count):
+    # d3-array tickIncrement: negative values are inverse steps
+    step = (stop - start) / max(0, count)
+    power = math.floor(math.log10(step))
+    error = step / 10 ** power
+    factor = 10 if error >= math.sqrt(50) else 5 if error >= math.sqrt(10) else 2 if error >= math.sqrt(2) else 1
+    if power >= 0:
+        return factor * 10 ** power
+    return -(10 ** -power) / factor
+
+def nice_domain(start, stop, count=10):
+    """Extend a domain to round tick values, as d3's scaleLinear().nice()"""
+    reverse = stop < start
+    if reverse:
+        start, stop = stop, start
+    previous = None
+    for _ in range(10):
+        if not stop > start:
+            break
+        step = _tick_increment(start, stop, count)
+        if step == previous:
+            break
+        if step > 0:
+            start, stop = math.floor(start / step) * step, math.ceil(stop / step) * step
+        elif step < 0:
+            start, stop = math.ceil(start * step) / step, math.floor(stop * step) / step
+        else:
+            break
+        previous = step
+    return (stop, start) if reverse else (start, stop)
+
+def parse_chart_spec(chart):
+    """
+    Validate a chart spec and fill in the frontend defaults
+
+    Args:
+        chart: Dict with "values" (bar heights) and optional "labels", or a
+            frontend data preset as "data_trend" and "data_count"; plus optional
+            "padding", "domain" ([min, max], either may be null for auto),
+            "width", "height" and "top_edge_width_scale"
+
+    Returns:
+        dict: The normalized spec
+
+    Raises:
+        ValueError: If the spec is malformed
+    """
+    if not isinstance(chart, dict):
+        raise ValueError("chart must be an object")
+    labels = chart.get('labels')
+    values = chart.get('values')
+    if values is None and chart.get('data_trend') is not None:
+        labels, values = preset_data(chart['data_trend'], chart.get('data_count', 5))
+    try:
+        values = [float(v) for v in values or []]
+    except (TypeError, ValueError):
+        raise ValueError("chart.values must be a list of numbers")
+    if not values:
+        raise ValueError("chart.values must not be empty")
+    labels = [str(label) for label in labels or DATA_LABELS[:len(values)]]
+    if len(labels) != len(values):
+        raise ValueError("chart.labels must have one label per value")
+
+    padding = _chart_number(chart, 'padding', DEFAULT_BAR_PADDING, float, "a number")
+    if not 0 <= padding < 1:
+        raise ValueError("chart.padding must be in [0, 1)")
+    domain = chart.get('domain') or [None, None]
+    if not isinstance(domain, list) or len(domain) != 2:
+        raise ValueError("chart.domain must be [min, max]")
+    try:
+        domain = [None if v is None else float(v) for v in domain]
+    except (TypeError, ValueError):
+        raise ValueError("chart.domain values must be numbers or null")
+    width = _chart_number(chart, 'width', DEFAULT_CHART_SIZE, int, "an integer")
+    height = _chart_number(chart, 'height', DEFAULT_CHART_SIZE, int, "an integer")
+    if width <= CHART_MARGIN['left'] + CHART_MARGIN['right'] or height <= CHART_MARGIN['top'] + CHART_MARGIN['bottom']:
+        raise ValueError("chart.width and chart.height must leave room for the margins")
+
+    return {
+        "values": values,
+        "labels": labels,
+        "padding": padding,
+        "domain": domain,
+        "width": width,
+        "height": height,
+        "top_edge_width_scale": _chart_number(chart, 'top_edge_width_scale', DEFAULT_TOP_EDGE_WIDTH_SCALE, float, "a number"),
+    }
+
+def _chart_number(chart, key, default, convert, description):
+    """Convert one numeric field of a chart spec, naming the field if it is malformed"""
+    try:
+        return convert(chart.get(key, default))
+    except (TypeError, ValueError):
+        raise ValueError(f"chart.{key} must be {description}")
+
+def bar_geometry(chart):
+    """
+    Compute the bars of a normalized chart spec in canvas pixels
+
+    Returns:
+        tuple: (centers, tops, axis_y): arrays with the horizontal center and
+            the top edge of every bar, and the y of the x axis
+    """
+    inner_width = chart["width"] - CHART_MARGIN['left'] - CHART_MARGIN['right']
+    inner_height = chart["height"] - CHART_MARGIN['top'] - CHART_MARGIN['bottom']
+    values = np.asarray(chart["values"], dtype=np.float64)
+
+    # d3.scaleBand().padding(p): equal inner and outer padding, centered; repeated labels share a band
+    bands = list(dict.fromkeys(chart["labels"]))
+    padding = chart["padding"]
+    step = inner_width / max(1, len(bands) - padding + 2 * padding)
+    start = (inner_width - step * (len(bands) - padding)) / 2
+    band_index = np.array([bands.index(label) for label in chart["labels"]])
+    centers = CHART_MARGIN['left'] + start + step * band_index + step * (1 - padding) / 2
+
+    # d3.scaleLinear().domain([min or 0, max or 1.1 * max value]).nice().range([innerHeight, 0])
+    low, high = chart["domain"]
+    low = 0.0 if low is None else low
+    high = values.max() * 1.1 if high is None else high
+    low, high = nice_domain(low, high)
+    span = (high - low) or 1.0
+    tops = CHART_MARGIN['top'] + inner_height * (1 - (values - low) / span)
+    return centers, tops, CHART_MARGIN['top'] + inner_height
+
+def _resize(crop, factor):
+    height, width = crop.shape[:2]
+    size = (max(1, round(width * factor)), max(1, round(height * factor)))
+    if size == (width, height):
+        return crop
+    # Area averaging when shrinking, as browsers smooth downscaled images
+    interpolation = cv2.INTER_AREA if factor < 1 else cv2.INTER_LINEAR
+    return cv2.resize(crop, size, interpolation=interpolation)
+
+def _paste(canvas, image, left, top):
+    # Opaque paste with clipping at the canvas border
+    height, width = image.shape[:2]
+    x0, y0 = max(left, 0), max(top, 0)
+    x1, y1 = min(left + width, canvas.shape[1]), min(top + height, canvas.shape[0])
+    if x0 < x1 and y0 < y1:
+        canvas[y0:y1, x0:x1] = image[y0 - top:y1 - top, x0 - left:x1 - left]
+
+def render_bar_charts(top_crop, bottom_crop, chart, scales=None):
+    """
+    Render the outlined bar chart for several top edge width scales
+
+    Args:
+        top_crop: Single-channel top edge crop of the template
+        bottom_crop: Single-channel bottom edge crop of the template
+        chart: Normalized chart spec, see parse_chart_spec
+        scales: Top edge width scales to render (default: the chart's own)
+
+    Returns:
+        list: One (height, width) uint8 image per scale
+    """
+    if scales is None:
+        scales = [chart["top_edge_width_scale"]]
+    centers, tops, axis_y = bar_geometry(chart)
+
+    # Crops are drawn with preserveAspectRatio "meet" inside a box widened by the scale,
+    # so they shrink uniformly by the scale and never grow past their natural size
+    factors = np.minimum(np.asarray(scales, dtype=np.float64), 1.0)
+    with stage('composite'):
+        images = []
+        for factor in factors:
+            top_image = _resize(top_crop, factor)
+            bottom_image = _resize(bottom_crop, factor)
+            top_lefts = np.rint(centers - top_image.shape[1] / 2).astype(int)
+            bottom_lefts = np.rint(centers - bottom_image.shape[1] / 2).astype(int)
+            top_ys = np.rint(tops).astype(int)
+            bottom_y = int(round(axis_y)) - bottom_image.shape[0]
+
+            canvas = np.zeros((chart["height"], chart["width"]), dtype=np.uint8)
+            for top_left, top_y, bottom_left in zip(top_lefts, top_ys, bottom_lefts):
+                _paste(canvas, top_image, top_left, top_y)
+                _paste(canvas, bottom_image, bottom_left, bottom_y)
+            # Black band over the x axis
+            canvas[int(round(axis_y)):] = 0
+            images.append(canvas)
+    return images
+
+def resolve_technique(technique):
+    """Map a technique name (including 'sparse') to its edge technique"""
+    technique = TECHNIQUE_ALIASES.get(technique, technique)
+    if technique not in EDGE_TECHNIQUES:
+        raise ValueError(f"Unknown technique: {technique}")
+    return technique
+
+def render_chart_images(template_filename, technique, processing_params, chart, scales=None,
+                        resolution=DEFAULT_RESOLUTION):
+    """
+    Render the conditioning images of a chart and encode them as PNG
+
+    Picklable entry point for the image worker pool.
+
+    Args:
+        template_filename: Filename of the template image
+        technique: Edge technique, see resolve_technique
+        processing_params: Optional dict with parameters for different processing techniques
+        chart: Chart spec, see parse_chart_spec
+        scales: Optional list of top edge width scales (default: the chart's own)
+        resolution: Template height the edge crops are taken from
+
+    Returns:
+        dict: "dimensions" and "images", a list of PNG bytes in the order of the scales
+
+    Raises:
+        ValueError: If the technique or chart spec is invalid
+        FileNotFoundError: If the template does not exist
+    """
+    chart = parse_chart_spec(chart)
+    top_crop, bottom_crop = template_edge_crops(
+        template_filename, processing_params, resolve_technique(technique), resolution
+    )
+    images = render_bar_charts(top_crop, bottom_crop, chart, scales)
+    with stage('encode'):
+        encoded = [cv2.imencode('.png', image)[1].tobytes() for image in images]
+    return {"dimensions": {"width": chart["width"], "height": chart["height"]}, "images": encoded}
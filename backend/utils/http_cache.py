@@ -0,0 +1,337 @@
+"""
+Response compression and conditional requests
+
+Three pieces, used by app.py and the analysis blueprint:
+    compress_response   after_request hook: gzip or brotli encodes text-like
+                        responses the client accepts, including streamed ones
+    add_default_etag    after_request hook: hashes the body of any other
+                        uncompressed GET response into an ETag and answers
+                        If-None-Match with 304
+    conditional         view decorator: checks ETag/Last-Modified validators
+                        derived from the inputs of a response (metrics file
+                        versions, template content hashes) before the view
+                        runs, so unchanged data is answered with 304 without
+                        redoing the work, and serves repeated requests from a
+                        byte-bounded cache of encoded bodies
+
+Derived validators are sent as strong ETags on identity bodies and weakened
+only when the body is gzip or brotli encoded, as the encoded bytes are not
+those the strong ETag names. If-None-Match uses weak comparison, so either form
+revalidates against the same validator.
+"""
+import os
+import gzip
+import zlib
+import hashlib
+import threading
+import functools
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import Response, make_response, request
+from werkzeug.http import is_resource_modified
+
+from utils.instrumentation import count_cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+# Compression levels for responses encoded per request (cached responses use the maximum)
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 5))
+# Upper bound on the bytes held by the response cache, over every stored encoding
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+COMPRESSIBLE_MIMETYPES = (
+    'application/json', 'application/x-ndjson', 'application/javascript', 'image/svg+xml',
+)
+
+def supported_encodings():
+    """Return the content codings this server can produce, in order of preference"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def negotiate_encoding(accept_encoding=None):
+    """
+    Pick the content coding for the current request
+
+    Args:
+        accept_encoding: Accept-Encoding value (default: the current request's)
+
+    Returns:
+        str: 'br', 'gzip' or None for identity
+    """
+    if accept_encoding is None:
+        accept_encoding = request.accept_encodings
+    best, best_quality = None, 0
+    for encoding in supported_encodings():
+        quality = accept_encoding[encoding]
+        # Brotli wins ties, as it is listed first
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def is_compressible(mimetype):
+    return bool(mimetype) and (mimetype.startswith('text/') or mimetype in COMPRESSIBLE_MIMETYPES)
+
+def compress(data, encoding, level=None):
+    """
+    Encode bytes with a content coding
+
+    Args:
+        data: Body to encode
+        encoding: 'br' or 'gzip'
+        level: Gzip level or brotli quality (default: GZIP_LEVEL / BROTLI_QUALITY)
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY if level is None else level)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL if level is None else level, mtime=0)
+
+def _compress_stream(chunks, encoding):
+    # Flush after every chunk so rows reach the client as they are produced
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        flush = compressor.flush
+        finish = compressor.finish
+        process = compressor.process
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+        process = compressor.compress
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = process(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+def _add_vary(response):
+    response.vary.add('Accept-Encoding')
+
+def compress_response(response):
+    """
+    Encode a response with the best content coding the client accepts
+
+    Registered as an after_request hook. Images, small bodies, file responses,
+    bodiless statuses and responses that are already encoded pass through.
+    Streamed responses are compressed chunk by chunk.
+    """
+    if not is_compressible(response.mimetype) or response.direct_passthrough:
+        return response
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return response
+    if response.headers.get('Content-Encoding'):
+        return response
+    _add_vary(response)
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+
+    # A strong ETag names exact bytes; the encoded body is only semantically equivalent
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def add_default_etag(response):
+    """
+    Give uncached GET responses a body-hash ETag and answer If-None-Match
+
+    Registered as an after_request hook so that routes without derived
+    validators (job status, template list, ...) still save the transfer when
+    nothing changed. Runs before compress_response.
+    """
+    if request.method not in ('GET', 'HEAD') or response.status_code != 200:
+        return response
+    if response.is_streamed or response.direct_passthrough or response.get_etag()[0]:
+        return response
+    response.add_etag()
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        # Echo the form of the ETag the client holds, weak if it got an encoded body
+        etag = response.get_etag()[0]
+        response.set_etag(etag, weak=request.if_none_match.is_weak(etag))
+    return response
+
+class ResponseCache:
+    """
+    LRU cache of response bodies, keyed by request path and query
+
+    Every entry holds the body for one ETag plus the encodings requested so
+    far, compressed once at the highest level. The sizes of all stored
+    encodings count towards max_bytes.
+    """
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> {"etag", "mimetype", "bodies": {encoding: bytes}}
+        self._bytes = 0
+
+    def get(self, key, etag):
+        """Return the entry stored for a key under an ETag, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["etag"] == etag:
+                self._entries.move_to_end(key)
+            else:
+                entry = None
+        count_cache('response', entry is not None)
+        return entry
+
+    def put(self, key, etag, mimetype, body):
+        """Store the identity body of a response and return its entry"""
+        entry = {"etag": etag, "mimetype": mimetype, "bodies": {None: body}}
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            self._evict()
+        return entry
+
+    def body(self, key, entry, encoding):
+        """Return an entry's body in an encoding, compressing and storing it on first use"""
+        bodies = entry["bodies"]
+        if encoding in bodies:
+            return bodies[encoding]
+        identity = bodies[None]
+        if len(identity) < COMPRESS_MIN_SIZE:
+            return None
+        encoded = compress(identity, encoding, level=11 if encoding == 'br' else 9)
+        with self._lock:
+            if self._entries.get(key) is entry and encoding not in bodies:
+                bodies[encoding] = encoded
+                self._bytes += len(encoded)
+                self._evict()
+        return encoded
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= sum(len(body) for body in entry["bodies"].values())
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._discard(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+response_cache = ResponseCache()
+
+def _cache_key():
+    args = tuple(sorted(request.args.items(multi=True)))
+    return (request.path, args)
+
+def http_date(seconds):
+    """Convert a POSIX timestamp to an aware datetime for Last-Modified"""
+    return datetime.fromtimestamp(int(seconds), tz=timezone.utc)
+
+def _apply_validators(response, etag, last_modified, control):
+    if response.status_code == 304:
+        # Echo the form of the ETag the client holds, weak if it got an encoded body
+        weak = request.if_none_match.is_weak(etag)
+    else:
+        weak = bool(response.headers.get('Content-Encoding'))
+    response.set_etag(etag, weak=weak)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    if control and 'Cache-Control' not in response.headers:
+        response.headers['Cache-Control'] = control
+    return response
+
+def _cached_response(key, entry):
+    encoding = negotiate_encoding()
+    body = response_cache.body(key, entry, encoding) if encoding else None
+    if body is None:
+        encoding, body = None, entry["bodies"][None]
+    response = Response(body, mimetype=entry["mimetype"])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    _add_vary(response)
+    return response
+
+def conditional(validators, cache_control='no-cache', cache=True):
+    """
+    Decorate a GET view with derived validators
+
+    The validators are computed before the view runs. If the client's
+    If-None-Match or If-Modified-Since still matches, the view is skipped and
+    304 is returned. Otherwise a 200 response is served from the response cache
+    when its ETag is current, or produced by the view and stored.
+
+    Args:
+        validators: Callable taking the view's arguments and returning
+            (etag, last_modified datetime or None), or None when the request
+            cannot be validated (the view then runs and reports the error)
+        cache_control: Cache-Control value for responses that do not set
+            their own, or a callable taking the view's arguments and returning it
+        cache: Store 200 responses in the response cache; streamed and file
+            responses are never stored, nor anything when the cache's
+            max_bytes is 0
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+            try:
+                current = validators(*args, **kwargs)
+            except (FileNotFoundError, ValueError):
+                current = None
+            if current is None:
+                return view(*args, **kwargs)
+            etag, last_modified = current
+            control = cache_control(*args, **kwargs) if callable(cache_control) else cache_control
+
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = Response(status=304)
+                _add_vary(response)
+                return _apply_validators(response, etag, last_modified, control)
+
+            # A zero budget disables the response cache
+            stored = cache and response_cache.max_bytes > 0
+            key = _cache_key() if stored else None
+            entry = response_cache.get(key, etag) if stored else None
+            if entry is not None:
+                return _apply_validators(_cached_response(key, entry), etag, last_modified, control)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            if stored and not response.is_streamed and not response.direct_passthrough:
+                entry = response_cache.put(key, etag, response.mimetype, response.get_data())
+                response = _cached_response(key, entry)
+            return _apply_validators(response, etag, last_modified, control)
+        return wrapper
+    return decorator
+
+def validator_hash(*parts):
+    """Hash the inputs of a response into an ETag value"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
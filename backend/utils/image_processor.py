@@ -4,6 +4,17 @@ from PIL import Image
 import io
 import base64
 import os
+import copy
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from utils.instrumentation import count_cache, stage
+from utils.template_index import template_index
+
+# Upper bound on the memory held by the template result cache (in bytes)
+TEMPLATE_CACHE_MAX_BYTES = int(os.environ.get('TEMPLATE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
 
 def resize_to_height(img, target_height=512):
     """
@@ -63,7 +74,298 @@ def process_image(file_stream):
         }
     }
 
-def process_template_image(template_filename, processing_params=None):
+# Template heights kept in the image pyramid; DEFAULT_RESOLUTION is the full-quality level
+PYRAMID_HEIGHTS = (128, 256, 512, 1024)
+DEFAULT_RESOLUTION = 512
+
+def load_template_image(template_path, target_height=512):
+    """
+    Decode a template image and resize it for processing
+    
+    Args:
+        template_path: Path of the template image on disk
+        target_height: The desired height (default: 512)
+    
+    Returns:
+        The resized BGR image
+    """
+    # Read the image using PIL instead of OpenCV
+    try:
+        with stage('decode'):
+            pil_img = Image.open(template_path)
+            # Convert PIL image to OpenCV format
+            img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
+        # Resize to target height
+        with stage('resize'):
+            return resize_to_height(img, target_height)
+    except Exception as e:
+        raise ValueError(f"Failed to read image: {template_path}. Error: {str(e)}")
+
+def load_template_pyramid(template_path, heights=PYRAMID_HEIGHTS):
+    """
+    Decode a template once and build its image pyramid
+    
+    Levels at or above DEFAULT_RESOLUTION are resized from the decoded image
+    (so the 512 px level matches load_template_image exactly); smaller levels
+    are Gaussian-downsampled from the level twice their height.
+    
+    Args:
+        template_path: Path of the template image on disk
+        heights: Level heights to return
+    
+    Returns:
+        dict: height -> BGR image
+    """
+    # Smaller levels need the chain of levels above them down from DEFAULT_RESOLUTION
+    needed = set(heights)
+    for height in heights:
+        while height < DEFAULT_RESOLUTION:
+            height *= 2
+            needed.add(height)
+    
+    try:
+        with stage('decode'):
+            pil_img = Image.open(template_path)
+            img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
+    except Exception as e:
+        raise ValueError(f"Failed to read image: {template_path}. Error: {str(e)}")
+    
+    levels = {}
+    with stage('resize'):
+        for height in sorted(needed, reverse=True):
+            if height < DEFAULT_RESOLUTION and height * 2 in levels:
+                levels[height] = cv2.pyrDown(levels[height * 2])
+            else:
+                levels[height] = resize_to_height(img, height)
+    return {height: levels[height] for height in heights}
+
+def check_resolution(resolution):
+    """Validate a requested template resolution, returning it as an int"""
+    try:
+        resolution = int(resolution)
+    except (TypeError, ValueError):
+        resolution = None
+    if resolution not in PYRAMID_HEIGHTS:
+        raise ValueError(f"Unsupported resolution. Use one of {list(PYRAMID_HEIGHTS)}")
+    return resolution
+
+# Largest Gaussian kernel accepted for the blur technique
+MAX_BLUR_KERNEL_SIZE = 99
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+# (technique, field) -> (check, message) for every processing parameter read by the pipeline
+_PARAM_CHECKS = {
+    ('threshold', 'lower'): (lambda v: _is_number(v) and v >= 0, "must be a non-negative number"),
+    ('threshold', 'upper'): (lambda v: _is_number(v) and v >= 0, "must be a non-negative number"),
+    ('sparsification', 'drop_rate'): (lambda v: _is_number(v) and 0 <= v <= 1, "must be a number from 0 to 1"),
+    ('sparsification', 'seed'): (lambda v: v is None or (_is_int(v) and v >= 0), "must be a non-negative integer"),
+    ('blur', 'kernel_size'): (
+        lambda v: _is_int(v) and 1 <= v <= MAX_BLUR_KERNEL_SIZE, f"must be an integer from 1 to {MAX_BLUR_KERNEL_SIZE}"
+    ),
+    ('blur', 'sigma'): (lambda v: _is_number(v) and v >= 0, "must be a non-negative number"),
+}
+
+def check_processing_params(processing_params):
+    """
+    Validate the types and ranges of processing parameters
+    
+    Args:
+        processing_params: Optional dict with parameters for different processing techniques
+    
+    Returns:
+        dict or None: processing_params, unchanged
+    
+    Raises:
+        ValueError: Naming the first malformed field, e.g. processing_params.blur.kernel_size
+    """
+    if processing_params is None:
+        return None
+    if not isinstance(processing_params, dict):
+        raise ValueError("processing_params must be an object")
+    for technique in {technique for technique, _ in _PARAM_CHECKS}:
+        params = processing_params.get(technique)
+        if params is None:
+            continue
+        if not isinstance(params, dict):
+            raise ValueError(f"processing_params.{technique} must be an object")
+        for (name, field), (check, message) in _PARAM_CHECKS.items():
+            if name == technique and field in params and not check(params[field]):
+                raise ValueError(f"processing_params.{technique}.{field} {message}")
+    return processing_params
+
+def find_template_path(template_filename):
+    """
+    Locate a template image on disk
+
+    Args:
+        template_filename: Filename of the template image in the public/templates directory
+
+    Returns:
+        str: Absolute path of the template file
+
+    Raises:
+        FileNotFoundError: If the template is not in the template index
+    """
+    entry = template_index.get(template_filename)
+    if entry is None:
+        # The template may have been added since the last scan; rescan once before giving up
+        template_index.refresh()
+        entry = template_index.get(template_filename)
+    if entry is None:
+        raise FileNotFoundError(f"Template image not found: {template_filename}")
+    return entry["path"]
+
+class TemplateResultCache:
+    """
+    Bounded LRU cache for process_template_image results
+
+    Entries are keyed on the SHA-1 of the template file contents plus the
+    canonicalized processing parameters, and evicted least-recently-used first
+    once the total size of the cached PNG payloads exceeds max_bytes.
+    File hashes are memoized per path on (mtime, size), so editing a template
+    on disk produces a new key and drops the entries of the previous version.
+    """
+
+    def __init__(self, max_bytes=TEMPLATE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (result, size)
+        self._file_hashes = {}  # path -> (mtime_ns, size, sha1)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def file_hash(self, path):
+        """Return the content hash of a file, rehashing only when its mtime or size changes"""
+        # Indexed templates are hashed by the template index, without touching the filesystem
+        entry = template_index.by_path(path)
+        if entry is not None:
+            return entry["sha1"]
+        
+        stat = os.stat(path)
+        with self._lock:
+            memo = self._file_hashes.get(path)
+        if memo and memo[0] == stat.st_mtime_ns and memo[1] == stat.st_size:
+            return memo[2]
+        
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        
+        with self._lock:
+            # Drop results computed from the previous version of this file
+            if memo and memo[2] != digest:
+                self._discard_hash(memo[2])
+            self._file_hashes[path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def make_key(self, path, processing_params, resolution=DEFAULT_RESOLUTION):
+        """Build the cache key for a template path, processing parameters and resolution"""
+        params_key = json.dumps(processing_params or {}, sort_keys=True, separators=(',', ':'))
+        return (self.file_hash(path), params_key, resolution)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                result = None
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                result = copy.deepcopy(entry[0])
+        count_cache('template', result is not None)
+        return result
+
+    def peek(self, key):
+        """Return an entry without touching the LRU order or the hit/miss counters"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return copy.deepcopy(entry[0]) if entry else None
+
+    def put(self, key, result):
+        size = _result_size(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (copy.deepcopy(result), size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._file_hashes.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Return hit/miss counters and current occupancy"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def discard_hash(self, digest):
+        """Drop every entry computed from the file with the given content hash"""
+        with self._lock:
+            self._discard_hash(digest)
+
+    def _discard_hash(self, digest):
+        # Caller must hold the lock
+        for key in [k for k in self._entries if k[0] == digest]:
+            self.current_bytes -= self._entries.pop(key)[1]
+
+def _result_size(result):
+    """Approximate the memory held by a result dict as the length of its byte and string payloads"""
+    size = 0
+    for value in result.values():
+        if isinstance(value, (bytes, str)):
+            size += len(value)
+        elif isinstance(value, dict):
+            size += _result_size(value)
+    return size
+
+# Shared result cache for process_template_image
+template_cache = TemplateResultCache()
+# Drop results of templates that are edited or removed on disk
+template_index.on_change(lambda entry: template_cache.discard_hash(entry["sha1"]))
+
+# Edge techniques that can be requested as outputs, and the crop suffixes of each
+EDGE_TECHNIQUES = ('default', 'sparsification', 'blur')
+EDGE_CROPS = ('', '_top', '_bottom')
+
+def default_outputs(processing_params=None):
+    """
+    Return the variants produced when a request does not name its outputs
+    
+    Args:
+        processing_params: Optional dict with parameters for different processing techniques
+    
+    Returns:
+        list: Variant names, matching the legacy /api/process-template response
+    """
+    techniques = ['default'] + [t for t in EDGE_TECHNIQUES[1:] if t in (processing_params or {})]
+    return ['original', 'grayscale'] + [t + crop for t in techniques for crop in EDGE_CROPS]
+
+def process_template_image(template_filename, processing_params=None, use_cache=True, outputs=None,
+                           resolution=DEFAULT_RESOLUTION):
     """
     Process a template image file with Canny edge detection and additional processing techniques
     
@@ -71,159 +373,348 @@ def process_template_image(template_filename, processing_params=None):
         template_filename: Filename of the template image in the public/templates directory
         processing_params: Optional dict with parameters for different processing techniques
             - threshold: Dict with lower and upper thresholds for Canny
-            - sparsification: Dict with drop rate
+            - sparsification: Dict with drop rate and optional seed (default: derived from
+              the template contents and the parameters, so results are reproducible)
             - blur: Dict with kernel size and sigma
+        use_cache: Whether to serve and store the result in the shared template cache
+        outputs: Optional list of variant names to compute (e.g. ["blur_top", "default_bottom"]);
+            defaults to every variant implied by processing_params
+        resolution: Template height in pixels, one of PYRAMID_HEIGHTS; smaller
+            levels give cheap previews while parameters are being tweaked
     
     Returns:
         dict: Results of image processing with various techniques
     """
-    # Define all possible template paths
-    current_dir = os.path.dirname(os.path.abspath(__file__))  # utils directory
-    backend_dir = os.path.dirname(current_dir)  # backend directory
-    project_root = os.path.dirname(backend_dir)  # project root
-    
-    # List of potential paths to look for the template
-    potential_paths = [
-        os.path.join(project_root, 'public', 'templates', template_filename),
-        os.path.join(backend_dir, 'templates', template_filename),
-        os.path.join('public', 'templates', template_filename),
-        os.path.join('..', 'public', 'templates', template_filename),
-        os.path.join('..', '..', 'public', 'templates', template_filename),
-    ]
-    
-    # Try each path
-    template_path = None
-    for path in potential_paths:
-        if os.path.exists(path):
-            template_path = path
-            print(f"Found template at: {path}")
-            break
-    
-    if not template_path:
-        raise FileNotFoundError(f"Template image not found: {template_filename}. Tried paths: {potential_paths}")
+    return to_base64_result(
+        process_template_variants(template_filename, processing_params, use_cache, outputs, resolution)
+    )
+
+def process_template_variants(template_filename, processing_params=None, use_cache=True, outputs=None,
+                              resolution=DEFAULT_RESOLUTION):
+    """
+    Process a template image and return the raw PNG bytes of the requested variants
     
-    # Read the image using PIL instead of OpenCV
-    try:
-        pil_img = Image.open(template_path)
-        # Convert PIL image to OpenCV format
-        img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
-        # Resize to target height
-        img = resize_to_height(img, 512)
-    except Exception as e:
-        raise ValueError(f"Failed to read image: {template_path}. Error: {str(e)}")
+    Only the pipeline stages needed by the requested outputs are run. When the
+    cache already holds some of the variants, only the missing ones are computed
+    and merged into the cached entry.
     
-    # Convert to grayscale
-    gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    Args:
+        template_filename: Filename of the template image in the public/templates directory
+        processing_params: Optional dict with parameters for different processing techniques
+        use_cache: Whether to serve and store the result in the shared template cache
+        outputs: Optional list of variant names, see process_template_image
+        resolution: Template height, see process_template_image
     
-    # Apply Gaussian blur to reduce noise (optional step for better edge detection)
-    blurred = cv2.GaussianBlur(gray_img, (5, 5), 0)
-    
-    # Default processing: detect edges using standard Canny
-    edges = cv2.Canny(blurred, 50, 150)
-    
-    # Get the top and bottom parts of the edge image
-    height = edges.shape[0]
-    width = edges.shape[1]
-    top_height = int(height * 0.4)
-    bottom_start = int(height * 0.9)
-    
-    # Get the top and bottom edge sections (no scaling - handled in frontend)
-    top_edges = edges[:top_height, :]
-    bottom_edges = edges[bottom_start:, :]
-    
-    # Initialize result dictionary
-    result = {
-        "original_image": None,
-        "grayscale_image": None,
-        "edge_image": None,
-        "top_edge_image": None,
-        "bottom_edge_image": None,
-        "dimensions": {
-            "width": img.shape[1],
-            "height": img.shape[0],
-            "channels": img.shape[2] if len(img.shape) > 2 else 1
-        },
-        "processed_edges": {}
+    Returns:
+        dict: "dimensions", "images" (variant name -> PNG bytes) and
+            "etags" (variant name -> content hash of the PNG)
+    
+    Raises:
+        ValueError: If an output names an unknown variant, a processing parameter is
+            malformed or the resolution is unsupported
+    """
+    check_processing_params(processing_params)
+    if outputs is None:
+        outputs = default_outputs(processing_params)
+    for name in outputs:
+        _parse_variant(name)
+    resolution = check_resolution(resolution)
+    
+    template_path = find_template_path(template_filename)
+    
+    if not use_cache:
+        return _process_template_path(template_path, processing_params, outputs, resolution)
+    
+    key = template_cache.make_key(template_path, processing_params, resolution)
+    cached = template_cache.get(key)
+    if cached is not None and all(name in cached["images"] for name in outputs):
+        return select_variants(cached, outputs)
+    
+    missing = outputs if cached is None else [name for name in outputs if name not in cached["images"]]
+    computed = _process_template_path(template_path, processing_params, missing, resolution)
+    return select_variants(store_template_variants(key, computed), outputs)
+
+def template_edge_crops(template_filename, processing_params=None, technique='default',
+                        resolution=DEFAULT_RESOLUTION):
+    """
+    Return the top and bottom edge crops of a template as arrays
+    
+    Used to composite edges server-side without a PNG round trip.
+    
+    Args:
+        template_filename: Filename of the template image
+        processing_params: Optional dict with parameters for different processing techniques
+        technique: One of EDGE_TECHNIQUES
+        resolution: Template height, see process_template_image
+    
+    Returns:
+        tuple: (top, bottom) single-channel uint8 arrays, owned by the caller
+    
+    Raises:
+        ValueError: If the technique or resolution is unknown or a processing parameter is malformed
+    """
+    if technique not in EDGE_TECHNIQUES:
+        raise ValueError(f"Unknown technique: {technique}")
+    check_processing_params(processing_params)
+    resolution = check_resolution(resolution)
+    pipeline = _TemplatePipeline(find_template_path(template_filename), processing_params, resolution)
+    # Copy out of the thread's scratch buffers, which the next pipeline overwrites
+    return pipeline.crop(technique, '_top').copy(), pipeline.crop(technique, '_bottom').copy()
+
+def store_template_variants(key, variants):
+    """
+    Merge freshly computed variants into the cache entry for key
+    
+    Args:
+        key: Cache key from template_cache.make_key
+        variants: Result of _process_template_path
+    
+    Returns:
+        dict: The merged entry, holding every variant cached so far for key
+    """
+    cached = template_cache.peek(key)
+    if cached is not None:
+        variants = {
+            "dimensions": variants["dimensions"],
+            "images": {**cached["images"], **variants["images"]},
+            "etags": {**cached["etags"], **variants["etags"]},
+        }
+    template_cache.put(key, variants)
+    return variants
+
+def select_variants(variants, outputs):
+    """Restrict a variants dict to the requested outputs"""
+    return {
+        "dimensions": variants["dimensions"],
+        "images": {name: variants["images"][name] for name in outputs},
+        "etags": {name: variants["etags"][name] for name in outputs},
     }
+
+def to_base64_result(variants):
+    """
+    Convert raw template variants into the base64 JSON layout of process_template_image
     
-    # If processing parameters are provided, apply different techniques
-    if processing_params:
-        # 1. Edge sparsification
-        if 'sparsification' in processing_params:
-            params = processing_params['sparsification']
-            drop_rate = params.get('drop_rate', 0.3)
-            
-            # Create random mask with specified drop rate
-            mask = np.random.rand(*edges.shape) > drop_rate
-            sparse_edges = np.where(mask, edges, 0).astype(np.uint8)
-            
-            # Get top and bottom sections (no scaling - handled in frontend)
-            sparse_top = sparse_edges[:top_height, :]
-            sparse_bottom = sparse_edges[bottom_start:, :]
-            
-            # Encode all versions
-            _, buffer = cv2.imencode('.png', sparse_edges)
-            result["processed_edges"]["sparsification"] = base64.b64encode(buffer).decode('utf-8')
-            
-            _, top_buffer = cv2.imencode('.png', sparse_top)
-            result["processed_edges"]["sparsification_top"] = base64.b64encode(top_buffer).decode('utf-8')
-            
-            _, bottom_buffer = cv2.imencode('.png', sparse_bottom)
-            result["processed_edges"]["sparsification_bottom"] = base64.b64encode(bottom_buffer).decode('utf-8')
-        
-        # 2. Pre-smoothing with Gaussian blur
-        if 'blur' in processing_params:
-            params = processing_params['blur']
-            kernel_size = params.get('kernel_size', 5)
-            sigma = params.get('sigma', 1.0)
-            
-            # Ensure kernel size is odd
-            if kernel_size % 2 == 0:
-                kernel_size += 1
-            
-            # Apply Gaussian blur and then Canny
-            custom_blurred = cv2.GaussianBlur(gray_img, (kernel_size, kernel_size), sigma)
-            blur_edges = cv2.Canny(custom_blurred, 100, 200)
-            
-            # Get top and bottom sections (no scaling - handled in frontend)
-            blur_top = blur_edges[:top_height, :]
-            blur_bottom = blur_edges[bottom_start:, :]
-            
-            # Encode all versions
-            _, buffer = cv2.imencode('.png', blur_edges)
-            result["processed_edges"]["blur"] = base64.b64encode(buffer).decode('utf-8')
-            
-            _, top_buffer = cv2.imencode('.png', blur_top)
-            result["processed_edges"]["blur_top"] = base64.b64encode(top_buffer).decode('utf-8')
-            
-            _, bottom_buffer = cv2.imencode('.png', blur_bottom)
-            result["processed_edges"]["blur_bottom"] = base64.b64encode(bottom_buffer).decode('utf-8')
+    Args:
+        variants: Result of process_template_variants
+    
+    Returns:
+        dict: Base64 encoded images keyed as in the /api/process-template response;
+            variants that were not requested are None or absent
+    """
+    encoded = {name: base64.b64encode(data).decode('utf-8') for name, data in variants["images"].items()}
+    return {
+        "original_image": encoded.get("original"),
+        "grayscale_image": encoded.get("grayscale"),
+        "edge_image": encoded.get("default"),
+        "top_edge_image": encoded.get("default_top"),
+        "bottom_edge_image": encoded.get("default_bottom"),
+        "dimensions": variants["dimensions"],
+        "processed_edges": {
+            name: data for name, data in encoded.items() if name not in ("original", "grayscale")
+        }
+    }
+
+def _parse_variant(name):
+    """Split a variant name into (technique, crop), e.g. "blur_top" -> ("blur", "_top")"""
+    if name in ('original', 'grayscale'):
+        return name, ''
+    for crop in EDGE_CROPS[1:]:
+        if name.endswith(crop) and name[:-len(crop)] in EDGE_TECHNIQUES:
+            return name[:-len(crop)], crop
+    if name in EDGE_TECHNIQUES:
+        return name, ''
+    raise ValueError(f"Unknown output: {name}")
+
+def _encode_png(img):
+    with stage('encode'):
+        _, buffer = cv2.imencode('.png', img)
+        return buffer.tobytes()
+
+class _ScratchBuffers(threading.local):
+    """
+    Per-thread reusable arrays for the edge pipeline
     
-    # Convert original image to base64
-    _, original_buffer = cv2.imencode('.png', img)
-    result["original_image"] = base64.b64encode(original_buffer).decode('utf-8')
+    Buffers only grow, so after the largest template has been processed once a
+    worker runs the blur/Canny/mask stages without allocating full-size
+    intermediates. Views handed out under a name are overwritten by the next
+    request on the same thread.
+    """
+
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        size = int(np.prod(shape))
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.size < size or buffer.dtype != dtype:
+            buffer = self._buffers[name] = np.empty(size, dtype)
+        return buffer[:size].reshape(shape)
+
+_scratch = _ScratchBuffers()
+
+class _TemplatePipeline:
+    """
+    Lazily evaluated processing stages for one template
     
-    # Convert grayscale image to base64
-    _, gray_buffer = cv2.imencode('.png', gray_img)
-    result["grayscale_image"] = base64.b64encode(gray_buffer).decode('utf-8')
+    Each stage (decode -> resize -> gray -> blur -> canny -> crop -> encode) is
+    computed on first access and memoized, so outputs that share intermediates
+    (e.g. blur_top and blur_bottom) only run the shared stages once.
     
-    # Convert edge image to base64
-    _, edge_buffer = cv2.imencode('.png', edges)
-    edge_base64 = base64.b64encode(edge_buffer).decode('utf-8')
-    result["edge_image"] = edge_base64
+    Edge stages write into the thread's scratch buffers, so their arrays are
+    only valid until the next pipeline runs on this thread; callers must encode
+    the variants they need before returning.
+    """
+
+    def __init__(self, template_path, processing_params=None, resolution=DEFAULT_RESOLUTION):
+        self.template_path = template_path
+        self.params = processing_params or {}
+        self.resolution = resolution
+        self._stages = {}
+
+    def _stage(self, name, compute):
+        if name not in self._stages:
+            self._stages[name] = compute()
+        return self._stages[name]
+
+    def features(self):
+        # Zero-copy views from the precomputed feature store, if it holds this template
+        def compute():
+            from utils.template_store import get_template_store
+            store = get_template_store()
+            if store is None:
+                return None
+            return store.get(
+                os.path.basename(self.template_path), template_cache.file_hash(self.template_path), self.resolution
+            )
+        return self._stage('features', compute)
+
+    def image(self):
+        def compute():
+            features = self.features()
+            if features is not None:
+                return features[0]
+            if self.resolution == DEFAULT_RESOLUTION:
+                return load_template_image(self.template_path)
+            return load_template_pyramid(self.template_path, (self.resolution,))[self.resolution]
+        return self._stage('image', compute)
+
+    def gray(self):
+        def compute():
+            features = self.features()
+            if features is not None:
+                return features[1]
+            image = self.image()
+            with stage('gray'):
+                return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return self._stage('gray', compute)
+
+    def edges(self, technique):
+        return self._stage(f'edges:{technique}', lambda: getattr(self, f'_edges_{technique}')())
+
+    def _blurred(self, kernel_size, sigma):
+        # One blur buffer is shared by all techniques; it is consumed by Canny right away
+        gray = self.gray()
+        with stage('blur'):
+            return cv2.GaussianBlur(gray, (kernel_size, kernel_size), sigma, dst=_scratch.get('blurred', gray.shape))
+
+    def _edges_default(self):
+        # Apply Gaussian blur to reduce noise (optional step for better edge detection)
+        blurred = self._blurred(5, 0)
+        
+        # Default processing: detect edges using standard Canny
+        threshold = self.params.get('threshold', {})
+        with stage('canny'):
+            return cv2.Canny(
+                blurred, threshold.get('lower', 50), threshold.get('upper', 150),
+                edges=_scratch.get('edges:default', blurred.shape),
+            )
+
+    def _edges_sparsification(self):
+        edges = self.edges('default')
+        params = self.params.get('sparsification', {})
+        drop_rate = params.get('drop_rate', 0.3)
+        
+        # Draw the random mask as one byte per pixel; a pixel is kept when its
+        # byte is >= drop_rate * 256, so drop_rate is applied in steps of 1/256.
+        # Each request gets its own generator, seeded deterministically so the
+        # same template and parameters always give the same edge image
+        seed = params.get('seed')
+        with stage('sparsify'):
+            rng = np.random.default_rng(self.default_seed() if seed is None else seed)
+            mask = rng.integers(0, 256, size=edges.shape, dtype=np.uint8)
+            drop_below = int(round(drop_rate * 256))
+            cv2.threshold(mask, drop_below - 1, 255, cv2.THRESH_BINARY, dst=mask)
+            
+            # Canny edges are 0/255, so AND-ing with the 0/255 mask drops the masked pixels
+            return cv2.bitwise_and(edges, mask, dst=_scratch.get('edges:sparsification', edges.shape))
+
+    def default_seed(self):
+        """Derive the sparsification seed from the template contents and the processing parameters"""
+        file_hash, params_key, _ = template_cache.make_key(self.template_path, self.params)
+        return int.from_bytes(hashlib.sha1(f"{file_hash}:{params_key}".encode()).digest()[:8], 'big')
+
+    def _edges_blur(self):
+        params = self.params.get('blur', {})
+        kernel_size = params.get('kernel_size', 5)
+        sigma = params.get('sigma', 1.0)
+        
+        # Ensure kernel size is odd
+        if kernel_size % 2 == 0:
+            kernel_size += 1
+        
+        # Apply Gaussian blur and then Canny
+        custom_blurred = self._blurred(kernel_size, sigma)
+        with stage('canny'):
+            return cv2.Canny(custom_blurred, 100, 200, edges=_scratch.get('edges:blur', custom_blurred.shape))
+
+    def crop(self, technique, crop):
+        # Top and bottom sections of the edge image (no scaling - handled in frontend);
+        # row slices stay contiguous views, so they are PNG-encoded without a copy
+        edges = self.edges(technique)
+        height = edges.shape[0]
+        if crop == '_top':
+            return edges[:int(height * 0.4), :]
+        if crop == '_bottom':
+            return edges[int(height * 0.9):, :]
+        return edges
+
+    def variant(self, name):
+        technique, crop = _parse_variant(name)
+        if technique == 'original':
+            return self.image()
+        if technique == 'grayscale':
+            return self.gray()
+        return self.crop(technique, crop)
+
+    def dimensions(self):
+        img = self.image()
+        return {
+            "width": img.shape[1],
+            "height": img.shape[0],
+            "channels": img.shape[2] if len(img.shape) > 2 else 1
+        }
+
+def _process_template_path(template_path, processing_params=None, outputs=None, resolution=DEFAULT_RESOLUTION):
+    """
+    Run the edge detection pipeline on a resolved template path
     
-    # Convert top and bottom edge sections to base64
-    _, top_buffer = cv2.imencode('.png', top_edges)
-    top_edge_base64 = base64.b64encode(top_buffer).decode('utf-8')
-    result["top_edge_image"] = top_edge_base64
+    Args:
+        template_path: Path of the template image on disk
+        processing_params: Optional dict with parameters for different processing techniques
+        outputs: Optional list of variant names to compute, see process_template_image
+        resolution: Template height, one of PYRAMID_HEIGHTS
     
-    _, bottom_buffer = cv2.imencode('.png', bottom_edges)
-    bottom_edge_base64 = base64.b64encode(bottom_buffer).decode('utf-8')
-    result["bottom_edge_image"] = bottom_edge_base64
+    Returns:
+        dict: "dimensions", "images" (variant name -> PNG bytes) and "etags"
+    """
+    if outputs is None:
+        outputs = default_outputs(processing_params)
     
-    # Store default processed edges too
-    result["processed_edges"]["default"] = edge_base64
-    result["processed_edges"]["default_top"] = top_edge_base64
-    result["processed_edges"]["default_bottom"] = bottom_edge_base64
+    pipeline = _TemplatePipeline(template_path, processing_params, resolution)
+    images = {name: _encode_png(pipeline.variant(name)) for name in outputs}
     
-    return result
\ No newline at end of file
+    return {
+        "dimensions": pipeline.dimensions(),
+        "images": images,
+        "etags": {name: hashlib.sha1(data).hexdigest() for name, data in images.items()},
+    }
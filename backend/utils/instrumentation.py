@@ -0,0 +1,265 @@
+"""
+Request instrumentation and Prometheus metrics
+
+Hot paths wrap their work in stage("blur"), stage("metrics_load"), ...; each
+stage is observed into a latency histogram and attributed to the request being
+served, so every request can be logged with its per-stage breakdown. Image
+jobs run in worker processes: the pool ships the stage timings of each job back
+with its result (see ImageWorkerPool) and they are recorded in the parent.
+
+render_prometheus() renders all histograms, counters and registered collectors
+in the Prometheus text exposition format for the /api/metrics endpoint.
+Metrics live in the memory of each web process, and /api/metrics is answered by
+whichever gunicorn worker takes the request, so every sample carries a
+worker="<pid>" label: each worker's series stay monotonic across scrapes, and
+totals are summed over workers in the query (sum without (worker) (...)). A
+restarted worker starts new series under its new pid.
+
+SamplingProfiler is a dependency-free stack sampler that can be switched on
+for single requests to find hot spots under load; it writes collapsed stacks
+that flamegraph tools read directly.
+"""
+import os
+import sys
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from collections import Counter as _StackCounter
+
+logger = logging.getLogger('chart_outliner')
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))  # 1 KiB .. 256 MiB
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, rendered in Prometheus text format"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self, const_labels=()):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = list(const_labels) + list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(labels + [("le", repr(float(bound)))])} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(labels + [("le", "+Inf")])} {values[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {values[-2]}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {values[-1]}')
+        return lines
+
+class Counter:
+    """Monotonic counter with labels, rendered in Prometheus text format"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self, const_labels=()):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(list(const_labels) + list(zip(self.labelnames, key)))} {value}')
+        return lines
+
+STAGE_SECONDS = Histogram(
+    'chart_outliner_stage_seconds', 'Time spent in one processing stage', ['stage'],
+)
+REQUEST_SECONDS = Histogram(
+    'chart_outliner_request_seconds', 'HTTP request latency', ['method', 'endpoint', 'status'],
+)
+RESPONSE_BYTES = Histogram(
+    'chart_outliner_response_bytes', 'HTTP response payload size', ['endpoint'], buckets=SIZE_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    'chart_outliner_cache_requests_total', 'Lookups of in-process caches', ['cache', 'result'],
+)
+
+_metrics = [STAGE_SECONDS, REQUEST_SECONDS, RESPONSE_BYTES, CACHE_REQUESTS]
+_collectors = []
+
+def register_collector(collect):
+    """
+    Register a callable exporting current values at scrape time
+
+    Args:
+        collect: Callable returning a list of (name, type, help, [(labels dict, value), ...])
+    """
+    _collectors.append(collect)
+
+def render_prometheus():
+    """Render every metric of this process in the Prometheus text exposition format, labelled with its pid"""
+    worker = [('worker', str(os.getpid()))]
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render(worker))
+    for collect in _collectors:
+        for name, metric_type, documentation, samples in collect():
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(worker + sorted(labels.items()))} {value}')
+    return '\n'.join(lines) + '\n'
+
+_local = threading.local()
+
+def current_recorder():
+    """Return the stage list of the request being served on this thread, or None"""
+    return getattr(_local, 'recorder', None)
+
+def begin_recording():
+    """Attribute the stages run on this thread to a new request; returns its stage list"""
+    _local.recorder = []
+    return _local.recorder
+
+def end_recording():
+    _local.recorder = None
+
+@contextmanager
+def recording():
+    """Collect the stages run on this thread; yields the list of (stage, seconds)"""
+    previous = current_recorder()
+    _local.recorder = []
+    try:
+        yield _local.recorder
+    finally:
+        _local.recorder = previous
+
+@contextmanager
+def stage(name):
+    """Time a processing stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stages([(name, time.perf_counter() - start)], current_recorder())
+
+def record_stages(samples, recorder=None):
+    """
+    Observe stage timings, e.g. ones shipped back from a worker process
+
+    Args:
+        samples: List of (stage, seconds)
+        recorder: Request recorder to attribute the stages to
+    """
+    for name, seconds in samples:
+        STAGE_SECONDS.observe(seconds, stage=name)
+    if recorder is not None:
+        recorder.extend(samples)
+
+def run_recorded(fn, *args):
+    """Run fn in a worker process and return (result, stage timings)"""
+    with recording() as samples:
+        result = fn(*args)
+    return result, samples
+
+def count_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+def summarize_stages(samples):
+    """Total seconds per stage name"""
+    totals = {}
+    for name, seconds in samples:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return {name: round(seconds, 6) for name, seconds in totals.items()}
+
+# Directory receiving per-request profiles
+PROFILE_DIR = os.environ.get(
+    'PROFILE_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'profiles')
+)
+# Seconds between stack samples
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.002))
+
+class SamplingProfiler:
+    """
+    Periodically samples the stack of one thread
+
+    Runs on a daemon thread using sys._current_frames, so the profiled code is
+    not slowed down by tracing hooks. Stacks are counted in collapsed form
+    ("outer;inner;leaf count").
+    """
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.interval = interval
+        self.stacks = _StackCounter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def write(self, label, profile_dir=PROFILE_DIR):
+        """
+        Write the collapsed stacks to profile_dir
+
+        Returns:
+            str: Filename of the written profile
+        """
+        os.makedirs(profile_dir, exist_ok=True)
+        safe_label = ''.join(c if c.isalnum() or c in '-_' else '_' for c in label)
+        filename = f'{time.strftime("%Y%m%d-%H%M%S")}-{safe_label}-{os.getpid()}-{self.thread_id}.txt'
+        with open(os.path.join(profile_dir, filename), 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        return filename
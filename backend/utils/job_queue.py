@@ -0,0 +1,494 @@
+"""
+Persistent queue of export jobs
+
+An export job runs the full template x edge technique x data trend x data count
+x top edge width scale grid that ExportSection used to drive from the browser.
+Jobs and their items are stored in SQLite, so progress survives a restart: a
+runner thread claims a job, renders its unfinished items in parallel on the
+image worker pool and marks each item as it completes. When the process dies,
+the job's heartbeat goes stale and the next runner picks it up again, skipping
+items that are already done.
+
+Every item renders the outlined bar-chart conditioning image of its data
+trend, data count, top edge width scale and technique (see chart_renderer).
+Outputs are written to public/outputs using the export naming
+    {trend}-{count}-{technique}-{asset}-scale{scale}.png
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import tempfile
+import itertools
+import threading
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from utils.chart_renderer import MAX_DATA_COUNT, MIN_DATA_COUNT, preset_data, render_chart_images
+from utils.image_processor import check_processing_params, find_template_path
+from utils.instrumentation import logger
+from utils.worker_pool import PoolBusyError, image_pool
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_ROOT = os.path.dirname(BACKEND_DIR)
+
+# SQLite database holding jobs and their items
+JOB_DB_PATH = os.environ.get('JOB_DB_PATH', os.path.join(BACKEND_DIR, 'data', 'jobs.sqlite3'))
+# Directory receiving the rendered files
+JOB_OUTPUT_DIR = os.environ.get('JOB_OUTPUT_DIR', os.path.join(PROJECT_ROOT, 'public', 'outputs'))
+# Seconds between polls for new jobs while idle
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+# Seconds without a heartbeat after which a running job is taken over by another runner
+JOB_STALE_AFTER = float(os.environ.get('JOB_STALE_AFTER', 30))
+
+# Edge techniques accepted in job specs, mapped to their processed variant
+# ('sparse' is the name ExportSection uses in filenames)
+JOB_TECHNIQUES = {
+    'default': 'default',
+    'sparse': 'sparsification',
+    'sparsification': 'sparsification',
+    'blur': 'blur',
+}
+
+# Grid used for every axis a job spec leaves out
+DEFAULT_JOB_GRID = {
+    'data_trends': ['rising', 'falling', 'wave', 'logarithmic'],
+    'data_counts': [3, 4, 5, 6],
+    'techniques': ['default', 'sparse', 'blur'],
+    'scales': [0.4, 0.6, 0.8],
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    runner TEXT,
+    heartbeat REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL REFERENCES jobs(id),
+    idx INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    asset TEXT NOT NULL,
+    technique TEXT NOT NULL,
+    data_trend TEXT NOT NULL,
+    data_count INTEGER NOT NULL,
+    scale REAL NOT NULL,
+    status TEXT NOT NULL,
+    output TEXT,
+    error TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+def expand_job_items(spec):
+    """
+    Expand a job spec into its items
+
+    Args:
+        spec: Dict with "templates" (asset names, with or without .png) and
+            optional "techniques", "data_trends", "data_counts" and "scales"
+            lists (see DEFAULT_JOB_GRID) and "processing_params"
+
+    Returns:
+        list: One dict per item with its output "name", "asset", "technique",
+            "data_trend", "data_count" and "scale"
+
+    Raises:
+        ValueError: If the spec is malformed or names an unknown template or technique
+    """
+    if not isinstance(spec, dict) or not spec.get('templates'):
+        raise ValueError("No templates provided")
+
+    axes = {}
+    for axis, default in DEFAULT_JOB_GRID.items():
+        values = spec.get(axis, default)
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"{axis} must be a non-empty list")
+        # Repeated values would give two items the same output file
+        axes[axis] = list(dict.fromkeys(values))
+    for technique in axes['techniques']:
+        if technique not in JOB_TECHNIQUES:
+            raise ValueError(f"Unknown technique: {technique}")
+    for trend in axes['data_trends']:
+        preset_data(trend, 3)
+    check_processing_params(spec.get('processing_params'))
+    # preset_data clamps counts, so out-of-range counts would be named after charts that are never rendered
+    if not all(
+        isinstance(count, int) and not isinstance(count, bool) and MIN_DATA_COUNT <= count <= MAX_DATA_COUNT
+        for count in axes['data_counts']
+    ):
+        raise ValueError(f"data_counts must be integers from {MIN_DATA_COUNT} to {MAX_DATA_COUNT}")
+    if not all(isinstance(scale, (int, float)) and scale > 0 for scale in axes['scales']):
+        raise ValueError("scales must be positive numbers")
+
+    assets = []
+    for template in spec['templates']:
+        asset = os.path.splitext(template)[0]
+        try:
+            find_template_path(f"{asset}.png")
+        except FileNotFoundError:
+            raise ValueError(f"Template not found: {template}")
+        if asset not in assets:
+            assets.append(asset)
+
+    # Same loop order as ExportSection: trend, count, asset, scale, technique
+    items = []
+    for trend, count, asset, scale, technique in itertools.product(
+        axes['data_trends'], axes['data_counts'], assets, axes['scales'], axes['techniques']
+    ):
+        items.append({
+            "name": f"{trend}-{count}-{technique}-{asset}-scale{scale}",
+            "asset": asset,
+            "technique": technique,
+            "data_trend": trend,
+            "data_count": count,
+            "scale": scale,
+        })
+    return items
+
+def render_job_item(item, processing_params, output_path):
+    """
+    Render one job item and write it to output_path
+
+    Runs in an image worker process. The written image is the outlined bar
+    chart of the item's data preset with the edges of its technique.
+
+    Args:
+        item: Item dict with "asset", "technique", "data_trend", "data_count" and "scale"
+        processing_params: Optional dict with parameters for different processing techniques
+        output_path: Path of the PNG to write
+
+    Returns:
+        str: output_path
+    """
+    chart = {"data_trend": item["data_trend"], "data_count": item["data_count"]}
+    result = render_chart_images(
+        f"{item['asset']}.png", JOB_TECHNIQUES[item["technique"]], processing_params, chart, [item["scale"]]
+    )
+
+    # Write through a uniquely named temporary file, so a crash never leaves a truncated output
+    # behind and two runners rendering the same item never write into the same file
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(output_path)}.', suffix='.tmp',
+                                    dir=os.path.dirname(output_path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(result["images"][0])
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return output_path
+
+class JobStore:
+    """SQLite-backed storage of jobs and their items"""
+
+    def __init__(self, db_path=JOB_DB_PATH):
+        self.db_path = db_path
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        with self._lock:
+            if not self._initialized:
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+                conn = sqlite3.connect(self.db_path)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.executescript(SCHEMA)
+                conn.close()
+                self._initialized = True
+
+        # One short-lived connection per operation; SQLite serializes writers across processes
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create_job(self, spec):
+        """
+        Validate a job spec and queue the job
+
+        Returns:
+            dict: The new job, see get_job
+
+        Raises:
+            ValueError: If the spec is invalid
+        """
+        items = expand_job_items(spec)
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, status, spec, total, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, 'queued', json.dumps(spec), len(items), now, now),
+            )
+            conn.executemany(
+                'INSERT INTO job_items (job_id, idx, name, asset, technique, data_trend, data_count, scale, status) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(job_id, index, item["name"], item["asset"], item["technique"],
+                  item["data_trend"], item["data_count"], item["scale"], 'pending')
+                 for index, item in enumerate(items)],
+            )
+        return self.get_job(job_id)
+
+    def get_job(self, job_id, include_items=False):
+        """
+        Return a job's status and progress
+
+        Args:
+            job_id: Job id
+            include_items: Also return the status of every item
+
+        Returns:
+            dict or None: The job, or None if it does not exist
+        """
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = self._job_dict(row)
+            if include_items:
+                job["items"] = [
+                    {
+                        "index": item["idx"],
+                        "name": item["name"],
+                        "status": item["status"],
+                        "output": item["output"],
+                        "error": item["error"],
+                    }
+                    for item in conn.execute('SELECT * FROM job_items WHERE job_id = ? ORDER BY idx', (job_id,))
+                ]
+        return job
+
+    def list_jobs(self, limit=50):
+        """Return the most recent jobs, newest first"""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?', (limit,)).fetchall()
+        return [self._job_dict(row) for row in rows]
+
+    @staticmethod
+    def _job_dict(row):
+        finished = row["completed"] + row["failed"]
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "spec": json.loads(row["spec"]),
+            "total": row["total"],
+            "completed": row["completed"],
+            "failed": row["failed"],
+            "progress": finished / row["total"] if row["total"] else 1.0,
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def claim_next(self, runner_id):
+        """
+        Claim the oldest queued job, or a running job whose runner stopped sending heartbeats
+
+        Returns:
+            dict or None: The claimed job's id and spec
+        """
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, spec FROM jobs WHERE status = 'queued' "
+                "OR (status = 'running' AND (heartbeat IS NULL OR heartbeat < ?)) "
+                "ORDER BY created_at",
+                (now - JOB_STALE_AFTER,),
+            ).fetchall()
+            for row in rows:
+                # Conditional update so two runners can never claim the same job
+                claimed = conn.execute(
+                    "UPDATE jobs SET status = 'running', runner = ?, heartbeat = ?, updated_at = ? "
+                    "WHERE id = ? AND (status = 'queued' "
+                    "OR (status = 'running' AND (heartbeat IS NULL OR heartbeat < ?)))",
+                    (runner_id, now, now, row["id"], now - JOB_STALE_AFTER),
+                ).rowcount
+                if claimed:
+                    return {"id": row["id"], "spec": json.loads(row["spec"])}
+        return None
+
+    def heartbeat(self, job_id, runner_id):
+        """Refresh the claim on a job; returns False if another runner took it over"""
+        with self._connect() as conn:
+            return conn.execute(
+                'UPDATE jobs SET heartbeat = ? WHERE id = ? AND runner = ?',
+                (time.time(), job_id, runner_id),
+            ).rowcount == 1
+
+    def pending_items(self, job_id):
+        """Return the items of a job that have not finished yet"""
+        with self._connect() as conn:
+            return [
+                dict(row) for row in conn.execute(
+                    "SELECT idx, name, asset, technique, data_trend, data_count, scale FROM job_items "
+                    "WHERE job_id = ? AND status = 'pending' ORDER BY idx",
+                    (job_id,),
+                )
+            ]
+
+    def finish_item(self, job_id, index, output=None, error=None):
+        """Record the result of one item and update the job's counters"""
+        status = 'failed' if error is not None else 'done'
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE job_items SET status = ?, output = ?, error = ? "
+                "WHERE job_id = ? AND idx = ? AND status = 'pending'",
+                (status, output, error, job_id, index),
+            ).rowcount
+            if updated:
+                column = 'failed' if error is not None else 'completed'
+                conn.execute(
+                    f'UPDATE jobs SET {column} = {column} + 1, heartbeat = ?, updated_at = ? WHERE id = ?',
+                    (time.time(), time.time(), job_id),
+                )
+
+    def finish_job(self, job_id, runner_id):
+        """Mark a job as completed once none of its items are pending"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'completed', runner = NULL, heartbeat = NULL, updated_at = ? "
+                "WHERE id = ? AND runner = ? AND NOT EXISTS "
+                "(SELECT 1 FROM job_items WHERE job_id = ? AND status = 'pending')",
+                (time.time(), job_id, runner_id, job_id),
+            )
+
+class JobRunner:
+    """
+    Background thread executing queued jobs on the image worker pool
+
+    Items are submitted as pool slots free up, so a running job never starves
+    the interactive routes sharing the pool of more than its free capacity.
+    When several server processes share the job database (gunicorn workers),
+    only the one holding the runner lock file next to it runs jobs; the others
+    wait and take over if that process exits.
+    """
+
+    def __init__(self, store, pool=image_pool, output_dir=JOB_OUTPUT_DIR):
+        self.store = store
+        self.pool = pool
+        self.output_dir = output_dir
+        self.runner_id = uuid.uuid4().hex
+        self._thread = None
+        self._lock_file = None
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+
+    def start(self):
+        """Start the runner thread; unfinished jobs from a previous run are resumed"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='job-runner', daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        """Wake the runner up after a job was queued"""
+        self._wakeup.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def _acquire_runner_lock(self):
+        """Wait until this process holds the runner lock; False if stopped first"""
+        if fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(self.store.db_path) or '.', exist_ok=True)
+        self._lock_file = open(self.store.db_path + '.runner.lock', 'a')
+        while not self._stop.is_set():
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                self._stop.wait(JOB_POLL_INTERVAL)
+        return False
+
+    def _run(self):
+        if not self._acquire_runner_lock():
+            return
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim_next(self.runner_id)
+                if job is not None:
+                    self._run_job(job)
+                    continue
+            except Exception as e:
+                logger.error(f"Job runner error: {str(e)}")
+            self._wakeup.wait(JOB_POLL_INTERVAL)
+            self._wakeup.clear()
+        if self._lock_file is not None:
+            # Closing the file releases the lock for a waiting process
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _run_job(self, job):
+        job_id = job["id"]
+        processing_params = job["spec"].get("processing_params")
+        queued = self.store.pending_items(job_id)
+        logger.info(f"Running job {job_id}: {len(queued)} items left")
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        pending = {}
+        while queued or pending:
+            if self._stop.is_set() or not self.store.heartbeat(job_id, self.runner_id):
+                # Stopping, or the job was taken over; unfinished items stay pending
+                for future in pending:
+                    future.cancel()
+                return
+
+            while queued:
+                item = queued[0]
+                output_path = os.path.join(self.output_dir, f"{item['name']}.png")
+                try:
+                    future = self.pool.submit(render_job_item, item, processing_params, output_path)
+                except PoolBusyError:
+                    break
+                queued.pop(0)
+                pending[future] = (item, time.monotonic())
+
+            if not pending:
+                time.sleep(0.05)
+                continue
+
+            done, _ = wait(pending, timeout=self.pool.job_timeout, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future in list(pending):
+                item, submitted = pending[future]
+                if future in done:
+                    del pending[future]
+                    try:
+                        output_path = future.result()
+                    except Exception as e:
+                        self.store.finish_item(job_id, item["idx"], error=str(e))
+                        continue
+                    self.store.finish_item(job_id, item["idx"], output=os.path.basename(output_path))
+                elif now - submitted > self.pool.job_timeout:
+                    del pending[future]
+                    future.cancel()
+                    self.store.finish_item(
+                        job_id, item["idx"], error=f"Image job did not finish within {self.pool.job_timeout}s"
+                    )
+
+        self.store.finish_job(job_id, self.runner_id)
+        logger.info(f"Job {job_id} finished")
+
+# Shared job store and runner of this process
+job_store = JobStore()
+job_runner = JobRunner(job_store)
@@ -0,0 +1,183 @@
+"""
+Pre-resolved index of template files
+
+Maps each template filename to its absolute path, original dimensions,
+content hash and modification time. The index is built once at startup and
+refreshed on demand or by a polling watcher thread, so resolving a template on
+the request path is a dictionary lookup without any filesystem calls.
+Refreshing only re-reads files whose size or mtime changed.
+
+Only the web process polls. Image pool workers call revalidate_on_lookup()
+instead: they rescan when a template is not indexed, and stat the file of every
+entry they look up, so an edited template is never processed under its old
+content hash.
+"""
+import os
+import time
+import hashlib
+import threading
+
+from PIL import Image
+
+from utils.instrumentation import logger
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_ROOT = os.path.dirname(BACKEND_DIR)
+
+# Directories holding templates, in lookup priority order
+TEMPLATE_SOURCE_DIRS = [
+    os.path.join(PROJECT_ROOT, 'public', 'templates'),
+    os.path.join(BACKEND_DIR, 'templates'),
+]
+
+# Seconds between watcher scans for added, removed or edited templates (0 disables the watcher)
+TEMPLATE_INDEX_POLL = float(os.environ.get('TEMPLATE_INDEX_POLL', 5))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+
+def _read_entry(path, stat):
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    try:
+        # Only the header is read to get the size
+        with Image.open(path) as img:
+            width, height = img.size
+    except Exception:
+        width = height = None
+    return {
+        "filename": os.path.basename(path),
+        "name": os.path.splitext(os.path.basename(path))[0],
+        "path": path,
+        "width": width,
+        "height": height,
+        "sha1": digest,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+class TemplateIndex:
+    """
+    Template filename -> file metadata, rebuilt incrementally by refresh()
+
+    Listeners registered with on_change are called with the previous entry of
+    every template that was edited or removed, so caches keyed on its content
+    hash can drop stale results.
+    """
+
+    def __init__(self, source_dirs=TEMPLATE_SOURCE_DIRS):
+        self.source_dirs = source_dirs
+        self._entries = {}   # filename -> entry
+        self._by_path = {}   # absolute path -> entry
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._watcher = None
+        self._loaded = False
+        self._revalidate = False
+
+    def refresh(self):
+        """
+        Rescan the source directories
+
+        Returns:
+            dict: Counts of "added", "changed" and "removed" templates
+        """
+        with self._lock:
+            previous = self._entries
+
+        entries = {}
+        counts = {"added": 0, "changed": 0, "removed": 0}
+        for directory in self.source_dirs:
+            if not os.path.isdir(directory):
+                continue
+            for filename in sorted(os.listdir(directory)):
+                # Earlier directories take priority, as in the former path probing
+                if not filename.lower().endswith(IMAGE_EXTENSIONS) or filename in entries:
+                    continue
+                path = os.path.abspath(os.path.join(directory, filename))
+                stat = os.stat(path)
+                old = previous.get(filename)
+                if old and old["path"] == path and old["mtime_ns"] == stat.st_mtime_ns and old["size"] == stat.st_size:
+                    entries[filename] = old
+                    continue
+                entries[filename] = _read_entry(path, stat)
+                counts["changed" if old else "added"] += 1
+
+        stale = [old for filename, old in previous.items()
+                 if filename not in entries or entries[filename]["sha1"] != old["sha1"]]
+        counts["removed"] = sum(1 for filename in previous if filename not in entries)
+
+        with self._lock:
+            self._entries = entries
+            self._by_path = {entry["path"]: entry for entry in entries.values()}
+            self._loaded = True
+            listeners = list(self._listeners)
+        for entry in stale:
+            for listener in listeners:
+                listener(entry)
+        return counts
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.refresh()
+
+    def get(self, template_filename):
+        """Return the entry of a template, or None if it is not indexed"""
+        self._ensure_loaded()
+        return self._current(self._entries.get(template_filename), lambda: self._entries.get(template_filename))
+
+    def by_path(self, path):
+        """Return the entry of an indexed absolute path, or None"""
+        self._ensure_loaded()
+        return self._current(self._by_path.get(path), lambda: self._by_path.get(path))
+
+    def revalidate_on_lookup(self):
+        """Check the file of every entry looked up, for processes that do not run the watcher"""
+        self._revalidate = True
+
+    def _current(self, entry, lookup):
+        if not self._revalidate or entry is None:
+            return entry
+        try:
+            stat = os.stat(entry["path"])
+            if stat.st_mtime_ns == entry["mtime_ns"] and stat.st_size == entry["size"]:
+                return entry
+        except OSError:
+            pass
+        self.refresh()
+        return lookup()
+
+    def entries(self):
+        """Return all entries sorted by filename"""
+        self._ensure_loaded()
+        entries = self._entries
+        return [entries[filename] for filename in sorted(entries)]
+
+    def on_change(self, listener):
+        """Register a callback for edited or removed templates"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def start_watcher(self, interval=TEMPLATE_INDEX_POLL):
+        """Refresh the index every interval seconds on a daemon thread"""
+        if interval <= 0 or self._watcher is not None:
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    counts = self.refresh()
+                    if any(counts.values()):
+                        logger.info(f"Template index updated: {counts}")
+                except Exception as e:
+                    logger.error(f"Template index refresh failed: {str(e)}")
+
+        self._watcher = threading.Thread(target=watch, name='template-index-watcher', daemon=True)
+        self._watcher.start()
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._entries)
+
+# Shared index of this process
+template_index = TemplateIndex()
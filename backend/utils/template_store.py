@@ -0,0 +1,312 @@
+"""
+Precomputed template feature store
+
+Decoding and resizing a template PNG dominates the cost of a cold
+process_template_image call. The build step below writes the BGR and grayscale
+arrays of every level of each template's image pyramid (128 to 1024 px) into
+one flat binary file, with a JSON index of byte offsets next to it. The loader memory-maps that file, so request
+handlers get read-only, zero-copy views and forked workers share the pages.
+
+Every build writes a new data file (features-<build id>.bin) and names it in
+the index, so publishing the index is the only step readers can observe: an
+index is never paired with the data of another build.
+
+Usage (from the backend directory):
+    python -m utils.template_store build
+    python -m utils.template_store info
+"""
+import os
+import sys
+import json
+import uuid
+import tempfile
+import threading
+import contextlib
+
+import cv2
+import numpy as np
+
+from utils.image_processor import DEFAULT_RESOLUTION, PYRAMID_HEIGHTS, find_template_path, load_template_pyramid
+from utils.template_index import template_index
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Location of the flat array file and its offset index
+TEMPLATE_STORE_DIR = os.environ.get('TEMPLATE_STORE_DIR', os.path.join(BACKEND_DIR, 'data', 'template_store'))
+STORE_DATA_PREFIX = 'features'
+STORE_INDEX_FILE = 'index.json'
+STORE_LOCK_FILE = '.build.lock'
+
+# Pyramid levels written to the store; requests for other levels decode from disk
+STORE_HEIGHTS = [
+    int(height) for height in os.environ.get('TEMPLATE_STORE_HEIGHTS', ','.join(map(str, PYRAMID_HEIGHTS))).split(',')
+]
+
+# Offsets are aligned so every array view starts on a cache line
+_ALIGNMENT = 64
+
+class TemplateFeatureStore:
+    """
+    Read-only view over a built feature store
+    
+    Entries are validated against the content hash of the source template, so
+    a template edited after the build falls back to decoding from disk.
+    """
+
+    def __init__(self, store_dir=TEMPLATE_STORE_DIR):
+        """
+        Raises:
+            FileNotFoundError: If the index or the data file it names is missing
+            ValueError: If the index names no data file or the file's size differs from the index
+        """
+        with open(os.path.join(store_dir, STORE_INDEX_FILE)) as f:
+            self.index = json.load(f)
+        if "data_file" not in self.index:
+            raise ValueError("Template feature store index names no data file; rebuild the store")
+        data_path = os.path.join(store_dir, self.index["data_file"])
+        size = os.path.getsize(data_path)
+        if size != self.index["data_size"]:
+            raise ValueError(
+                f"{self.index['data_file']} holds {size} bytes but its index expects {self.index['data_size']}"
+            )
+        if size > 0:
+            self._data = np.memmap(data_path, dtype=np.uint8, mode='r')
+        else:
+            self._data = np.zeros(0, dtype=np.uint8)
+
+    def get(self, template_filename, file_hash=None, height=DEFAULT_RESOLUTION):
+        """
+        Return zero-copy (bgr, gray) views for one pyramid level of a template
+        
+        Args:
+            template_filename: Filename of the template image
+            file_hash: Optional content hash of the current template file;
+                the entry is ignored if it was built from a different version
+            height: Pyramid level
+        
+        Returns:
+            tuple: (bgr, gray) read-only uint8 arrays, or None if not stored
+        """
+        entry = self.index["templates"].get(template_filename)
+        if entry is None or (file_hash is not None and entry["sha1"] != file_hash):
+            return None
+        # Stores built before the pyramid have no levels and are treated as empty
+        entry = entry.get("levels", {}).get(str(height))
+        if entry is None:
+            return None
+        
+        height, width = entry["height"], entry["width"]
+        bgr = self._data[entry["bgr_offset"]:entry["bgr_offset"] + height * width * 3].reshape(height, width, 3)
+        gray = self._data[entry["gray_offset"]:entry["gray_offset"] + height * width].reshape(height, width)
+        return bgr, gray
+
+    def __contains__(self, template_filename):
+        return template_filename in self.index["templates"]
+
+    def __len__(self):
+        return len(self.index["templates"])
+
+def list_template_files():
+    """
+    Return the filenames of all templates in the source directories
+    
+    Returns:
+        list: Sorted unique template filenames
+    """
+    template_index.refresh()
+    return [entry["filename"] for entry in template_index.entries()]
+
+@contextlib.contextmanager
+def _build_lock(store_dir):
+    # Serialize builds across processes (e.g. several web workers starting at once)
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, STORE_LOCK_FILE), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _write_temp(store_dir, name, write):
+    """Write a file under a unique temporary name in store_dir and return its path"""
+    fd, path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=store_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        # mkstemp creates owner-only files; the store is read like any other data file
+        os.chmod(path, 0o644)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+def build_template_store(store_dir=TEMPLATE_STORE_DIR):
+    """
+    Decode every template and write its arrays into the feature store
+    
+    The data file is written under a name unique to this build, then the index
+    naming it is swapped in with os.replace while holding the build lock, so
+    readers see either the previous store or the new one, never a mix.
+    Data files of previous builds are removed afterwards; processes that
+    already mapped one keep reading it until they reload.
+    
+    Args:
+        store_dir: Directory to write the store into
+    
+    Returns:
+        dict: The written index
+    """
+    with _build_lock(store_dir):
+        return _build_template_store(store_dir)
+
+def _build_template_store(store_dir):
+    data_file = f'{STORE_DATA_PREFIX}-{uuid.uuid4().hex[:12]}.bin'
+    index = {"heights": STORE_HEIGHTS, "data_file": data_file, "templates": {}}
+    offset = 0
+    
+    def write_data(data_file):
+        nonlocal offset
+        for template_filename in list_template_files():
+            template_path = find_template_path(template_filename)
+            try:
+                pyramid = load_template_pyramid(template_path, STORE_HEIGHTS)
+            except ValueError as e:
+                print(f"Skipping template {template_filename}: {e}")
+                continue
+            indexed = template_index.get(template_filename)
+            
+            entry = {
+                "sha1": indexed["sha1"],
+                "mtime_ns": indexed["mtime_ns"],
+                "size": indexed["size"],
+                "levels": {},
+            }
+            for level, bgr in pyramid.items():
+                bgr = np.ascontiguousarray(bgr)
+                gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+                level_entry = {"height": bgr.shape[0], "width": bgr.shape[1]}
+                for name, array in (("bgr", bgr), ("gray", gray)):
+                    padding = -offset % _ALIGNMENT
+                    data_file.write(b'\0' * padding)
+                    offset += padding
+                    level_entry[f"{name}_offset"] = offset
+                    data_file.write(array.tobytes())
+                    offset += array.nbytes
+                entry["levels"][str(level)] = level_entry
+            index["templates"][template_filename] = entry
+    
+    data_tmp = _write_temp(store_dir, data_file, write_data)
+    index["data_size"] = offset
+    try:
+        index_tmp = _write_temp(store_dir, STORE_INDEX_FILE, lambda f: f.write(json.dumps(index, indent=2).encode()))
+    except BaseException:
+        os.unlink(data_tmp)
+        raise
+    # The data file is new and unreferenced until the index is replaced
+    os.replace(data_tmp, os.path.join(store_dir, data_file))
+    os.replace(index_tmp, os.path.join(store_dir, STORE_INDEX_FILE))
+    _remove_superseded(store_dir, data_file)
+    print(f"Built template feature store with {len(index['templates'])} templates ({offset} bytes)")
+    return index
+
+def _remove_superseded(store_dir, data_file):
+    """Delete the data files of previous builds"""
+    for name in os.listdir(store_dir):
+        if name.startswith(STORE_DATA_PREFIX) and name.endswith('.bin') and name != data_file:
+            try:
+                os.unlink(os.path.join(store_dir, name))
+            except FileNotFoundError:
+                pass
+
+def is_store_stale(store_dir=TEMPLATE_STORE_DIR):
+    """
+    Check whether the store is missing or out of date with the template files
+    
+    Only file sizes and modification times are compared, so the check does not
+    read any image data.
+    """
+    index_path = os.path.join(store_dir, STORE_INDEX_FILE)
+    if not os.path.exists(index_path):
+        return True
+    with open(index_path) as f:
+        index = json.load(f)
+    if index.get("heights") != STORE_HEIGHTS or "data_file" not in index:
+        return True
+    data_path = os.path.join(store_dir, index["data_file"])
+    if not os.path.exists(data_path) or os.path.getsize(data_path) != index.get("data_size"):
+        return True
+    stored = index["templates"]
+    
+    template_index.refresh()
+    current = {entry["filename"]: entry for entry in template_index.entries()}
+    if set(current) != set(stored):
+        return True
+    for template_filename, entry in current.items():
+        built = stored[template_filename]
+        if built["mtime_ns"] != entry["mtime_ns"] or built["size"] != entry["size"]:
+            return True
+    return False
+
+_store = None
+_store_lock = threading.Lock()
+
+def load_template_store(store_dir=TEMPLATE_STORE_DIR, build_if_stale=False):
+    """
+    Open the feature store for use by process_template_image
+    
+    Args:
+        store_dir: Directory holding the store
+        build_if_stale: Rebuild the store first if it is missing or out of date;
+            meant for single-process tools, servers build it as a deploy step
+    
+    Returns:
+        TemplateFeatureStore or None if no store is available
+    """
+    global _store
+    with _store_lock:
+        if build_if_stale and is_store_stale(store_dir):
+            with _build_lock(store_dir):
+                # Another process may have finished the build while this one waited
+                if is_store_stale(store_dir):
+                    _build_template_store(store_dir)
+        _store = _open_store(store_dir)
+        return _store
+
+def _open_store(store_dir, attempts=3):
+    if not os.path.exists(os.path.join(store_dir, STORE_INDEX_FILE)):
+        return None
+    for attempt in range(attempts):
+        try:
+            return TemplateFeatureStore(store_dir)
+        except FileNotFoundError:
+            # A concurrent build replaced the index and removed the data file it named; read the new index
+            if attempt == attempts - 1:
+                raise
+        except ValueError as e:
+            print(f"Ignoring template feature store: {e}")
+            return None
+
+def get_template_store():
+    """Return the loaded feature store, or None if load_template_store has not opened one"""
+    return _store
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'build'
+    if command == 'build':
+        build_template_store()
+    elif command == 'info':
+        if is_store_stale():
+            print("Template feature store is missing or stale")
+        store = load_template_store()
+        if store is not None:
+            print(f"{len(store)} templates in {TEMPLATE_STORE_DIR}")
+    else:
+        print(f"Unknown command: {command}. Use 'build' or 'info'.")
+        sys.exit(1)
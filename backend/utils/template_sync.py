@@ -0,0 +1,114 @@
+"""
+Incremental template synchronization
+
+Copies templates from the Next.js public/templates folder into
+backend/templates. A manifest of size, mtime and SHA-1 per file is kept next to
+the copied templates, so unchanged files are skipped with a single stat call
+and only new or modified templates are copied.
+
+Run once per deployment (from the backend directory):
+    python -m utils.template_sync [--source DIR] [--dest DIR]
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import argparse
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_ROOT = os.path.dirname(BACKEND_DIR)
+
+# Default source and destination of the synchronization
+PUBLIC_TEMPLATES_DIR = os.path.join(PROJECT_ROOT, 'public', 'templates')
+BACKEND_TEMPLATES_DIR = os.path.join(BACKEND_DIR, 'templates')
+
+MANIFEST_FILE = '.sync_manifest.json'
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+
+def _file_sha1(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def load_manifest(dest_dir=BACKEND_TEMPLATES_DIR):
+    """Return the sync manifest of dest_dir, or an empty one if it does not exist"""
+    try:
+        with open(os.path.join(dest_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_manifest(dest_dir, manifest):
+    # Write through a uniquely named temporary file, so a concurrent sync never reads a
+    # truncated manifest and two syncs never write into the same file
+    fd, tmp_path = tempfile.mkstemp(prefix=f'{MANIFEST_FILE}.', suffix='.tmp', dir=dest_dir)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, os.path.join(dest_dir, MANIFEST_FILE))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def sync_templates(source_dir=PUBLIC_TEMPLATES_DIR, dest_dir=BACKEND_TEMPLATES_DIR):
+    """
+    Copy new or changed templates from source_dir into dest_dir
+    
+    A file is skipped without hashing when its size and mtime match the
+    manifest and the destination copy exists. Otherwise it is hashed, and only
+    copied if its contents differ from the last synchronized version.
+    
+    Args:
+        source_dir: Directory to copy templates from
+        dest_dir: Directory to copy templates into
+    
+    Returns:
+        dict: Counts of "copied" and "unchanged" files, or None if source_dir does not exist
+    """
+    if not os.path.isdir(source_dir):
+        print(f"Warning: Could not find templates directory: {source_dir}")
+        return None
+    os.makedirs(dest_dir, exist_ok=True)
+    
+    manifest = load_manifest(dest_dir)
+    updated = {}
+    copied = unchanged = 0
+    
+    for filename in sorted(os.listdir(source_dir)):
+        if not filename.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        src = os.path.join(source_dir, filename)
+        dst = os.path.join(dest_dir, filename)
+        stat = os.stat(src)
+        entry = manifest.get(filename)
+        dst_exists = os.path.exists(dst)
+        
+        if entry and dst_exists and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            updated[filename] = entry
+            unchanged += 1
+            continue
+        
+        digest = _file_sha1(src)
+        if not (entry and dst_exists and entry["sha1"] == digest and os.path.getsize(dst) == stat.st_size):
+            shutil.copy2(src, dst)
+            copied += 1
+        else:
+            unchanged += 1
+        updated[filename] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": digest}
+    
+    if updated != manifest:
+        _write_manifest(dest_dir, updated)
+    
+    print(f"Template synchronization complete: {copied} copied, {unchanged} unchanged")
+    return {"copied": copied, "unchanged": unchanged}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Synchronize templates from public/templates into the backend")
+    parser.add_argument('--source', default=PUBLIC_TEMPLATES_DIR, help="Directory to copy templates from")
+    parser.add_argument('--dest', default=BACKEND_TEMPLATES_DIR, help="Directory to copy templates into")
+    args = parser.parse_args()
+    if sync_templates(args.source, args.dest) is None:
+        sys.exit(1)
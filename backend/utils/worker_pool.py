@@ -0,0 +1,174 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor, TimeoutError
+
+import cv2
+
+from utils.instrumentation import current_recorder, record_stages, run_recorded
+
+# Number of worker processes for CPU-bound image jobs
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', os.cpu_count() or 1))
+# Jobs that may wait for a free worker before new ones are rejected
+IMAGE_QUEUE_DEPTH = int(os.environ.get('IMAGE_QUEUE_DEPTH', 2 * IMAGE_WORKERS))
+# Seconds a request waits for its job before giving up
+IMAGE_JOB_TIMEOUT = float(os.environ.get('IMAGE_JOB_TIMEOUT', 30))
+# Retry-After hint (seconds) sent with 429 responses
+IMAGE_RETRY_AFTER = int(os.environ.get('IMAGE_RETRY_AFTER', 1))
+
+class PoolBusyError(Exception):
+    """Raised when the image worker pool has no room for another job"""
+
+    def __init__(self, retry_after=IMAGE_RETRY_AFTER):
+        super().__init__("Image worker pool is busy, retry later")
+        self.retry_after = retry_after
+
+class JobTimeoutError(Exception):
+    """Raised when an image job does not finish within its timeout"""
+
+def _init_worker():
+    # Parallelism comes from the pool, so keep OpenCV single-threaded per worker
+    cv2.setNumThreads(1)
+    # Spawned workers do not run the app's startup code; index the templates and open the feature store here.
+    # Only the web process polls the template directories; workers rescan when a lookup misses or is outdated
+    from utils.template_index import template_index
+    from utils.template_store import load_template_store
+    template_index.refresh()
+    template_index.revalidate_on_lookup()
+    load_template_store()
+
+class _JobFuture(Future):
+    """Future of a pool job; the worker's stage timings are recorded before its result is set"""
+
+    def __init__(self, inner, recorder):
+        super().__init__()
+        self._inner = inner
+        self._recorder = recorder
+        inner.add_done_callback(self._relay)
+
+    def cancel(self):
+        self._inner.cancel()
+        return super().cancel()
+
+    def _relay(self, inner):
+        try:
+            if inner.cancelled():
+                super().cancel()
+            elif inner.exception() is not None:
+                self.set_exception(inner.exception())
+            else:
+                result, samples = inner.result()
+                record_stages(samples, self._recorder)
+                self.set_result(result)
+        except InvalidStateError:
+            # Cancelled by a caller that stopped waiting
+            pass
+
+class ImageWorkerPool:
+    """
+    Bounded process pool for CPU-bound OpenCV work
+    
+    At most workers + queue_depth jobs are admitted at once; further submissions
+    fail fast with PoolBusyError so request threads (and the analysis routes
+    sharing the server) are never stuck behind a long image backlog. A slot is
+    released when its job finishes, even if the request that submitted it has
+    already timed out.
+    """
+
+    def __init__(self, workers=IMAGE_WORKERS, queue_depth=IMAGE_QUEUE_DEPTH, job_timeout=IMAGE_JOB_TIMEOUT):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.job_timeout = job_timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Use spawn so workers never inherit OpenCV/Flask thread state from the parent
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                )
+            return self._executor
+
+    def submit(self, fn, *args):
+        """
+        Submit a job without waiting for a free slot
+        
+        Args:
+            fn: Picklable top-level function to run in a worker
+            *args: Picklable arguments
+        
+        Returns:
+            Future: The job's future
+        
+        Raises:
+            PoolBusyError: If the pool and its queue are full
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolBusyError()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            inner = self._get_executor().submit(run_recorded, fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        inner.add_done_callback(self._release)
+        # Stage timings measured in the worker are attributed to the submitting request
+        return _JobFuture(inner, current_recorder())
+
+    def run(self, fn, *args, timeout=None):
+        """
+        Run a job and wait for its result
+        
+        Args:
+            fn: Picklable top-level function to run in a worker
+            *args: Picklable arguments
+            timeout: Seconds to wait (default: the pool's job timeout)
+        
+        Returns:
+            The job's return value
+        
+        Raises:
+            PoolBusyError: If the pool and its queue are full
+            JobTimeoutError: If the job does not finish in time
+        """
+        future = self.submit(fn, *args)
+        try:
+            return future.result(timeout=self.job_timeout if timeout is None else timeout)
+        except TimeoutError:
+            future.cancel()
+            raise JobTimeoutError(f"Image job did not finish within {self.job_timeout if timeout is None else timeout}s")
+
+    def _release(self, _future):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self):
+        """Return the pool's configuration and current load"""
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "job_timeout": self.job_timeout,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+# Shared pool for all image routes
+image_pool = ImageWorkerPool()
@@ -0,0 +1,19 @@
+"""
+Production entry point
+
+Serve the app with a threaded WSGI server, e.g.:
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Image processing runs on the process pool in utils/worker_pool.py, so a few
+threaded web workers are enough to keep the analysis routes responsive while
+exports run.
+"""
+from app import app
+
+if __name__ == '__main__':
+    import os
+    from app import load_template_store, sync_templates
+    sync_templates()
+    load_template_store(build_if_stale=True)
+    port = int(os.environ.get('FLASK_PORT', 5000))
+    app.run(host='0.0.0.0', port=port, threaded=True)
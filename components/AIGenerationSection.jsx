@@ -95,60 +95,90 @@ export default function AIGenerationSection({ chartRef }) {
     return base64Data;
   };
 
+  // Incremented per call so a slower, older response never overwrites a newer one
+  const processRequestRef = React.useRef(0);
+  
+  // Low-resolution preview shown in this panel until the full result arrives; kept out of the
+  // store, since the chart draws edge crops at their natural size
+  const [previewEdges, setPreviewEdges] = React.useState(null);
+
   // Function to process template with all edge techniques - this will be called automatically when template is selected
   const processTemplateWithEdgeTechniques = async (template) => {
     if (!template) return;
+    const requestId = ++processRequestRef.current;
     
     try {
       setIsLoading(true);
       
-      // Process the template image with all edge techniques
-      const response = await fetch('http://localhost:5000/api/process-template', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({ 
+      // Ask for a cheap low-resolution preview first, then the full 512px result
+      for (const resolution of [128, 512]) {
+        // Process the template image with all edge techniques; a GET request so the
+        // browser can reuse the (deterministic) response for repeat selections
+        const query = new URLSearchParams({
           template_filename: template.filename,
-          processing_params: processingParams
-        }),
-      });
-      
-      if (!response.ok) {
-        console.error('Error processing template image:', response.status);
-        return;
-      }
-      
-      const data = await response.json();
-      
-      // Update edge image data
-      if (data.edge_image) {
-        setEdgeImageData(data.edge_image);
-      }
-      
-      // Update top and bottom edge images
-      if (data.top_edge_image) {
-        useAiStore.getState().setTopEdgeImage(data.top_edge_image);
-      }
-      
-      if (data.bottom_edge_image) {
-        useAiStore.getState().setBottomEdgeImage(data.bottom_edge_image);
-      }
-      
-      // Update all processed edge images at once, along with their top and bottom variants
-      if (data.processed_edges) {
-        // First process the main processed edge images
-        setAllProcessedEdgeImages(data.processed_edges);
+          processing_params: JSON.stringify(processingParams),
+          resolution: String(resolution),
+          // Only request the edge variants the UI renders (skips original/grayscale encoding)
+          outputs: ['default', ...edgeTechniques]
+            .flatMap(technique => [technique, `${technique}_top`, `${technique}_bottom`])
+            .join(',')
+        });
+        const response = await fetch(`http://localhost:5000/api/process-template?${query}`);
+        
+        if (!response.ok) {
+          console.error('Error processing template image:', response.status);
+          return;
+        }
+        
+        const data = await response.json();
+        
+        // A newer template or parameter change has started; drop this result
+        if (requestId !== processRequestRef.current) return;
+        
+        if (resolution !== 512) {
+          setPreviewEdges({ edgeImage: data.edge_image, processedEdges: data.processed_edges || {} });
+          continue;
+        }
+        setPreviewEdges(null);
+        
+        // Update edge image data
+        if (data.edge_image) {
+          setEdgeImageData(data.edge_image);
+        }
+        
+        // Update top and bottom edge images
+        if (data.top_edge_image) {
+          useAiStore.getState().setTopEdgeImage(data.top_edge_image);
+        }
+        
+        if (data.bottom_edge_image) {
+          useAiStore.getState().setBottomEdgeImage(data.bottom_edge_image);
+        }
+        
+        // Update all processed edge images at once, along with their top and bottom variants
+        if (data.processed_edges) {
+          // First process the main processed edge images
+          setAllProcessedEdgeImages(data.processed_edges);
+        }
       }
     } catch (error) {
       console.error('Error processing template image:', error);
     } finally {
-      setIsLoading(false);
+      if (requestId === processRequestRef.current) {
+        setPreviewEdges(null);
+        setIsLoading(false);
+      }
     }
   };
 
+  // Images shown in the panel: the preview while it is the latest result, then the store's
+  const shownEdgeImage = previewEdges ? previewEdges.edgeImage : edgeImageData;
+  const shownProcessedEdges = previewEdges ? previewEdges.processedEdges : processedEdgeImages;
+
   // Handle selecting an edge image for bar chart pattern
   const handleSelectEdgeImage = (imageData) => {
+    // Preview images are never applied to the chart
+    if (previewEdges) return;
     // Toggle selection - if already selected, deselect it
     if (selectedEdgeImageData === imageData) {
       setSelectedEdgeImageData(null);
@@ -195,19 +225,19 @@ export default function AIGenerationSection({ chartRef }) {
                 />
               </div>
               
-              {edgeImageData && (
+              {shownEdgeImage && (
                 <div className="image-container">
                   <h4>Canny Edge Detection</h4>
                   <img 
-                    src={`data:image/png;base64,${edgeImageData}`}
+                    src={`data:image/png;base64,${shownEdgeImage}`}
                     alt="Canny edge detection" 
                     style={{ 
                       maxWidth: '100%', 
                       maxHeight: '300px',
-                      cursor: 'pointer',
-                      border: selectedEdgeImageData === edgeImageData ? '3px solid #4CAF50' : 'none'
+                      cursor: previewEdges ? 'progress' : 'pointer',
+                      border: selectedEdgeImageData === shownEdgeImage ? '3px solid #4CAF50' : 'none'
                     }}
-                    onClick={() => handleSelectEdgeImage(edgeImageData)}
+                    onClick={() => handleSelectEdgeImage(shownEdgeImage)}
                     title="Click to use this image in bar chart"
                   />
                 </div>
@@ -225,19 +255,19 @@ export default function AIGenerationSection({ chartRef }) {
               {/* Display processed images */}
               <div className="processed-images" style={{ marginTop: '20px', display: 'flex', flexDirection: 'row', flexWrap: 'wrap', gap: '15px', justifyContent: 'center' }}>
                 {edgeTechniques.map(technique => 
-                  processedEdgeImages[technique] && (
+                  shownProcessedEdges[technique] && (
                     <div className="image-container" key={technique} style={{ flex: 1, maxWidth: '30%' }}>
                       <h4>{technique.charAt(0).toUpperCase() + technique.slice(1)}</h4>
                       <img 
-                        src={`data:image/png;base64,${processedEdgeImages[technique]}`}
+                        src={`data:image/png;base64,${shownProcessedEdges[technique]}`}
                         alt={`${technique} processing`} 
                         style={{ 
                           maxWidth: '100%', 
                           maxHeight: '300px',
-                          cursor: 'pointer',
-                          border: selectedEdgeImageData === processedEdgeImages[technique] ? '3px solid #4CAF50' : 'none'
+                          cursor: previewEdges ? 'progress' : 'pointer',
+                          border: selectedEdgeImageData === shownProcessedEdges[technique] ? '3px solid #4CAF50' : 'none'
                         }}
-                        onClick={() => handleSelectEdgeImage(processedEdgeImages[technique])}
+                        onClick={() => handleSelectEdgeImage(shownProcessedEdges[technique])}
                         title="Click to use this image in bar chart"
                       />
                     </div>
@@ -74,8 +74,15 @@ export default function ExportSection({ chartRef }) {
     const edgeVersions = ['blur'];
     // const dataPointCounts = [3, 4, 5, 6];
     const dataPointCounts = [7];
-    // const assets = ['apartment'];
-    const assets = ['softcone', 'bottle', 'thin_man', 'palm_tree', 'stack_of_coins', 'pill_container', 'castle_tower', 'balloon', 'cactus'];
+    // Export every template the backend knows about
+    let assets;
+    try {
+      const templatesResponse = await fetch('http://localhost:5000/api/templates');
+      assets = (await templatesResponse.json()).map(template => template.name);
+    } catch (error) {
+      console.error('Error fetching template list:', error);
+      return;
+    }
     // const timestamp = Date.now().toString().slice(-8);
     // const topEdgeWidthScales = [0.4, 0.6, 0.8];
     const topEdgeWidthScales = [0.8];
@@ -94,14 +101,165 @@ export default function ExportSection({ chartRef }) {
     // Helper function to wait between exports to prevent browser freezing
     const wait = (ms) => new Promise(resolve => setTimeout(resolve, ms));
     
-    // Store the original selected edge image to restore it later
-    const originalSelectedEdgeImage = useAiStore.getState().selectedEdgeImageData;
+    // The backend renders canny charts as PNG only; SVG exports keep compositing them in the browser
+    const renderInBrowser = exportFileType === 'svg';
     
-    // Store original topEdgeImageWidthScale to restore later
-    const originalTopEdgeWidthScale = useChartStore.getState().topEdgeImageWidthScale;
+    // Download a base64 PNG returned by the backend
+    const downloadBase64Png = (base64Data, fileName) => {
+      const link = document.createElement('a');
+      link.href = `data:image/png;base64,${base64Data}`;
+      link.download = `${fileName}.png`;
+      document.body.appendChild(link);
+      link.click();
+      document.body.removeChild(link);
+    };
     
-    // Store original bottom edge image
+    // Store the original selected edge image, topEdgeImageWidthScale and bottom edge image to restore them later
+    const originalSelectedEdgeImage = useAiStore.getState().selectedEdgeImageData;
+    const originalTopEdgeWidthScale = useChartStore.getState().topEdgeImageWidthScale;
     const originalBottomEdgeImage = useAiStore.getState().bottom_edge_image;
+    
+    // For browser rendering, process every asset in one batch request; the backend streams NDJSON lines as each finishes
+    const processedByAsset = {};
+    if (renderInBrowser) {
+      try {
+        const response = await fetch('http://localhost:5000/api/process-templates/batch', {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          body: JSON.stringify({
+            templates: assets.map(asset => `${asset}.png`),
+            processing_params: processingParams,
+            // Only compute the edge variants used by the exported edge versions
+            outputs: edgeVersions
+              .map(edgeVersion => edgeVersion === 'sparse' ? 'sparsification' : edgeVersion)
+              .flatMap(key => [key, `${key}_top`, `${key}_bottom`])
+          }),
+        });
+        
+        if (!response.ok) {
+          console.error('Error processing asset images:', response.status);
+          return;
+        }
+        
+        const lines = (await response.text()).split('\n').filter(line => line.trim());
+        for (const line of lines) {
+          const record = JSON.parse(line);
+          const asset = record.template_filename.replace(/\.png$/, '');
+          if (record.error) {
+            console.error(`Error processing asset image ${asset}:`, record.error);
+          } else {
+            processedByAsset[asset] = record.result;
+          }
+        }
+      } catch (error) {
+        console.error('Error processing asset images:', error);
+        return;
+      }
+    }
+    
+    // Render every topEdgeWidthScale of an asset and edge version on the backend and download the PNGs
+    const exportCannyOnServer = async (dataType, dataPointCount, chart, asset) => {
+      for (const edgeVersion of edgeVersions) {
+        try {
+          const response = await fetch('http://localhost:5000/api/render-chart', {
+            method: 'POST',
+            headers: {
+              'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+              template_filename: `${asset}.png`,
+              technique: edgeVersion,
+              processing_params: processingParams,
+              chart,
+              scales: topEdgeWidthScales,
+            }),
+          });
+          
+          if (!response.ok) {
+            console.error(`Error rendering ${edgeVersion} charts for asset ${asset}:`, response.status);
+            continue;
+          }
+          
+          const { images } = await response.json();
+          images.forEach((image, i) => {
+            const fileName = `${dataType}-${dataPointCount}-${edgeVersion}-${asset}-scale${topEdgeWidthScales[i]}`;
+            downloadBase64Png(image, `${fileName}-canny`);
+            batchCounter++;
+          });
+          
+          // Log progress
+          console.log(`Exported ${batchCounter}/${totalExports} variations...`);
+          // Give the browser a chance to breathe between downloads
+          await wait(100);
+        } catch (error) {
+          console.error(`Error rendering ${edgeVersion} charts for asset ${asset}:`, error);
+        }
+      }
+    };
+    
+    // Apply the asset's edge images to the chart for every scale and edge version and export it from the browser
+    const exportCannyInBrowser = async (dataType, dataPointCount, asset) => {
+      const data = processedByAsset[asset];
+      
+      // Check if we got the processed edge images from the backend
+      if (!data || !data.processed_edges) {
+        console.error(`No processed edges returned for asset ${asset}`);
+        return;
+      }
+      
+      // Save the processed edge images to the store so they can be used by the chart
+      useAiStore.getState().setAllProcessedEdgeImages(data.processed_edges);
+      
+      for (const topEdgeWidthScale of topEdgeWidthScales) {
+        // Set the topEdgeWidthScale in the chart store and allow time for chart updates
+        useChartStore.getState().setTopEdgeImageWidthScale(topEdgeWidthScale);
+        await wait(150);
+        
+        for (const edgeVersion of edgeVersions) {
+          const fileName = `${dataType}-${dataPointCount}-${edgeVersion}-${asset}-scale${topEdgeWidthScale}`;
+          const edgeImageKey = edgeVersion === 'sparse' ? 'sparsification' : edgeVersion;
+          const edgeImageData = data.processed_edges[edgeImageKey];
+          const topEdgeImageData = data.processed_edges[`${edgeImageKey}_top`];
+          const bottomEdgeImageData = data.processed_edges[`${edgeImageKey}_bottom`];
+          
+          if (edgeImageData && topEdgeImageData) {
+            // Apply these specific edge images to the state
+            useAiStore.getState().setSelectedEdgeImageData(edgeImageData);
+            useAiStore.getState().setTopEdgeImage(topEdgeImageData);
+            if (bottomEdgeImageData) {
+              useAiStore.getState().setBottomEdgeImage(bottomEdgeImageData);
+            }
+            
+            // Wait for the UI to update with the new edge image
+            await wait(300);
+            
+            try {
+              await downloadChart(
+                chartRef.current,
+                fileName,
+                exportFileType,
+                true,   // asOutlines (default)
+                false,  // forceFill
+                'cannyEdge' // chartVersion - only canny edge version
+              );
+            } catch (error) {
+              console.error(`Error exporting ${edgeVersion} canny edge chart for ${fileName}:`, error);
+            }
+          } else {
+            console.error(`Edge image data for ${edgeVersion} not found for asset ${asset}`);
+          }
+          
+          batchCounter++;
+          if (batchCounter % 10 === 0) {
+            console.log(`Exported ${batchCounter}/${totalExports} variations...`);
+            // Give the browser a chance to breathe
+            await wait(300);
+          }
+        }
+      }
+    };
 
     // Loop through all combinations
     for (const dataType of dataTypes) {
@@ -128,125 +286,38 @@ export default function ExportSection({ chartRef }) {
           console.error(`Error exporting filled chart for ${fileName_filled}:`, error);
         });
         
+        // Chart spec of the current data, rendered with edge images by the backend
+        const { barPadding, width, height, yDomainMin, yDomainMax } = useChartStore.getState();
+        const chartData = useDataStore.getState().chartData.data;
+        const chart = {
+          values: chartData.map(d => d.y),
+          labels: chartData.map(d => String(d.x)),
+          padding: barPadding,
+          domain: [
+            yDomainMin !== undefined ? Number(yDomainMin) : null,
+            yDomainMax !== undefined ? Number(yDomainMax) : null,
+          ],
+          width,
+          height,
+        };
+        
         for (const asset of assets) {
           console.log(`Processing asset: ${asset}`);
-          
-          // Process the asset image with the backend (only once per asset)
-          try {
-            // We're only doing basic edge processing without the topEdgeWidthScale
-            const response = await fetch('http://localhost:5000/api/process-template', {
-              method: 'POST',
-              headers: {
-                'Content-Type': 'application/json',
-              },
-              body: JSON.stringify({ 
-                template_filename: `${asset}.png`,
-                processing_params: processingParams
-              }),
-            });
-            
-            if (!response.ok) {
-              console.error(`Error processing asset image ${asset}:`, response.status);
-              continue; // Skip to next asset if this one fails
-            }
-            
-            const data = await response.json();
-            
-            // Check if we got the processed edge images from the backend
-            if (!data.processed_edges) {
-              console.error(`No processed edges returned for asset ${asset}`);
-              continue;
-            }
-            
-            // Save the processed edge images to the store so they can be used by the chart
-            useAiStore.getState().setAllProcessedEdgeImages(data.processed_edges);
-            
-            // For each topEdgeWidthScale value
-            for (const topEdgeWidthScale of topEdgeWidthScales) {
-              // Set the topEdgeWidthScale in the chart store
-              useChartStore.getState().setTopEdgeImageWidthScale(topEdgeWidthScale);
-              
-              // Allow time for chart updates
-              await wait(150);
-              
-              // For each edge version (default, sparsification/sparse, blur)
-              for (const edgeVersion of edgeVersions) {
-                // Generate a unique filename for this combination
-                const fileName = `${dataType}-${dataPointCount}-${edgeVersion}-${asset}-scale${topEdgeWidthScale}`;
-                
-                // Get the edge image data for this version
-                const edgeImageKey = edgeVersion === 'sparse' ? 'sparsification' : edgeVersion;
-                
-                // For the edge image, look for the full image
-                const edgeImageData = data.processed_edges[edgeImageKey];
-                
-                // For the top edge, specifically look for the 'top' version
-                const topEdgeImageKey = `${edgeImageKey}_top`;
-                const topEdgeImageData = data.processed_edges[topEdgeImageKey];
-                
-                // For the bottom edge, specifically look for the 'bottom' version
-                const bottomEdgeImageKey = `${edgeImageKey}_bottom`;
-                const bottomEdgeImageData = data.processed_edges[bottomEdgeImageKey];
-                
-                if (edgeImageData && topEdgeImageData) {
-                  // Apply these specific edge images to the state
-                  useAiStore.getState().setSelectedEdgeImageData(edgeImageData);
-                  useAiStore.getState().setTopEdgeImage(topEdgeImageData);
-                  
-                  // Set bottom edge image if available
-                  if (bottomEdgeImageData) {
-                    useAiStore.getState().setBottomEdgeImage(bottomEdgeImageData);
-                  }
-                  
-                  // Wait for the UI to update with the new edge image
-                  await wait(300);
-                  
-                  // Export the chart with this edge image
-                  try {
-                    await downloadChart(
-                      chartRef.current,
-                      fileName,
-                      exportFileType,
-                      true,   // asOutlines (default)
-                      false,  // forceFill
-                      'cannyEdge' // chartVersion - only canny edge version
-                    );
-                    console.log(`Successfully exported ${edgeVersion} edge version for ${fileName}`);
-                  } catch (error) {
-                    console.error(`Error exporting ${edgeVersion} canny edge chart for ${fileName}:`, error);
-                  }
-                } else {
-                  console.error(`Edge image data for ${edgeVersion} not found for asset ${asset}`);
-                  console.log('Available processed edges:', Object.keys(data.processed_edges));
-                }
-                
-                // Increment the batch counter
-                batchCounter++;
-                
-                // Log progress
-                if (batchCounter % 10 === 0) {
-                  console.log(`Exported ${batchCounter}/${totalExports} variations...`);
-                  // Give the browser a chance to breathe
-                  await wait(300);
-                }
-              }
-            }
-          } catch (error) {
-            console.error(`Error processing asset ${asset}:`, error);
+          if (renderInBrowser) {
+            await exportCannyInBrowser(dataType, dataPointCount, asset);
+          } else {
+            await exportCannyOnServer(dataType, dataPointCount, chart, asset);
           }
         }
       }
     }
     
-    // Restore the original selected edge image
-    useAiStore.getState().setSelectedEdgeImageData(originalSelectedEdgeImage);
-    
-    // Restore the original topEdgeImageWidthScale value
-    useChartStore.getState().setTopEdgeImageWidthScale(originalTopEdgeWidthScale);
-    
-    // Restore the original bottom edge image
-    useAiStore.getState().setBottomEdgeImage(originalBottomEdgeImage);
-
+    if (renderInBrowser) {
+      // Restore the original edge images and topEdgeImageWidthScale
+      useAiStore.getState().setSelectedEdgeImageData(originalSelectedEdgeImage);
+      useChartStore.getState().setTopEdgeImageWidthScale(originalTopEdgeWidthScale);
+      useAiStore.getState().setBottomEdgeImage(originalBottomEdgeImage);
+    }
     console.log(`Export complete! Generated ${batchCounter} variations.`);
   }
 